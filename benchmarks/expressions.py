@@ -0,0 +1,68 @@
+"""
+Benchmark of evaluating an expression for many assignments of its variables
+
+The expression (x / 3) * (y ** 2) + (-x - 2 * 5) is evaluated for random integer assignments of x and y by the tree interpreter,
+which assigns literals to the mutable subexpressions and walks the tree for every assignment, by the function that compile_expression()
+generates from the tree, and by eval_batch(), which evaluates every assignment at once. All three must give the same values.
+
+Usage: python3 benchmarks/expressions.py [number_of_assignments]
+"""
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "frtt"))
+
+from utilities.types.generic import Variable
+from utilities.types.expressions import Expression, MutableExpr, IntLiteralConstant, Add, Subtract, Multiply, Divide, Power, Negate
+
+
+def get_expression() -> tuple[Expression, Variable, Variable]:
+    """
+    Build the expression (x / 3) * (y ** 2) + (-x - 2 * 5) and its two variables
+    """
+    x, y = Variable(), Variable()
+    x.name, y.name = "x", "y"
+    mx, my = MutableExpr(None), MutableExpr(None)
+    expression = Expression(Add(Multiply(Divide(mx, IntLiteralConstant("3")), Power(my, IntLiteralConstant("2"))),
+                                Subtract(Negate(mx), Multiply(IntLiteralConstant("2"), IntLiteralConstant("5")))))
+    expression.mutexprs = {x : mx, y : my}
+    return expression, x, y
+
+
+if __name__ == "__main__":
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+    expression, x, y = get_expression()
+    rng = random.Random(0)
+    values = [(rng.randint(-100, 100), rng.randint(-100, 100)) for _ in range(n)]
+    literals = [(IntLiteralConstant(str(a)), IntLiteralConstant(str(b))) for a, b in values]
+
+    # Interpret the tree for each assignment
+    start = time.perf_counter()
+    interpreted = []
+    for a, b in literals:
+        expression.assign(x, a)
+        expression.assign(y, b)
+        interpreted.append(expression.eval())
+    interpreter_time = time.perf_counter() - start
+
+    # Compile the tree once, then call the function for each assignment
+    start = time.perf_counter()
+    f = expression.compile([x, y])
+    compile_time = time.perf_counter() - start
+    start = time.perf_counter()
+    compiled = [f(a, b) for a, b in values]
+    compiled_time = time.perf_counter() - start
+
+    # Evaluate every assignment at once
+    start = time.perf_counter()
+    batch = expression.eval_batch({x : [a for a, _ in values], y : [b for _, b in values]})
+    batch_time = time.perf_counter() - start
+
+    assert interpreted == compiled, "Compiled function differs from the interpreter"
+    assert list(batch) == compiled, "Batch evaluation differs from the interpreter"
+    print(f.source, end="")
+    print("Interpreter: %.2f us per assignment" % (interpreter_time / n * 1e6))
+    print("Compiled: %.2f us per assignment, %.0f us to compile, %.1fx faster" % (compiled_time / n * 1e6, compile_time * 1e6, interpreter_time / compiled_time))
+    print("Batch: %.2f us per assignment, %.1fx faster" % (batch_time / n * 1e6, interpreter_time / batch_time))
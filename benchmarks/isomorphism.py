@@ -0,0 +1,102 @@
+"""
+Check of matching the program units and variables of two implementations of a program, such as the pair of examples/triangles
+
+The program units, declarations, and references of each implementation are read from its free-form source files without a compiler,
+resolved, and matched by the isomorphism phase. Each program unit of the first implementation must be matched to the program unit
+of the same name, which for examples/triangles includes compute_area, whose implementations declare different local variables.
+
+Usage: python3 benchmarks/isomorphism.py [implementation1_dirpath implementation2_dirpath]
+"""
+import os
+import re
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "frtt"))
+
+from utilities.types.generic import Program, ProgramUnit, Variable
+from code_generation.fortran_source import read_source, get_specification, split_declaration, get_entity_name, DECLARATION_STMT
+from static_analysis.resolution import resolution
+from static_analysis.isomorphism import isomorphism
+
+# Statements that reference modules and procedures
+USE_STMT = re.compile(r"^use\s+(\w+)")
+CALL_STMT = re.compile(r"(?:^|\W)call\s+(\w+)")
+
+# Implementations of the example that are matched by default
+EXAMPLE_DIRPATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "examples", "triangles")
+
+
+def get_program(dirpath : str) -> Program:
+    """
+    Build the object representation of the program in the Fortran source files of a directory, with resolved references
+    """
+    program = Program()
+    for filename in sorted(os.listdir(dirpath)):
+        if not filename.endswith(".f90"): continue
+        source = read_source(os.path.join(dirpath, filename))
+        for span in source.spans.values():
+            __add_programunit(program, source, span, None)
+    resolution(program)
+    return program
+
+
+def __add_programunit(program : Program, source, span, parent):
+    punit = ProgramUnit()
+    punit.filepath = source.filepath
+    punit.name = span.name
+    punit.type = span.kind
+    punit.parent = parent
+    program.declared_programunits.append(punit)
+    if isinstance(parent, ProgramUnit):
+        parent.declared_procedures.append(punit)
+        parent.declared_procedures_map[punit.name] = punit
+    elif punit.type == "module":
+        program.declared_modules_map[punit.name] = punit
+    else:
+        program.declared_procedures_map[punit.name] = punit
+
+    # Declare the entities of each type declaration statement
+    specification = get_specification(source, span)
+    for statement in specification:
+        declaration = split_declaration(statement)
+        if declaration is None or not DECLARATION_STMT.match(declaration[0]): continue
+        for entity in declaration[1]:
+            var = Variable()
+            var.name = get_entity_name(entity)
+            var.type = DECLARATION_STMT.match(declaration[0]).group(1)
+            var.dimensions = [3] if "dimension" in declaration[0] else []
+            punit.declared_variables.append(var)
+            punit.declared_variables_map[var.name] = var
+
+    # Reference the names of the statements of the program unit, without those of its subprograms
+    last = span.contains if span.contains is not None else span.end
+    for statement in source.statements[span.start + 1:last]:
+        match = USE_STMT.match(statement.code)
+        if match:
+            punit.referenced_module_names.add(match.group(1))
+            continue
+        punit.referenced_procedure_names.update(CALL_STMT.findall(statement.code))
+        if statement not in specification:
+            punit.referenced_names.update(statement.names())
+
+    for child in span.children.values():
+        __add_programunit(program, source, child, punit)
+
+
+if __name__ == "__main__":
+    dirpath1, dirpath2 = sys.argv[1:3] if len(sys.argv) > 2 else (os.path.join(EXAMPLE_DIRPATH, "implem1"), os.path.join(EXAMPLE_DIRPATH, "implem2"))
+    program1 = get_program(dirpath1)
+    program2 = get_program(dirpath2)
+
+    start = time.perf_counter()
+    result = isomorphism(program1, program2)
+    elapsed = time.perf_counter() - start
+
+    n_variables = sum(len(punit.declared_variables) for punit in program1.declared_programunits)
+    print("Matched %d of %d program units and %d of %d variables in %.4f s" % (
+        len(result.programunit_map.domain), len(program1.declared_programunits), len(result.variable_map.domain), n_variables, elapsed))
+    for punit in program1.declared_programunits:
+        match = result.programunit_map.get(punit)
+        print("    %s -> %s" % (punit.name, match.name if match is not None else None))
+        assert match is not None and match.name == punit.name, "Program unit %s is not matched to its implementation" % punit.name
@@ -0,0 +1,130 @@
+"""
+Benchmark of resolving the procedure and variable references of a synthetic program with a wide module graph
+
+Each module uses several random modules, and each procedure uses several random modules and references names declared across the graph.
+The references are resolved with the memoized symbol tables of the resolution phase, and with a search of the local scope hierarchy
+for every reference, as resolution did before the symbol tables, and both must resolve every reference to the same declaration.
+
+Usage: python3 benchmarks/resolution.py [number_of_modules number_of_procedures]
+"""
+import os
+import random
+import sys
+import time
+from queue import Queue
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "frtt"))
+
+from utilities.types.generic import Program, ProgramUnit, Variable
+from static_analysis.resolution.procedure_resolution import resolve_procedures
+from static_analysis.resolution.variable_resolution import resolve_variables
+
+# Shape of the synthetic program
+VARIABLES_PER_MODULE = 40
+PROCEDURES_PER_MODULE = 3
+USES = 4
+REFERENCES = 60
+
+
+def get_program(n_modules : int, n_procedures : int, seed : int = 1) -> Program:
+    """
+    Get a synthetic program with a wide module graph, where every fifth procedure has an internal function
+    """
+    rng = random.Random(seed)
+    program = Program()
+    modules = []
+    for i in range(n_modules):
+        module = ProgramUnit()
+        module.name, module.type = "m{}".format(i), "module"
+        for _ in range(VARIABLES_PER_MODULE):
+            variable = Variable()
+            variable.name = "x{}".format(rng.randrange(VARIABLES_PER_MODULE * n_modules // 3))
+            module.declared_variables_map.setdefault(variable.name, variable)
+        for _ in range(PROCEDURES_PER_MODULE):
+            procedure = ProgramUnit()
+            procedure.name, procedure.type, procedure.parent = "p{}".format(rng.randrange(2000)), "subroutine", module
+            module.declared_procedures_map.setdefault(procedure.name, procedure)
+        modules.append(module)
+        program.declared_programunits.append(module)
+        program.declared_modules_map[module.name] = module
+    for i, module in enumerate(modules):
+        module.referenced_modules = [modules[k] for k in rng.sample(range(n_modules), USES) if k != i]
+    for i in range(n_procedures):
+        procedure = ProgramUnit()
+        procedure.name, procedure.type = "u{}".format(i), "subroutine"
+        procedure.referenced_modules = [rng.choice(modules) for _ in range(USES)]
+        procedure.referenced_names = set("x{}".format(rng.randrange(VARIABLES_PER_MODULE * n_modules // 2)) for _ in range(REFERENCES))
+        procedure.referenced_procedure_names = set("p{}".format(rng.randrange(2500)) for _ in range(REFERENCES // 4))
+        for _ in range(5):
+            variable = Variable()
+            variable.name = "x{}".format(rng.randrange(VARIABLES_PER_MODULE * n_modules // 2))
+            procedure.declared_variables_map[variable.name] = variable
+        program.declared_programunits.append(procedure)
+        program.declared_procedures_map[procedure.name] = procedure
+        if i % 5 == 0:
+            function = ProgramUnit()
+            function.name, function.type, function.parent = "c{}".format(i), "function", procedure
+            procedure.declared_procedures_map[function.name] = function
+            function.referenced_modules = [rng.choice(modules)]
+            function.referenced_names = set("x{}".format(rng.randrange(VARIABLES_PER_MODULE * n_modules // 2)) for _ in range(REFERENCES))
+            function.referenced_procedure_names = {"p{}".format(rng.randrange(2500)), function.name}
+            program.declared_programunits.append(function)
+    return program
+
+
+def search_local(curr : ProgramUnit, name : str, map_name : str, visited : set[ProgramUnit] = None):
+    """
+    Search the local scope hierarchy for a declaration, breadth first through the used modules of each scope, as resolution did for every reference
+    """
+    if curr is None: return None
+    if visited is None: visited = set()
+    queue = Queue()
+    queue.put(curr)
+    while not queue.empty():
+        scope = queue.get()
+        if scope in visited: continue
+        visited.add(scope)
+        if name in getattr(scope, map_name):
+            return getattr(scope, map_name)[name]
+        for module in scope.referenced_modules:
+            queue.put(module)
+    return search_local(curr.parent, name, map_name, visited)
+
+
+def resolve_by_search(program : Program):
+    """
+    Resolve every reference by its own search of the local scope hierarchy, then the global scope
+    """
+    for punit in program.declared_programunits:
+        for name in punit.referenced_procedure_names:
+            declaration = search_local(punit, name, "declared_procedures_map") or program.declared_procedures_map.get(name)
+            if declaration is not None:
+                punit.referenced_procedures.append(declaration)
+        for name in punit.referenced_names:
+            declaration = search_local(punit, name, "declared_variables_map") or program.declared_procedures_map.get(name)
+            if declaration is not None:
+                punit.referenced_variables.append(declaration)
+
+
+def get_references(program : Program) -> list:
+    return [([id(x) for x in punit.referenced_procedures], [id(x) for x in punit.referenced_variables]) for punit in program.declared_programunits]
+
+
+if __name__ == "__main__":
+    n_modules, n_procedures = (int(sys.argv[1]), int(sys.argv[2])) if len(sys.argv) == 3 else (30, 200)
+    program = get_program(n_modules, n_procedures)
+
+    start = time.perf_counter()
+    resolve_by_search(program)
+    search_seconds = time.perf_counter() - start
+    expected = get_references(program)
+
+    for punit in program.declared_programunits:
+        punit.referenced_procedures, punit.referenced_variables = [], []
+    start = time.perf_counter()
+    resolve_procedures(program)
+    resolve_variables(program)
+    table_seconds = time.perf_counter() - start
+
+    print("{} modules, {} program units: search per reference {:.2f} s, symbol tables {:.2f} s, same references {}".format(
+        n_modules, len(program.declared_programunits), search_seconds, table_seconds, get_references(program) == expected))
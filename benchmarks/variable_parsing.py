@@ -0,0 +1,63 @@
+"""
+Benchmark of parsing the declarations of a synthetic module with many variables
+
+The module is written as a Flang parse tree dump, so the benchmark does not need Flang. Every third declaration is a real array with a second
+entity whose extent is named by the next declaration, which is an integer with an initialization, and the declarations of each such pair
+are in a common block, so the declarations of variables share type, attribute, and common block subtrees.
+
+Usage: python3 benchmarks/variable_parsing.py [number_of_declarations ...]
+"""
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "frtt"))
+
+from static_analysis.parsing.abstract_syntax_tree import get_abstract_syntax_tree
+from static_analysis.parsing.tree_parsing import parse_program
+
+
+def get_module_dump(n : int) -> str:
+    """
+    Get the Flang parse tree dump of a module with about n declared variables
+    """
+    lines = ["Program -> ProgramUnit -> Module", "| ModuleStmt -> Name = 'big'", "| SpecificationPart",
+             "| | ImplicitPart -> ImplicitPartStmt -> ImplicitStmt -> "]
+    for i in range(0, n, 3):
+        lines += [
+            "| | DeclarationConstruct -> SpecificationConstruct -> TypeDeclarationStmt",
+            "| | | DeclarationTypeSpec -> IntrinsicTypeSpec -> Real",
+            "| | | AttrSpec -> ArraySpec -> ExplicitShapeSpec",
+            "| | | | SpecificationExpr -> Scalar -> Integer -> Expr -> Designator -> DataRef -> Name = 'v{}'".format(i + 1),
+            "| | | EntityDecl",
+            "| | | | Name = 'v{}'".format(i),
+            "| | | EntityDecl",
+            "| | | | Name = 'w{}'".format(i),
+            "| | DeclarationConstruct -> SpecificationConstruct -> TypeDeclarationStmt",
+            "| | | DeclarationTypeSpec -> IntrinsicTypeSpec -> IntegerTypeSpec -> KindSelector -> Scalar -> Integer -> Constant -> Expr -> LiteralConstant -> IntLiteralConstant = '8'",
+            "| | | EntityDecl",
+            "| | | | Name = 'v{}'".format(i + 1),
+            "| | | | Initialization -> Constant -> Expr -> LiteralConstant -> IntLiteralConstant = '1'",
+            "| | DeclarationConstruct -> SpecificationConstruct -> OtherSpecificationStmt -> CommonStmt",
+            "| | | Block",
+            "| | | | Name = 'blk{}'".format(i + 2),
+            "| | | | CommonBlockObject -> Name = 'v{}'".format(i + 1),
+            "| | | | CommonBlockObject -> Name = 'v{}'".format(i),
+        ]
+    lines += ["| | DeclarationConstruct -> SpecificationConstruct -> OtherSpecificationStmt -> SaveStmt", "| EndModuleStmt -> "]
+    return "\n".join(lines) + "\n"
+
+
+if __name__ == "__main__":
+    sizes = [int(arg) for arg in sys.argv[1:]] or [300, 1000, 5000]
+    with tempfile.TemporaryDirectory() as dirpath:
+        for n in sizes:
+            filepath = os.path.join(dirpath, "big{}.txt".format(n))
+            with open(filepath, 'w') as f:
+                f.write(get_module_dump(n))
+            tree = get_abstract_syntax_tree(filepath, is_source=False)
+            start = time.perf_counter()
+            module, = parse_program(tree)
+            seconds = time.perf_counter() - start
+            print("{} declarations: {} variables parsed in {:.3f} s".format(n, len(module.declared_variables), seconds))
@@ -1,21 +1,23 @@
 import sys
 from initial import initial
 from static_analysis import static_analysis
+from static_analysis.parsing import LITERAL_LABELS
 
 if __name__ == "__main__":
 
     # Get the .yaml file to parse from the command line arguments
-    if len(sys.argv) == 3:
+    if len(sys.argv) == 3 or len(sys.argv) == 4:
         rootpath1 = sys.argv[1]
         rootpath2 = sys.argv[2]
+        state_dirpath = sys.argv[3] if len(sys.argv) == 4 else None
     else:
-        raise Exception("Usage: python3 frtt.py source_directory_path_1 source_directory_path_2")
+        raise Exception("Usage: python3 frtt.py source_directory_path_1 source_directory_path_2 [state_directory_path]")
 
     # Run the initialization phase
     filepaths1, filepaths2 = initial(rootpath1, rootpath2)
     
     # Run the static analysis phase
-    program1, program2, isomorphism = static_analysis(filepaths1, filepaths2)
+    program1, program2, isomorphism = static_analysis(filepaths1, filepaths2, state_dirpath=state_dirpath, discard=LITERAL_LABELS)
     
     # Run the dynamic analysis phase
     # TODO
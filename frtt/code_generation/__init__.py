@@ -0,0 +1,56 @@
+import os
+from utilities.types.generic import Program
+from utilities.types.isomorphism import Isomorphism
+from dynamic_analysis.breakpoints import get_qualified_name
+from code_generation.subimplementation import Subimplementation, SubimplementationExtractor, extract_subimplementations
+from code_generation.build import ObjectCache, build_subimplementations
+from code_generation.interface import Interface, Declaration
+from code_generation.runner import Implementation, TestRunner, iter_states
+from code_generation.driver import BatchRunner, get_driver_source, write_batch, read_batch, run_driver
+from code_generation.work_queue import WorkQueue
+from code_generation.scheduler import WorkItem, Timings, get_work_items, run_tests, run_worker
+
+
+def code_generation(program1 : Program, program2 : Program, mapping : Isomorphism, output_dirpath : str,
+                    build : bool = False, cache_dirpath : str = None, workers : int = None, drivers : bool = False) -> list[tuple[Subimplementation, Subimplementation]]:
+    """
+    Write the minimal complete subimplementations of each pair of similar procedures of two programs.
+    The subimplementations of each program are extracted in one sweep, so the work shared by procedures with common dependencies is done once.
+
+    Args:
+        program1 (Program): Object representation of the first program, with resolved references
+        program2 (Program): Object representation of the second program, with resolved references
+        mapping (Isomorphism): Mappings from the program units and variables of program1 to those of program2
+        output_dirpath (str): Directory to write the subimplementations of each program to, in program1 and program2,
+            with one directory per procedure named by the procedure qualified by its parents
+        build (bool): Whether to also build the shared library of each subimplementation in its directory, with its core compiled once and linked in
+        cache_dirpath (str): Directory of the persistent object cache of the build, or None to not keep compilations between builds
+        workers (int): Number of compilations that run at once, or None for one per CPU
+        drivers (bool): Whether to also build the driver of each subimplementation, which runs batches of input states per invocation
+
+    Returns:
+        pairs (list[tuple[Subimplementation, Subimplementation]]): Subimplementations of each pair of similar procedures,
+            with the path to their library if they were built
+    """
+
+    # Only functions and subroutines are compared
+    punits1 = [punit for punit in mapping.programunit_map if punit.type in ("function", "subroutine")]
+    punits2 = [mapping.programunit_map[punit] for punit in punits1]
+
+    # Extract the subimplementations of each program
+    pairs = list(zip(extract_subimplementations(program1, punits1), extract_subimplementations(program2, punits2)))
+
+    # Write the source files of each subimplementation
+    subimpls, dirpaths = [], []
+    for subimpl1, subimpl2 in pairs:
+        for subimpl, name in ((subimpl1, "program1"), (subimpl2, "program2")):
+            dirpath = os.path.join(output_dirpath, name, get_qualified_name(subimpl.programunit).replace("::", "."))
+            subimpl.write(dirpath)
+            subimpls.append(subimpl)
+            dirpaths.append(dirpath)
+
+    # Build every subimplementation in one job pool, so that the cores are compiled once across pairs
+    if build:
+        build_subimplementations(subimpls, dirpaths, cache_dirpath, workers, drivers=drivers)
+
+    return pairs
@@ -0,0 +1,288 @@
+import hashlib
+import os
+import shutil
+import subprocess
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+from code_generation.subimplementation import Subimplementation, CORE_FILENAME, UNIT_FILENAME
+from code_generation.driver import get_driver_source, DRIVER_FILENAME, DRIVER_EXECUTABLE
+
+# Command and flags used to compile the core and unit of each subimplementation
+FORTRAN_COMPILER = "gfortran"
+FORTRAN_FLAGS = "-O2 -g -fPIC"
+
+# Names of the files that the core and unit of a subimplementation are compiled into
+CORE_OBJECT = "core.o"
+UNIT_OBJECT = "unit.o"
+UNIT_LIBRARY = "unit.so"
+DRIVER_OBJECT = "driver.o"
+
+# Name of the file of a cache entry that holds the output of a driver that failed to build, whose library did build
+DRIVER_LOG = "driver.log"
+
+# Default upper bound on the total size of an object cache directory in bytes
+DEFAULT_CACHE_SIZE = 2 ** 32
+
+# Version string of each compiler command
+__compiler_versions = dict()
+
+
+class ObjectCache:
+    """
+    Persistent on-disk cache of compiled objects, module files, and libraries.
+    Each entry is a directory keyed by the sources it was compiled from, the compiler version, the flags, and the entries it was built with.
+    Entries are built in temporary directories and renamed into place, so concurrent builds never see a partial entry.
+    Least recently used entries are evicted once the total size of the cache exceeds its limit.
+    """
+
+    def __init__(self, dirpath : str, max_size : int = DEFAULT_CACHE_SIZE):
+        """
+        :dirpath: Directory that holds the cache entries (created if it does not exist)
+        :max_size: Upper bound on the total size of the cache entries in bytes
+        """
+        self.dirpath = dirpath
+        self.max_size = max_size
+        os.makedirs(dirpath, exist_ok=True)
+
+    def key(self, *parts : str) -> str:
+        """
+        Get the key of the cache entry built from parts, such as a source, the compiler version, flags, and the keys of other entries
+        :return: Hex digest of the parts
+        """
+        digest = hashlib.sha256()
+        for part in parts:
+            digest.update(part.encode())
+            digest.update(b"\0")
+        return digest.hexdigest()
+
+    def path(self, key : str) -> str:
+        """
+        Get the path of the directory that holds the cache entry for a key
+        """
+        return os.path.join(self.dirpath, key)
+
+    def get(self, key : str) -> str:
+        """
+        Get the directory of the cache entry for a key, and mark it as the most recently used entry
+        :return: Path to the directory, or None if there is no entry for the key
+        """
+        path = self.path(key)
+        try:
+            os.utime(path)
+        except FileNotFoundError:
+            return None
+        return path
+
+    def create(self) -> str:
+        """
+        Create a temporary directory in the cache directory to build an entry in, which is added with add()
+        """
+        return tempfile.mkdtemp(dir=self.dirpath, suffix=".tmp")
+
+    def add(self, key : str, tmp_dirpath : str) -> str:
+        """
+        Move a completely built temporary directory into the cache as the entry for a key
+        If another build added the entry first, the temporary directory is removed and the existing entry is kept
+        :return: Path to the directory of the entry
+        """
+        path = self.path(key)
+        try:
+            os.rename(tmp_dirpath, path)
+        except OSError:
+            if not os.path.isdir(path):
+                raise
+            shutil.rmtree(tmp_dirpath, ignore_errors=True)
+        return path
+
+    def evict(self):
+        """
+        Remove the least recently used entries until the total size of the cache is within its limit
+        """
+
+        # Sort entries from least to most recently used
+        entries = []
+        for entry in os.scandir(self.dirpath):
+            if not entry.is_dir() or entry.name.endswith(".tmp"): continue
+            try:
+                size = sum(f.stat().st_size for f in os.scandir(entry.path))
+                entries.append((entry.stat().st_mtime, size, entry.path))
+            except FileNotFoundError:
+                continue
+        entries.sort()
+
+        # Remove entries until the cache is within its limit
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in entries:
+            if total <= self.max_size: break
+            shutil.rmtree(path, ignore_errors=True)
+            total -= size
+
+
+def build_subimplementations(subimpls : list[Subimplementation], dirpaths : list[str], cache_dirpath : str = None, workers : int = None,
+                             compiler : str = FORTRAN_COMPILER, flags : str = FORTRAN_FLAGS, drivers : bool = False) -> list[str]:
+    """
+    Build a shared library of the unit of each subimplementation, with its core statically linked in.
+    Each distinct core is compiled once into an object and module files, and each unit is compiled against the module files of its core,
+    so subimplementations with the same core, such as those of a pair of similar procedures, share its compilation.
+    Cores, then units, are compiled in a pool of worker threads, and every compilation is cached by the hash of its sources.
+    :subimpls: Subimplementations to build
+    :dirpaths: Directory to write the library of each subimplementation to, in the same order
+    :cache_dirpath: Directory of the persistent object cache, or None to only share compilations within this build
+    :workers: Number of compilations that run at once, or None for one per CPU
+    :compiler: Command of the Fortran compiler, which must accept -c, -J, -I, -shared, and -o like gfortran
+    :flags: Flags passed to the compiler, which must produce position independent code
+    :drivers: Whether to also build the driver of each subimplementation, an executable that runs batches of input states,
+        which is linked with the objects of its unit and core
+    :return: Path to the library of each subimplementation, or None if it failed to compile, in which case the compiler output is in build.log
+    """
+    tmp_cache_dirpath = tempfile.mkdtemp() if cache_dirpath is None else None
+    cache = ObjectCache(cache_dirpath if cache_dirpath is not None else tmp_cache_dirpath)
+    version = get_compiler_version(compiler)
+    try:
+        with ThreadPoolExecutor(max_workers=workers if workers is not None else os.cpu_count()) as executor:
+
+            # Compile each distinct core once
+            core_keys = [cache.key(CORE_FILENAME, subimpl.core, version, flags) for subimpl in subimpls]
+            core_sources = dict(zip(core_keys, (subimpl.core for subimpl in subimpls)))
+            core_futures = {key : executor.submit(__compile_core, cache, key, source, compiler, flags) for key, source in core_sources.items()}
+            cores = {key : future.result() for key, future in core_futures.items()}
+
+            # Compile and link each unit, and its driver, against its core
+            futures = []
+            for subimpl, dirpath, core_key in zip(subimpls, dirpaths, core_keys):
+                core_dirpath, core_log = cores[core_key]
+                if core_dirpath is None:
+                    __write_log(dirpath, core_log)
+                    futures.append(None)
+                    continue
+                driver = None
+                if drivers:
+                    try:
+                        driver = get_driver_source(subimpl)
+                    except Exception as e:
+                        __write_log(dirpath, "No driver: {}\n".format(e))
+                key = cache.key(UNIT_FILENAME, subimpl.unit, DRIVER_FILENAME, driver or "", version, flags, core_key)
+                futures.append(executor.submit(__build_unit, cache, key, subimpl.unit, driver, core_dirpath, dirpath, compiler, flags))
+            results = [future.result() if future is not None else (None, None) for future in futures]
+    finally:
+        if tmp_cache_dirpath is not None:
+            shutil.rmtree(tmp_cache_dirpath, ignore_errors=True)
+    if cache_dirpath is not None:
+        cache.evict()
+
+    for subimpl, (library, driver) in zip(subimpls, results):
+        subimpl.library = library
+        subimpl.driver = driver
+    return [library for library, _ in results]
+
+
+def get_compiler_version(compiler : str = FORTRAN_COMPILER) -> str:
+    """
+    Get the version string of a compiler command, running it only once per process
+    """
+    version = __compiler_versions.get(compiler)
+    if version is None:
+        version = __compiler_versions[compiler] = subprocess.check_output("{} --version".format(compiler), shell=True, text=True)
+    return version
+
+
+def __compile_core(cache : ObjectCache, key : str, source : str, compiler : str, flags : str) -> tuple[str, str]:
+    """
+    Compile a core into an object and module files, unless it is in the cache
+    :return: Directory of the cache entry, or None if the core failed to compile, and the compiler output
+    """
+    path = cache.get(key)
+    if path is not None:
+        return path, ""
+    tmp_dirpath = cache.create()
+    with open(os.path.join(tmp_dirpath, CORE_FILENAME), 'w') as f:
+        f.write(source)
+    ok, log = __run("{} {} -c {} -o {} -J .".format(compiler, flags, CORE_FILENAME, CORE_OBJECT), tmp_dirpath)
+    if not ok:
+        shutil.rmtree(tmp_dirpath, ignore_errors=True)
+        return None, log
+    return cache.add(key, tmp_dirpath), log
+
+
+def __build_unit(cache : ObjectCache, key : str, source : str, driver : str, core_dirpath : str, dirpath : str, compiler : str, flags : str) -> tuple[str, str]:
+    """
+    Compile a unit against the module files of its core and link it with the core object into a shared library, and compile its driver
+    and link it with both objects into an executable, unless they are in the cache, then link them into the directory of the subimplementation
+    :driver: Source of the driver, or None to not build one
+    :return: Path to the library and the driver in dirpath, which are None if the unit failed to compile, or the driver is not built
+        or failed to build, in which case the compiler output is in build.log
+    """
+    path = cache.get(key)
+    if path is None:
+        tmp_dirpath = cache.create()
+        with open(os.path.join(tmp_dirpath, UNIT_FILENAME), 'w') as f:
+            f.write(source)
+        core_object = os.path.join(core_dirpath, CORE_OBJECT)
+        ok, log = __run("{} {} -c {} -o {} -J . -I {}".format(compiler, flags, UNIT_FILENAME, UNIT_OBJECT, core_dirpath), tmp_dirpath)
+        if ok:
+            ok, link_log = __run("{} {} -shared -o {} {} {}".format(compiler, flags, UNIT_LIBRARY, UNIT_OBJECT, core_object), tmp_dirpath)
+            log += link_log
+        if not ok:
+            shutil.rmtree(tmp_dirpath, ignore_errors=True)
+            __write_log(dirpath, log)
+            return None, None
+
+        # Keep the library if only the driver fails to build, with the compiler output in the entry, so it is logged when the entry is reused
+        if driver is not None:
+            with open(os.path.join(tmp_dirpath, DRIVER_FILENAME), 'w') as f:
+                f.write(driver)
+            ok, driver_log = __run("{} {} -c {} -o {} -J . -I {}".format(compiler, flags, DRIVER_FILENAME, DRIVER_OBJECT, core_dirpath), tmp_dirpath)
+            if ok:
+                ok, link_log = __run("{} {} -o {} {} {} {}".format(compiler, flags, DRIVER_EXECUTABLE, DRIVER_OBJECT, UNIT_OBJECT, core_object), tmp_dirpath)
+                driver_log += link_log
+            if not ok:
+                with open(os.path.join(tmp_dirpath, DRIVER_LOG), 'w') as f:
+                    f.write(driver_log)
+        path = cache.add(key, tmp_dirpath)
+    os.makedirs(dirpath, exist_ok=True)
+    library = __link(path, dirpath, UNIT_LIBRARY)
+    if driver is None:
+        return library, None
+    if not os.path.exists(os.path.join(path, DRIVER_EXECUTABLE)):
+        with open(os.path.join(path, DRIVER_LOG)) as f:
+            __write_log(dirpath, f.read())
+        return library, None
+    return library, __link(path, dirpath, DRIVER_EXECUTABLE)
+
+
+def __link(path : str, dirpath : str, filename : str) -> str:
+    """
+    Hard link a file of a cache entry into a directory, so evicting the entry does not remove it, and fall back to a copy across file systems
+    Renaming a link over another link to the same file does nothing, so a file that is already linked is kept
+    :return: Path to the file in dirpath
+    """
+    source, target = os.path.join(path, filename), os.path.join(dirpath, filename)
+    if os.path.exists(target) and os.path.samefile(source, target):
+        return target
+    tmp_target = target + ".tmp"
+    if os.path.lexists(tmp_target):
+        os.remove(tmp_target)
+    try:
+        os.link(source, tmp_target)
+    except OSError:
+        shutil.copy2(source, tmp_target)
+    os.replace(tmp_target, target)
+    return target
+
+
+def __run(command : str, cwd : str) -> tuple[bool, str]:
+    """
+    Run a compiler command in a directory
+    :return: True if it succeeded, and its output
+    """
+    process = subprocess.run(command, shell=True, cwd=cwd, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, text=True)
+    return process.returncode == 0, process.stdout
+
+
+def __write_log(dirpath : str, log : str) -> None:
+    """
+    Write the output of a failed compilation to the build log of a subimplementation
+    """
+    os.makedirs(dirpath, exist_ok=True)
+    with open(os.path.join(dirpath, "build.log"), 'w') as f:
+        f.write(log)
@@ -0,0 +1,484 @@
+import os
+import subprocess
+import tempfile
+import numpy as np
+from utilities.types.generic import ProgramUnit
+from code_generation.subimplementation import Subimplementation
+from code_generation.interface import Declaration
+from code_generation.fortran_source import format_statement
+from comparison.similarity import UnitSimilarity, CHUNK_SIZE
+from dynamic_analysis.state_store import StateStore
+from code_generation.runner import iter_states
+
+# Names of the source file and executable of the driver of a subimplementation
+DRIVER_FILENAME = "driver.f90"
+DRIVER_EXECUTABLE = "driver"
+
+# Default number of input states that a driver runs per invocation
+DEFAULT_BATCH_SIZE = 4096
+
+# Header and flag of each value of a batch file, which are 64-bit integers like the dimensions of arrays
+HEADER_DTYPE = np.dtype("<i8")
+
+
+def get_batch_variables(subimpl : Subimplementation) -> tuple[list[tuple[str, Declaration]], list[tuple[str, Declaration]]]:
+    """
+    Get the variables that the driver of a subimplementation reads from an input batch and writes to an output batch, in order
+    Inputs are the module variables that can be set from outside their module, then the arguments.
+    Outputs are the arguments without intent(in), then the same module variables, then the result of a function.
+    :return: Name and declaration of each input, and of each output
+    """
+    interface = subimpl.interface
+    externals = []
+    for name, (_, declaration) in interface.externals.items():
+        if declaration.attributes & {"private", "protected", "pointer"} or declaration.assumed_shape and "allocatable" not in declaration.attributes:
+            continue
+        if declaration.dtype is None:
+            continue
+        externals.append((name, declaration))
+    arguments = [(argument.name, argument) for argument in interface.arguments]
+    outputs = [(name, argument) for name, argument in arguments if argument.intent != "in" and "value" not in argument.attributes]
+    outputs.extend(externals)
+    if interface.result is not None:
+        outputs.append((interface.result.name, interface.result))
+    return externals + arguments, outputs
+
+
+def get_driver_source(subimpl : Subimplementation) -> str:
+    """
+    Get the source of a program that runs the procedure of a subimplementation on a batch of input states.
+    The program is run with the paths of an input batch and an output batch, which are unformatted stream files:
+    the input batch has the number of states and the inputs of each state, and the output batch has the outputs of each state,
+    where each value is a flag of whether it is present, the extent of each dimension and the length of an assumed-length character, then its data.
+    Arguments are allocatable, so an absent optional argument is passed as not allocated.
+    """
+    interface = subimpl.interface
+    punit = subimpl.programunit
+    if interface is None:
+        raise Exception(subimpl.interface_error or "The internal procedure {} cannot be called by a driver".format(punit.name))
+    host = punit.parent if isinstance(punit.parent, ProgramUnit) else None
+    for argument in interface.arguments:
+        if argument.dtype is None and argument.type != "character":
+            raise Exception("The argument {} of {} cannot be read by a driver".format(argument.name, punit.name))
+        if host is None and argument.assumed_shape:
+            raise Exception("The external procedure {} has assumed-shape arguments, which need an explicit interface".format(punit.name))
+    result = interface.result
+    if result is not None and (result.dtype is None or result.dimensions):
+        raise Exception("The result of {} cannot be written by a driver".format(punit.name))
+    inputs, outputs = get_batch_variables(subimpl)
+    externals = inputs[:len(inputs) - len(interface.arguments)]
+    variables = {argument.name : "driver_arg_{}".format(i + 1) for i, argument in enumerate(interface.arguments)}
+
+    # Use the module variables and the procedure, by module
+    lines = ["program driver"]
+    modules = {name : module for module, names in subimpl.variables.items() for name in names}
+    uses : dict[str, list[str]] = dict()
+    for name, _ in externals:
+        uses.setdefault(modules[name].name, []).append(name)
+    if host is not None:
+        uses.setdefault(host.name, []).append(punit.name)
+    for module, names in uses.items():
+        lines.append("use {}, only: {}".format(module, ", ".join(names)))
+    lines.append("implicit none")
+
+    # Declare the arguments and result, and the procedure if it is an external function
+    for argument in interface.arguments:
+        lines.append("{}, allocatable :: {}{}".format(__get_type_spec(argument), variables[argument.name], __get_deferred_shape(argument)))
+    for k, (name, declaration) in enumerate(externals):
+        lines.append("{}, allocatable :: driver_initial_{}{}".format(__get_type_spec(declaration), k + 1, __get_deferred_shape(declaration)))
+    if result is not None:
+        lines.append("{} :: driver_result".format(__get_type_spec(result)))
+        if host is None:
+            lines.append("{}, external :: {}".format(__get_type_spec(result), punit.name))
+    lines.append("integer(8) :: driver_count, driver_i, driver_present, driver_length, driver_shape(15)")
+    lines.append("logical :: driver_set({})".format(max(len(externals), 1)))
+    lines.append("character(len=4096) :: driver_input_path, driver_output_path")
+    lines.append("integer :: driver_input, driver_output")
+    lines.append("call get_command_argument(1, driver_input_path)")
+    lines.append("call get_command_argument(2, driver_output_path)")
+    lines.append("open(newunit=driver_input, file=trim(driver_input_path), access='stream', form='unformatted', status='old', action='read')")
+    lines.append("open(newunit=driver_output, file=trim(driver_output_path), access='stream', form='unformatted', status='replace', action='write')")
+    lines.append("read(driver_input) driver_count")
+
+    # Save the module variables before the first state, so that each state runs from them instead of the outputs of the state before it
+    for k, (name, declaration) in enumerate(externals):
+        if "allocatable" in declaration.attributes:
+            lines.append("if (allocated({0})) allocate(driver_initial_{1}, source={0})".format(name, k + 1))
+        else:
+            lines.append("allocate(driver_initial_{1}, source={0})".format(name, k + 1))
+    lines.append("do driver_i = 1, driver_count")
+
+    # Read the module variables in place, allocating allocatable arrays by the extents that are read, or restore those that are not read
+    for k, (name, declaration) in enumerate(externals):
+        rank = len(declaration.dimensions)
+        lines.append("read(driver_input) driver_present")
+        lines.append("driver_set({}) = driver_present /= 0".format(k + 1))
+        lines.append("if (driver_set({})) then".format(k + 1))
+        if rank:
+            lines.append("read(driver_input) driver_shape(1:{})".format(rank))
+            if "allocatable" in declaration.attributes:
+                lines.append("if (allocated({0})) deallocate({0})".format(name))
+                lines.append("allocate({}({}))".format(name, __get_extents(rank)))
+        lines.append("read(driver_input) {}".format(name))
+        lines.append("else")
+        if "allocatable" in declaration.attributes:
+            lines.append("if (allocated({0})) deallocate({0})".format(name))
+            lines.append("if (allocated(driver_initial_{1})) allocate({0}, source=driver_initial_{1})".format(name, k + 1))
+        else:
+            lines.append("{} = driver_initial_{}".format(name, k + 1))
+        lines.append("end if")
+
+    # Read the arguments, allocating them by the extents and length that are read
+    for argument in interface.arguments:
+        name, rank = variables[argument.name], len(argument.dimensions)
+        lines.append("read(driver_input) driver_present")
+        lines.append("if (allocated({0})) deallocate({0})".format(name))
+        lines.append("if (driver_present /= 0) then")
+        if rank:
+            lines.append("read(driver_input) driver_shape(1:{})".format(rank))
+        shape = "({})".format(__get_extents(rank)) if rank else ""
+        if argument.type == "character" and argument.length is None:
+            lines.append("read(driver_input) driver_length")
+            lines.append("allocate(character(len=driver_length) :: {}{})".format(name, shape))
+        else:
+            lines.append("allocate({}{})".format(name, shape))
+        lines.append("read(driver_input) {}".format(name))
+        lines.append("end if")
+
+    # Call the procedure
+    call = "{}({})".format(punit.name, ", ".join(variables[argument.name] for argument in interface.arguments))
+    lines.append("driver_result = {}".format(call) if result is not None else "call {}".format(call))
+
+    # Write the outputs
+    for name, declaration in outputs:
+        rank = len(declaration.dimensions)
+        if declaration is result:
+            lines.append("write(driver_output) 1_8, driver_result")
+            continue
+        if name in variables:
+            name = variables[name]
+            lines.append("if (allocated({})) then".format(name))
+        else:
+            lines.append("if (driver_set({})) then".format(externals.index((name, declaration)) + 1))
+        lines.append("write(driver_output) 1_8")
+        if rank:
+            lines.append("write(driver_output) int(shape({}), 8)".format(name))
+        if declaration.type == "character" and declaration.length is None:
+            lines.append("write(driver_output) int(len({}), 8)".format(name))
+        lines.append("write(driver_output) {}".format(name))
+        lines.append("else")
+        lines.append("write(driver_output) 0_8")
+        lines.append("end if")
+
+    lines.append("end do")
+    lines.append("close(driver_input)")
+    lines.append("close(driver_output)")
+    lines.append("end program driver")
+    return "".join(format_statement(line) for line in lines)
+
+
+def write_batch(filepath : str, subimpl : Subimplementation, states : list[dict]):
+    """
+    Write an input batch of the driver of a subimplementation
+    When every state has a value of every input, with the same dimensions and lengths, the values of each input are converted at once
+    and the batch is written as one array of records, and otherwise each value is written by itself
+    :filepath: Path to the input batch
+    :subimpl: Subimplementation whose driver reads the batch
+    :states: Input states, each of which has the value of each argument and module variable by name, as a number, bool, str, or array
+    """
+    inputs, _ = get_batch_variables(subimpl)
+    optional = {argument.name for argument in subimpl.interface.arguments if "optional" in argument.attributes}
+    arguments = {argument.name for argument in subimpl.interface.arguments}
+    for name in arguments - optional:
+        if any(name not in state for state in states):
+            raise Exception("The input state has no value of the argument {} of {}".format(name, subimpl.programunit.name))
+    records = __pack_records(inputs, states)
+    if records is not None:
+        parts = [np.array(len(states), dtype=HEADER_DTYPE).tobytes(), records.tobytes()]
+    else:
+        parts = [np.array(len(states), dtype=HEADER_DTYPE).tobytes()]
+        for state in states:
+            for name, declaration in inputs:
+                value = state.get(name)
+                if value is None:
+                    parts.append(np.array(0, dtype=HEADER_DTYPE).tobytes())
+                    continue
+                value = __encode_value(declaration, value)
+                if value.ndim != len(declaration.dimensions):
+                    raise Exception("Value of {} has {} dimensions instead of {}".format(name, value.ndim, len(declaration.dimensions)))
+                header = [1] + list(value.shape)
+                if declaration.type == "character" and declaration.length is None:
+                    header.append(value.dtype.itemsize)
+                parts.append(np.array(header, dtype=HEADER_DTYPE).tobytes())
+                parts.append(value.tobytes(order="F"))
+    with open(filepath, 'wb') as f:
+        f.write(b"".join(parts))
+
+
+def read_batch(filepath : str, subimpl : Subimplementation, count : int) -> list[dict]:
+    """
+    Read an output batch of the driver of a subimplementation
+    When every state has the same outputs, with the same dimensions and lengths, as the first state, the batch is viewed as one array of records
+    and the values of each output are converted at once, and otherwise each value is read by itself
+    :count: Number of states of the batch
+    :return: Output state of each input state, with the value of each output that is present, which are views of the file contents
+    """
+    _, outputs = get_batch_variables(subimpl)
+    with open(filepath, 'rb') as f:
+        data = f.read()
+    if count == 0:
+        return []
+
+    # Read the first state to get the layout of its record
+    fields, offset = [], 0
+    for name, declaration in outputs:
+        present = int(np.frombuffer(data, dtype=HEADER_DTYPE, count=1, offset=offset)[0])
+        offset += HEADER_DTYPE.itemsize
+        fields.append(("{}:present".format(name), HEADER_DTYPE))
+        if not present: continue
+        rank = len(declaration.dimensions)
+        shape = tuple(int(extent) for extent in np.frombuffer(data, dtype=HEADER_DTYPE, count=rank, offset=offset))
+        offset += HEADER_DTYPE.itemsize * rank
+        if rank:
+            fields.append(("{}:shape".format(name), HEADER_DTYPE, (rank,)))
+        dtype = declaration.dtype
+        if declaration.type == "character" and declaration.length is None:
+            dtype = np.dtype("S{}".format(int(np.frombuffer(data, dtype=HEADER_DTYPE, count=1, offset=offset)[0])))
+            offset += HEADER_DTYPE.itemsize
+            fields.append(("{}:length".format(name), HEADER_DTYPE))
+        fields.append((name, dtype, shape[::-1]))
+        offset += int(np.prod(shape)) * dtype.itemsize
+
+    # View the batch as records if every header matches the header of the first state
+    record = np.dtype(fields)
+    if record.itemsize * count == len(data):
+        records = np.frombuffer(data, dtype=record, count=count)
+        headers = [field[0] for field in fields if ":" in field[0]]
+        if all((records[header] == records[header][0]).all() for header in headers):
+            names = [field[0] for field in fields if ":" not in field[0]]
+            columns = [__decode_column(declaration, records[name]) for name, declaration in outputs if name in names]
+            return [dict(zip(names, values)) for values in zip(*columns)] if columns else [dict() for _ in range(count)]
+
+    # Otherwise read each value by itself
+    states = []
+    offset = 0
+    for _ in range(count):
+        state = dict()
+        for name, declaration in outputs:
+            present = np.frombuffer(data, dtype=HEADER_DTYPE, count=1, offset=offset)[0]
+            offset += HEADER_DTYPE.itemsize
+            if not present: continue
+            shape = tuple(np.frombuffer(data, dtype=HEADER_DTYPE, count=len(declaration.dimensions), offset=offset))
+            offset += HEADER_DTYPE.itemsize * len(shape)
+            dtype = declaration.dtype
+            if declaration.type == "character" and declaration.length is None:
+                length = np.frombuffer(data, dtype=HEADER_DTYPE, count=1, offset=offset)[0]
+                offset += HEADER_DTYPE.itemsize
+                dtype = np.dtype("S{}".format(length))
+            size = int(np.prod(shape))
+            value = np.frombuffer(data, dtype=dtype, count=size, offset=offset)
+            offset += size * dtype.itemsize
+            state[name] = __decode_column(declaration, value.reshape((1,) + shape[::-1]))[0]
+        states.append(state)
+    return states
+
+
+def run_driver(subimpl : Subimplementation, states : list[dict], dirpath : str = None) -> list[dict]:
+    """
+    Run the driver of a built subimplementation on a batch of input states in one invocation
+    :states: Input states
+    :dirpath: Directory to write the input and output batches to, or None for a temporary directory
+    :return: Output state of each input state
+    """
+    with tempfile.TemporaryDirectory(dir=dirpath) as tmp_dirpath:
+        input_filepath, output_filepath = os.path.join(tmp_dirpath, "input.bin"), os.path.join(tmp_dirpath, "output.bin")
+        write_batch(input_filepath, subimpl, states)
+        subprocess.run([subimpl.driver, input_filepath, output_filepath], check=True, stdout=subprocess.DEVNULL)
+        return read_batch(output_filepath, subimpl, len(states))
+
+
+class BatchRunner:
+    """
+    Class that runs the drivers of the subimplementations of a pair of similar procedures on batches of the same input states
+    and compares their output states. Each batch is one invocation of each driver, and both drivers of a batch run at the same time,
+    so the cost of starting a process is paid once per batch instead of once per input state.
+    """
+
+    def __init__(self, subimpl1 : Subimplementation, subimpl2 : Subimplementation, names : dict[str, str] = None,
+                 batch_size : int = DEFAULT_BATCH_SIZE, dirpath : str = None):
+        """
+        :subimpl1: Subimplementation of the procedure of the first program, built with its driver
+        :subimpl2: Subimplementation of the similar procedure of the second program, built with its driver
+        :names: Name of each variable of the second procedure, by the name of the variable of the first procedure it maps to,
+            where variables that are not in names have the same name
+        :batch_size: Number of input states of each invocation of a driver
+        :dirpath: Directory to write the batches to, or None for temporary directories
+        """
+        for subimpl in (subimpl1, subimpl2):
+            if subimpl.driver is None:
+                raise Exception("The driver of {} has not been built".format(subimpl.programunit.name))
+        self.subimpls = (subimpl1, subimpl2)
+        self.names = names if names is not None else dict()
+        self.batch_size = batch_size
+        self.dirpath = dirpath
+        self.processes : list[subprocess.Popen] = []   # Processes of the drivers of the running batch
+        self.killed = False                             # Whether the running drivers were killed by kill()
+
+    def run(self, states : list[dict]) -> list[tuple[dict, dict]]:
+        """
+        Run both procedures on input states named by the variables of the first procedure, in batches
+        :return: Output states of both procedures for each input state
+        """
+        results = []
+        self.killed = False
+        for i in range(0, len(states), self.batch_size):
+            if self.killed:
+                raise Exception("The drivers of {} and {} were killed".format(*(subimpl.programunit.name for subimpl in self.subimpls)))
+            batch = states[i:i + self.batch_size]
+            batch2 = [{self.names.get(name, name) : value for name, value in state.items()} for state in batch]
+            with tempfile.TemporaryDirectory(dir=self.dirpath) as tmp_dirpath:
+                processes, filepaths = self.processes, []
+                processes.clear()
+                for k, (subimpl, inputs) in enumerate(zip(self.subimpls, (batch, batch2))):
+                    input_filepath = os.path.join(tmp_dirpath, "input{}.bin".format(k + 1))
+                    output_filepath = os.path.join(tmp_dirpath, "output{}.bin".format(k + 1))
+                    write_batch(input_filepath, subimpl, inputs)
+                    processes.append(subprocess.Popen([subimpl.driver, input_filepath, output_filepath], stdout=subprocess.DEVNULL))
+                    filepaths.append(output_filepath)
+                for process, subimpl in zip(processes, self.subimpls):
+                    if self.killed:
+                        process.kill()
+                    if process.wait() != 0:
+                        raise Exception("The driver of {} failed with exit code {}".format(subimpl.programunit.name, process.returncode))
+                outputs1, outputs2 = (read_batch(filepath, subimpl, len(batch)) for filepath, subimpl in zip(filepaths, self.subimpls))
+            results.extend(zip(outputs1, outputs2))
+        return results
+
+    def kill(self):
+        """
+        Kill the drivers of the running batch, from another thread, so that run() raises instead of waiting for them
+        """
+        self.killed = True
+        for process in list(self.processes):
+            if process.poll() is None:
+                process.kill()
+
+    def compare(self, states : list[dict], similarity : UnitSimilarity, chunk_size : int = CHUNK_SIZE) -> list[float]:
+        """
+        Run both procedures on input states, and add their output states to a similarity
+        :return: Quantified similarity of the output states of each input state, or None for those that have no values in common
+        """
+        similarities = []
+        for outputs1, outputs2 in self.run(states):
+            values = ((name, value, outputs2[self.names.get(name, name)]) for name, value in outputs1.items() if self.names.get(name, name) in outputs2)
+            similarities.append(similarity.add_state(values, chunk_size))
+        return similarities
+
+    def replay(self, store : StateStore, unit : str, capture_ids : list[int] = None, similarity : UnitSimilarity = None,
+               chunk_size : int = CHUNK_SIZE) -> UnitSimilarity:
+        """
+        Replay the captured input states of a procedure from a store, one batch at a time
+        :store: Store of the captured input states
+        :unit: Key of the procedure in the store
+        :capture_ids: Ids of the captures to replay, or None for every capture
+        :similarity: Similarity to add the output states to, or None for a new one
+        :return: similarity
+        """
+        if similarity is None:
+            similarity = UnitSimilarity()
+        batch = []
+        for state in iter_states(store, unit, capture_ids):
+            batch.append(state)
+            if len(batch) == self.batch_size:
+                self.compare(batch, similarity, chunk_size)
+                batch = []
+        if batch:
+            self.compare(batch, similarity, chunk_size)
+        return similarity
+
+
+def __get_type_spec(declaration : Declaration) -> str:
+    """
+    Get the type specifier of a declaration with an explicit kind, or a deferred length for assumed-length characters
+    """
+    if declaration.type == "character":
+        return "character(len={})".format(declaration.length if declaration.length is not None else ":")
+    return "{}(kind={})".format(declaration.type, declaration.kind)
+
+
+def __get_deferred_shape(declaration : Declaration) -> str:
+    """
+    Get the deferred shape of an allocatable variable of the rank of a declaration, such as "(:,:)"
+    """
+    return "({})".format(",".join(":" * len(declaration.dimensions))) if declaration.dimensions else ""
+
+
+def __get_extents(rank : int) -> str:
+    """
+    Get the extents of an allocation by the extents that are read into driver_shape
+    """
+    return ", ".join("driver_shape({})".format(i + 1) for i in range(rank))
+
+
+def __encode_value(declaration : Declaration, value) -> np.ndarray:
+    """
+    Convert a value, or an array of the values of many states, to the storage of a variable, where characters are padded with blanks
+    """
+    if declaration.type == "character":
+        value = np.char.encode(np.asarray(value, dtype=str))
+        length = declaration.length if declaration.length is not None else max(value.dtype.itemsize, 1)
+        return np.char.ljust(value, length).astype("S{}".format(length))
+    return np.asarray(value).astype(declaration.dtype, copy=False)
+
+
+def __pack_records(inputs : list[tuple[str, Declaration]], states : list[dict]) -> np.ndarray:
+    """
+    Pack the inputs of states into an array of records with the layout of a batch, converting the values of each input at once
+    Arrays are transposed, so that the data of each record is in the order of the Fortran variable
+    :return: Array of one record per state, or None if the states have different inputs, dimensions, or lengths of assumed-length characters
+    """
+    fields, columns = [], []
+    for name, declaration in inputs:
+        values = [state.get(name) for state in states]
+        present = values[0] is not None
+        if any((value is not None) != present for value in values):
+            return None
+        fields.append(("{}:present".format(name), HEADER_DTYPE))
+        columns.append(int(present))
+        if not present: continue
+        if declaration.type == "character" and declaration.length is None and len(set(len(value) for value in values)) > 1:
+            return None
+        try:
+            column = __encode_value(declaration, values)
+        except ValueError:
+            return None
+        rank = len(declaration.dimensions)
+        if column.ndim != rank + 1:
+            return None
+        if rank:
+            fields.append(("{}:shape".format(name), HEADER_DTYPE, (rank,)))
+            columns.append(column.shape[1:])
+        if declaration.type == "character" and declaration.length is None:
+            fields.append(("{}:length".format(name), HEADER_DTYPE))
+            columns.append(column.dtype.itemsize)
+        fields.append((name, column.dtype, column.shape[:0:-1]))
+        columns.append(column.transpose((0,) + tuple(range(rank, 0, -1))))
+
+    records = np.empty(len(states), dtype=np.dtype(fields))
+    for field, column in zip(fields, columns):
+        records[field[0]] = column
+    return records
+
+
+def __decode_column(declaration : Declaration, column : np.ndarray) -> list:
+    """
+    Convert the storage of the values of a variable in many states, with the dimensions of each value reversed, to the value in each state,
+    where logical values are bools and characters are strs
+    """
+    column = column.transpose((0,) + tuple(range(column.ndim - 1, 0, -1)))
+    if declaration.type == "character":
+        column = np.char.decode(column, errors="replace")
+        return column.tolist() if column.ndim == 1 else list(column)
+    if declaration.type == "logical":
+        column = column != 0
+    return list(column)
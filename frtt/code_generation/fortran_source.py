@@ -0,0 +1,409 @@
+import os
+import re
+
+# Extensions of fixed-form source files, whose other source files are free-form
+FIXED_FORM_EXTENSIONS = frozenset((".f", ".for", ".f77", ".ftn"))
+
+# Number of characters of each line of generated free-form source, below the limit of 132
+LINE_WIDTH = 100
+
+# Statements that begin and end program units, matched against the normalized text of a statement
+TYPE_SPEC = r"(?:integer|real|logical|complex|character|double\s*precision|double\s*complex|type|class)(?:\s*\*\s*\(?[\w*]+\)?|\s*\((?:[^()]|\([^()]*\))*\))?"
+PROCEDURE_STMT = re.compile(r"^((?:(?:recursive|pure|elemental|impure|non_recursive|module|" + TYPE_SPEC + r")\s*)*?)(subroutine|function)\s+(\w+)\s*(?:\(([^()]*)\))?(.*)$")
+MODULE_STMT = re.compile(r"^module\s+(\w+)$")
+PROGRAM_STMT = re.compile(r"^program\s+(\w+)$")
+END_STMT = re.compile(r"^end(?:\s*(?:subroutine|function|module|program)\b.*)?$")
+RESULT_CLAUSE = re.compile(r"\bresult\s*\(\s*(\w+)\s*\)")
+
+# Statements that open and close blocks whose statements do not begin or end program units
+INTERFACE_STMT = re.compile(r"^(?:abstract\s+)?interface\b")
+END_INTERFACE_STMT = re.compile(r"^end\s*interface\b")
+TYPE_DEFINITION_STMT = re.compile(r"^type\s*(?:,[^:]*)?(?:::)?\s*\w+$")
+END_TYPE_STMT = re.compile(r"^end\s*type\b")
+
+# Type declaration statements, whose entities follow the type and attributes, and attribute statements, whose entities follow the attribute
+DECLARATION_STMT = re.compile(r"^(" + TYPE_SPEC + r")(?=[\s,:]|$)")
+ATTRIBUTE_STMT = re.compile(r"^(public|private|save|protected|target|allocatable|pointer|dimension|volatile|asynchronous|optional|value|contiguous|"
+                            r"external|intrinsic|intent\s*\([^)]*\))(?=[\s:]|$)\s*(?:::)?\s*")
+
+# First words of the statements of a specification part, including the statements of interface and type definition blocks
+SPECIFICATION_KEYWORDS = frozenset((
+    "use", "import", "implicit", "parameter", "integer", "real", "logical", "complex", "character", "double", "doubleprecision", "doublecomplex",
+    "type", "class", "procedure", "external", "intrinsic", "intent", "optional", "save", "dimension", "allocatable", "pointer", "target", "common",
+    "equivalence", "data", "namelist", "interface", "abstract", "public", "private", "protected", "sequence", "contiguous", "value",
+    "volatile", "asynchronous", "bind", "enum", "enumerator", "include", "format", "entry", "generic", "final", "module", "end",
+))
+
+# Names of Fortran variables and procedures, which do not follow the % of a component or the _ of a kind
+NAME = re.compile(r"(?<![\w%.])[a-z]\w*")
+OPERATOR = re.compile(r"\.[a-z]+\.")
+STRING = re.compile(r"'(?:[^']|'')*'|\"(?:[^\"]|\"\")*\"")
+
+
+class Statement:
+    """
+    Class that represents a statement of a source file and the lines it spans
+    """
+
+    __slots__ = ("start", "end", "text", "code")
+
+    def __init__(self, start : int, end : int, text : str):
+        self.start = start                      # Index of the first line of the statement
+        self.end = end                          # Index after the last line of the statement
+        self.text = text                        # Text of the statement without comments and continuations, lower case outside of strings
+        self.code = STRING.sub("''", text)      # Text of the statement with empty strings, which is matched against
+
+    def names(self) -> set[str]:
+        """
+        Get the names in the statement, which include keywords
+        """
+        return set(NAME.findall(OPERATOR.sub(" ", self.code)))
+
+
+class Span:
+    """
+    Class that represents the statements of a program unit in a source file
+    """
+
+    __slots__ = ("kind", "name", "start", "contains", "end", "children", "arguments", "result", "prefix")
+
+    def __init__(self, kind : str, name : str, start : int):
+        self.kind = kind                        # "module", "program", "subroutine", or "function"
+        self.name = name                        # Name of the program unit
+        self.start = start                      # Index of the statement that begins the program unit
+        self.contains = None                    # Index of the contains statement, or None
+        self.end = None                         # Index of the statement that ends the program unit
+        self.children : dict[str, Span] = dict()    # Span of each subprogram, by name
+        self.arguments : list[str] = []         # Names of the dummy arguments of a procedure
+        self.result : str = None                # Name of the result of a function
+        self.prefix = ""                        # Prefix of the statement that begins a procedure, such as its type
+
+
+class FortranSource:
+    """
+    Class that represents the statements of a Fortran source file, and the span of each program unit in it.
+    Program units are found by their beginning and ending statements, without parsing the statements in between.
+    """
+
+    def __init__(self, filepath : str, lines : list[str], statements : list[Statement], spans : dict[str, Span], fixed_form : bool = False):
+        self.filepath = filepath
+        self.fixed_form = fixed_form            # True if the source file is fixed-form
+        self.lines = lines                      # Lines of the source file
+        self.statements = statements            # Statements of the source file, in order
+        self.spans = spans                      # Span of each program unit at the global scope, by name
+
+    def find(self, names : list[str]) -> Span:
+        """
+        Get the span of a program unit
+        :names: Name of the program unit at the global scope, followed by the names of each subprogram down to the program unit
+        :return: Span of the program unit, or None if it is not in the source file
+        """
+        span = self.spans.get(names[0])
+        for name in names[1:]:
+            if span is None: break
+            span = span.children.get(name)
+        return span
+
+    def text(self, start : int, end : int) -> str:
+        """
+        Get the lines of the statements from start to end, including both, as free-form source
+        Fixed-form statements are written from their text, without their comments
+        """
+        if self.fixed_form:
+            return "".join(format_statement(statement.text) for statement in self.statements[start:end + 1])
+        return "\n".join(self.lines[self.statements[start].start:self.statements[end].end]) + "\n"
+
+
+def read_source(filepath : str) -> FortranSource:
+    """
+    Read a Fortran source file and find the span of each program unit in it
+    :filepath: Path to the source file, which is fixed-form if its extension is in FIXED_FORM_EXTENSIONS
+    """
+    with open(filepath, errors="replace") as f:
+        lines = f.read().splitlines()
+    fixed_form = os.path.splitext(filepath)[1].lower() in FIXED_FORM_EXTENSIONS
+    statements = __split_fixed_form(lines) if fixed_form else __split_free_form(lines)
+    return FortranSource(filepath, lines, statements, __find_spans(statements), fixed_form)
+
+
+def format_statement(text : str, width : int = LINE_WIDTH) -> str:
+    """
+    Format the text of a statement as free-form lines of at most width characters
+    Continued lines end and continuation lines begin with an ampersand, so a line may be split anywhere
+    """
+    lines = [text[i:i + width] for i in range(0, len(text), width)] or [""]
+    return "&\n&".join(lines) + "\n"
+
+
+def get_specification(source : FortranSource, span : Span) -> list[Statement]:
+    """
+    Get the statements of the specification part of a program unit, which come before its first executable statement
+    """
+    statements = []
+    depth = 0
+    last = span.contains if span.contains is not None else span.end
+    for statement in source.statements[span.start + 1:last]:
+        if INTERFACE_STMT.match(statement.code) or TYPE_DEFINITION_STMT.match(statement.code):
+            depth += 1
+        elif END_INTERFACE_STMT.match(statement.code) or END_TYPE_STMT.match(statement.code):
+            depth -= 1
+        elif depth == 0 and not __is_specification(statement):
+            break
+        statements.append(statement)
+    return statements
+
+
+def split_declaration(statement : Statement) -> tuple[str, list[str]]:
+    """
+    Split a type declaration or attribute statement into its type and attributes, and its list of entities
+    :return: Text before the entities, and the text of each entity, or None if the statement does not declare entities
+    """
+    text = statement.text
+    i = __find_outside(text, "::")
+    if i is not None:
+        prefix, rest = text[:i].rstrip(), text[i + 2:]
+    else:
+        match = DECLARATION_STMT.match(statement.code) or ATTRIBUTE_STMT.match(statement.code)
+        if match is None:
+            return None
+        prefix, rest = text[:match.end()].rstrip(), text[match.end():]
+        if rest.startswith(","):
+            return None
+    if not (DECLARATION_STMT.match(prefix) or ATTRIBUTE_STMT.match(prefix)):
+        return None
+    entities = split_list(rest)
+    return (prefix, entities) if entities else None
+
+
+def get_entity_name(entity : str) -> str:
+    """
+    Get the name of an entity of a declaration, such as "x" of "x(10) = 0", or None if it is not a name, such as a common block
+    """
+    match = NAME.match(entity.strip())
+    return match.group() if match else None
+
+
+def split_list(text : str) -> list[str]:
+    """
+    Split text at the commas outside of parentheses and strings
+    """
+    items = []
+    depth = 0
+    quote = None
+    start = 0
+    for i, c in enumerate(text):
+        if quote:
+            if c == quote: quote = None
+        elif c in "'\"":
+            quote = c
+        elif c in "([":
+            depth += 1
+        elif c in ")]":
+            depth -= 1
+        elif c == "," and depth == 0:
+            items.append(text[start:i].strip())
+            start = i + 1
+    items.append(text[start:].strip())
+    return [item for item in items if item]
+
+
+def __find_outside(text : str, target : str) -> int:
+    """
+    Find target outside of parentheses and strings
+    :return: Index of target, or None if it is not found
+    """
+    depth = 0
+    quote = None
+    for i, c in enumerate(text):
+        if quote:
+            if c == quote: quote = None
+        elif c in "'\"":
+            quote = c
+        elif c == "(":
+            depth += 1
+        elif c == ")":
+            depth -= 1
+        elif depth == 0 and text.startswith(target, i):
+            return i
+    return None
+
+
+def __is_specification(statement : Statement) -> bool:
+    """
+    Determine if a statement belongs in a specification part, by its first word
+    Assignments to variables named like keywords are executable
+    """
+    match = NAME.match(statement.code)
+    if match is None:
+        return statement.code.startswith("#")
+    rest = statement.code[match.end():].lstrip()
+    if rest.startswith("=") and not rest.startswith("=="):
+        return False
+    if rest.startswith("(") and re.match(r"^\([^()]*\)\s*=", rest) and match.group() not in ("type", "class", "character", "real", "integer", "logical", "complex"):
+        return False
+    return match.group() in SPECIFICATION_KEYWORDS
+
+
+def __split_free_form(lines : list[str]) -> list[Statement]:
+    """
+    Split the lines of a free-form source file into statements, joining continuation lines and splitting lines at semicolons
+    """
+    statements = []
+    code = ""
+    start = None
+    for i, line in enumerate(lines):
+        if line.lstrip().startswith("#"):
+            statements.append(Statement(i, i + 1, line.strip()))
+            continue
+
+        # A continuation line that begins with an ampersand continues the previous line without a space
+        part = __strip_comment(line).strip()
+        if start is not None and part.startswith("&"):
+            part = part[1:]
+        elif code:
+            part = " " + part
+        if not part.strip():
+            continue
+        if start is None:
+            start = i
+        if part.endswith("&"):
+            code += part[:-1]
+            continue
+        for text in __split_semicolons(code + part):
+            statements.append(Statement(start, i + 1, __normalize(text)))
+        code, start = "", None
+    return statements
+
+
+def __split_fixed_form(lines : list[str]) -> list[Statement]:
+    """
+    Split the lines of a fixed-form source file into statements, where a character in column 6 continues the previous line
+    """
+    statements = []
+    current = None
+    for i, line in enumerate(lines):
+        if not line.strip() or line[:1] in "cC*!":
+            continue
+        if line.lstrip().startswith("#"):
+            statements.append(Statement(i, i + 1, line.strip()))
+            continue
+        code = line[:5].strip() + " " + __strip_comment(line[6:72])
+        if len(line) > 5 and line[5] not in " 0" and current is not None:
+            current[1] = i + 1
+            current[2] += code.strip()
+            continue
+        if current is not None:
+            statements.extend(Statement(current[0], current[1], __normalize(text)) for text in __split_semicolons(current[2]))
+        current = [i, i + 1, code.strip()]
+    if current is not None:
+        statements.extend(Statement(current[0], current[1], __normalize(text)) for text in __split_semicolons(current[2]))
+    return [statement for statement in statements if statement.text]
+
+
+def __strip_comment(line : str) -> str:
+    """
+    Remove the comment that begins with an exclamation mark outside of strings
+    """
+    quote = None
+    for i, c in enumerate(line):
+        if quote:
+            if c == quote: quote = None
+        elif c in "'\"":
+            quote = c
+        elif c == "!":
+            return line[:i]
+    return line
+
+
+def __split_semicolons(code : str) -> list[str]:
+    """
+    Split code at the semicolons outside of strings
+    """
+    if ";" not in code:
+        return [code.strip()]
+    texts = []
+    quote = None
+    start = 0
+    for i, c in enumerate(code):
+        if quote:
+            if c == quote: quote = None
+        elif c in "'\"":
+            quote = c
+        elif c == ";":
+            texts.append(code[start:i].strip())
+            start = i + 1
+    texts.append(code[start:].strip())
+    return [text for text in texts if text]
+
+
+def __normalize(code : str) -> str:
+    """
+    Convert code to lower case outside of strings, since Fortran names are case insensitive
+    """
+    i = 0
+    parts = []
+    for match in STRING.finditer(code):
+        parts.append(code[i:match.start()].lower())
+        parts.append(match.group())
+        i = match.end()
+    parts.append(code[i:].lower())
+    return "".join(parts)
+
+
+def __find_spans(statements : list[Statement]) -> dict[str, Span]:
+    """
+    Find the span of each program unit from the statements that begin and end it
+    Interface bodies and type definitions are skipped, since their statements do not begin program units
+    """
+    spans = dict()
+    stack : list[Span] = []
+    interfaces = 0
+    types = 0
+    for i, statement in enumerate(statements):
+        code = statement.code
+
+        # Skip the statements of interface blocks and type definitions
+        if INTERFACE_STMT.match(code):
+            interfaces += 1
+            continue
+        if END_INTERFACE_STMT.match(code):
+            interfaces -= 1
+            continue
+        if interfaces: continue
+        if TYPE_DEFINITION_STMT.match(code) and not code.startswith("type is"):
+            types += 1
+            continue
+        if END_TYPE_STMT.match(code):
+            types -= 1
+            continue
+        if types: continue
+
+        # End the innermost program unit
+        if END_STMT.match(code):
+            if stack:
+                stack.pop().end = i
+            continue
+        if code == "contains":
+            if stack:
+                stack[-1].contains = i
+            continue
+
+        # Begin a program unit as a subprogram of the innermost program unit
+        span = None
+        match = MODULE_STMT.match(code) or PROGRAM_STMT.match(code)
+        if match and not code.startswith("module procedure"):
+            span = Span(code.split()[0], match.group(1), i)
+        else:
+            match = PROCEDURE_STMT.match(code)
+            if match:
+                span = Span(match.group(2), match.group(3), i)
+                span.prefix = match.group(1).strip()
+                span.arguments = [name.strip() for name in (match.group(4) or "").split(",") if name.strip()]
+                result = RESULT_CLAUSE.search(match.group(5))
+                if span.kind == "function":
+                    span.result = result.group(1) if result else span.name
+        if span is not None:
+            (stack[-1].children if stack else spans)[span.name] = span
+            stack.append(span)
+
+    return spans
@@ -0,0 +1,270 @@
+import re
+import numpy as np
+from utilities.types.generic import ProgramUnit
+from code_generation.fortran_source import Statement, split_declaration, split_list, DECLARATION_STMT
+
+# Kind of the default kind of each intrinsic type, which is its size in bytes, as with gfortran
+DEFAULT_KINDS = {"integer" : 4, "real" : 4, "complex" : 4, "logical" : 4, "character" : 1}
+
+# Kinds of the named constants of the intrinsic modules iso_fortran_env and iso_c_binding
+INTRINSIC_KINDS = {
+    "int8" : 1, "int16" : 2, "int32" : 4, "int64" : 8, "real32" : 4, "real64" : 8, "real128" : 16,
+    "c_signed_char" : 1, "c_short" : 2, "c_int" : 4, "c_long" : 8, "c_long_long" : 8, "c_size_t" : 8, "c_int8_t" : 1, "c_int16_t" : 2,
+    "c_int32_t" : 4, "c_int64_t" : 8, "c_intptr_t" : 8, "c_float" : 4, "c_double" : 8, "c_long_double" : 10, "c_float_complex" : 4,
+    "c_double_complex" : 8, "c_bool" : 1, "c_char" : 1,
+}
+
+# Type specifier of a declaration, with a kind or length selector in parentheses or after an asterisk
+TYPE_SELECTOR = re.compile(r"^(integer|real|logical|complex|character|double\s*precision|double\s*complex|type|class)\s*(?:\*\s*\(?([\w*]+)\)?|\((.*)\))?$")
+
+# Entity of a declaration: a name, its dimensions, its character length, and its initialization
+ENTITY = re.compile(r"^([a-z]\w*)\s*(?:\((.*?)\))?\s*(?:\*\s*(\(\s*\*\s*\)|\(.*?\)|\d+))?\s*(?:=>?.*)?$")
+
+# Literals and intrinsic functions of the constant integer expressions that kinds and lengths are given by
+INTEGER_LITERAL = re.compile(r"^[+-]?\d+(?:_\w+)?$")
+KIND_FUNCTION = re.compile(r"^kind\s*\((.*)\)$")
+SELECTED_KIND_FUNCTION = re.compile(r"^selected_(real|int)_kind\s*\((.*)\)$")
+
+
+class Declaration:
+    """
+    Class that represents the type, kind, dimensions, and attributes of a variable, as declared in a specification part
+    """
+
+    __slots__ = ("name", "type", "kind", "length", "dimensions", "shape", "attributes")
+
+    def __init__(self, name : str):
+        self.name = name
+        self.type : str = None                  # Intrinsic type, such as "real", or the name of a derived type
+        self.kind : int = None                  # Kind of an intrinsic type, which is its size in bytes, or None if it is not constant
+        self.length : int = None                # Length of a character variable, or None if it is assumed or not constant
+        self.dimensions : list[str] = []        # Specification of each dimension, such as "10", "n", ":", or "*", which is empty for scalars
+        self.shape : tuple[int, ...] = ()       # Extent of each dimension, or None if a bound is not constant
+        self.attributes : set[str] = set()      # Attributes without spaces, such as "intent(in)", "optional", or "parameter"
+
+    @property
+    def intent(self) -> str:
+        """
+        Intent of a dummy argument, "in", "out", or "inout", or None if it has no intent
+        """
+        for attribute in self.attributes:
+            if attribute.startswith("intent("):
+                return attribute[7:-1].replace("in out", "inout")
+        return None
+
+    @property
+    def assumed_shape(self) -> bool:
+        """
+        Whether the variable is an assumed-shape or deferred-shape array, which is passed by descriptor instead of by address
+        """
+        return any(":" in dimension for dimension in self.dimensions)
+
+    @property
+    def dtype(self) -> np.dtype:
+        """
+        Numpy dtype of the storage of one element, or None if it has none, such as for derived types
+        Logical values are stored as integers of their kind, and characters as bytes of their length
+        """
+        if self.type == "character":
+            return np.dtype("S{}".format(self.length)) if self.length is not None else None
+        if self.kind is None:
+            return None
+        if self.type in ("integer", "logical") and self.kind in (1, 2, 4, 8):
+            return np.dtype("<i{}".format(self.kind))
+        if self.type == "real" and self.kind in (4, 8):
+            return np.dtype("<f{}".format(self.kind))
+        if self.type == "real" and self.kind == 10:
+            return np.dtype(np.longdouble)
+        if self.type == "complex" and self.kind in (4, 8):
+            return np.dtype("<c{}".format(2 * self.kind))
+        return None
+
+
+class Interface:
+    """
+    Class that represents how a procedure of a subimplementation is called, and the module variables that make up its external state
+    """
+
+    __slots__ = ("symbol", "arguments", "result", "externals")
+
+    def __init__(self, symbol : str):
+        self.symbol = symbol                                            # Symbol of the procedure in the compiled library
+        self.arguments : list[Declaration] = []                         # Declaration of each dummy argument, in order
+        self.result : Declaration = None                                # Declaration of the result of a function, or None for subroutines
+        self.externals : dict[str, tuple[str, Declaration]] = dict()    # Symbol and declaration of each module variable, by name
+
+
+def get_parameters(statements : list[Statement], parameters : dict[str, int]) -> dict[str, int]:
+    """
+    Add the integer named constants declared by a specification part to the named constants in scope, such as the kinds of a module
+    :statements: Statements of the specification part
+    :parameters: Value of each integer named constant already in scope, by name, which is updated
+    :return: parameters
+    """
+    for statement in statements:
+        declaration = split_declaration(statement)
+        if declaration is None: continue
+        prefix, entities = declaration
+        items = [item.replace(" ", "") for item in split_list(prefix)]
+        if "parameter" not in items or not items[0].startswith("integer"): continue
+        for entity in entities:
+            name, _, value = entity.partition("=")
+            value = evaluate_integer(value, parameters)
+            if value is not None:
+                parameters[name.strip()] = value
+    return parameters
+
+
+def get_declarations(statements : list[Statement], parameters : dict[str, int], names : set[str] = None) -> dict[str, Declaration]:
+    """
+    Get the declarations of the variables of a specification part, from its type declaration and attribute statements
+    :statements: Statements of the specification part
+    :parameters: Value of each integer named constant in scope, by name, which kinds and lengths are evaluated with
+    :names: Names of the variables to declare implicitly if they are not declared, such as the dummy arguments of a procedure
+    :return: Declaration of each variable, by name
+    """
+    declarations : dict[str, Declaration] = dict()
+    for statement in statements:
+        declaration = split_declaration(statement)
+        if declaration is None: continue
+        prefix, entities = declaration
+        items = split_list(prefix)
+        typed = DECLARATION_STMT.match(statement.code) is not None and TYPE_SELECTOR.match(items[0]) is not None
+        for entity in entities:
+            match = ENTITY.match(entity)
+            if match is None: continue
+            name, dimensions, length = match.groups()
+            variable = declarations.get(name)
+            if variable is None:
+                variable = declarations[name] = Declaration(name)
+            if typed:
+                __set_type(variable, items[0], parameters)
+            for item in items[1 if typed else 0:]:
+                item = item.replace(" ", "")
+                if item.startswith("dimension("):
+                    variable.dimensions = split_list(item[10:-1])
+                elif item != "dimension":
+                    variable.attributes.add(item)
+            if dimensions is not None:
+                variable.dimensions = split_list(dimensions)
+            if length is not None and variable.type == "character":
+                variable.length = evaluate_integer(length.strip("() "), parameters)
+
+    # Variables without a type declaration are typed implicitly by their first letter
+    for name in names or ():
+        if name not in declarations:
+            declarations[name] = Declaration(name)
+    for variable in declarations.values():
+        if variable.type is None:
+            variable.type = "integer" if "i" <= variable.name[0] <= "n" else "real"
+            variable.kind = DEFAULT_KINDS[variable.type]
+        variable.shape = get_shape(variable.dimensions, parameters)
+    return declarations
+
+
+def get_shape(dimensions : list[str], parameters : dict[str, int]) -> tuple[int, ...]:
+    """
+    Get the extents of dimensions whose bounds are constant, such as "10" or "0:n" where n is a named constant
+    :return: Extent of each dimension, or None if a bound is not constant, such as for assumed-shape or assumed-size arrays
+    """
+    shape = []
+    for dimension in dimensions:
+        lower, _, upper = dimension.partition(":") if ":" in dimension else ("1", "", dimension)
+        lower, upper = evaluate_integer(lower, parameters), evaluate_integer(upper, parameters)
+        if lower is None or upper is None:
+            return None
+        shape.append(max(upper - lower + 1, 0))
+    return tuple(shape)
+
+
+def evaluate_integer(text : str, parameters : dict[str, int]) -> int:
+    """
+    Evaluate a constant integer expression of a kind or length, which is a literal, a named constant,
+    or a call to kind, selected_int_kind, or selected_real_kind with constant arguments
+    :return: Value of the expression, or None if it cannot be evaluated, such as an assumed length
+    """
+    text = text.strip().lower()
+    if text.startswith("kind=") or text.startswith("len="):
+        text = text.partition("=")[2].strip()
+    if INTEGER_LITERAL.match(text):
+        return int(text.partition("_")[0])
+    if text in parameters:
+        return parameters[text]
+    if text in INTRINSIC_KINDS:
+        return INTRINSIC_KINDS[text]
+
+    # The kind of a literal is given by its suffix, or by its exponent letter
+    match = KIND_FUNCTION.match(text)
+    if match is not None:
+        literal = match.group(1).strip()
+        if "_" in literal:
+            return evaluate_integer(literal.rpartition("_")[2], parameters)
+        if re.match(r"^[+-]?(\d+\.?\d*|\.\d+)d[+-]?\d+$", literal):
+            return 8
+        if re.match(r"^[+-]?(\d+\.?\d*|\.\d+)(e[+-]?\d+)?$", literal) or literal in (".true.", ".false."):
+            return 4
+        return None
+
+    # Selected kinds are the smallest kinds of gfortran with the requested precision and range
+    match = SELECTED_KIND_FUNCTION.match(text)
+    if match is not None:
+        values = [evaluate_integer(argument.partition("=")[2] if "=" in argument else argument, parameters) for argument in split_list(match.group(2))]
+        if None in values or not values:
+            return None
+        if match.group(1) == "int":
+            return next((kind for kind, r in ((1, 2), (2, 4), (4, 9), (8, 18), (16, 38)) if values[0] <= r), None)
+        p, r = (values + [0])[:2]
+        return next((kind for kind, precision, exponent in ((4, 6, 37), (8, 15, 307), (10, 18, 4931), (16, 33, 4931))
+                     if p <= precision and r <= exponent), None)
+    return None
+
+
+def get_symbol(punit : ProgramUnit) -> str:
+    """
+    Get the symbol of a procedure in an object compiled by gfortran, which is qualified by its module or has a trailing underscore
+    Internal procedures have no symbol, and are only called by their host
+    :return: Symbol, or None if the procedure is internal
+    """
+    parent = punit.parent
+    if isinstance(parent, ProgramUnit):
+        return get_module_symbol(parent, punit.name) if parent.type == "module" else None
+    return "{}_".format(punit.name.lower())
+
+
+def get_module_symbol(module : ProgramUnit, name : str) -> str:
+    """
+    Get the symbol of a variable or procedure of a module in an object compiled by gfortran
+    """
+    return "__{}_MOD_{}".format(module.name.lower(), name.lower())
+
+
+def __set_type(variable : Declaration, spec : str, parameters : dict[str, int]):
+    """
+    Set the type, kind, and length of a variable from the type specifier of its declaration, such as "real(dp)", "real*8", or "character(len=*)"
+    """
+    match = TYPE_SELECTOR.match(spec.strip())
+    name, star, selector = match.groups()
+    name = re.sub(r"^double\s*", "double ", re.sub(r"\s+", " ", name))
+    if name in ("type", "class"):
+        variable.type = selector.strip() if selector else None
+        return
+    if name in ("double precision", "double complex"):
+        variable.type, variable.kind = name.split()[1].replace("precision", "real"), 8
+        return
+    variable.type = name
+    variable.kind = DEFAULT_KINDS[name]
+    if name == "character":
+        variable.length = 1
+        length = star
+        for item in split_list(selector or ""):
+            if item.replace(" ", "").startswith("kind="):
+                continue
+            length = item
+        if length is not None:
+            variable.length = evaluate_integer(length.strip("() "), parameters)
+        return
+    kind = star or selector
+    if kind is not None:
+        variable.kind = evaluate_integer(kind, parameters)
+        if star is not None and name == "complex" and variable.kind is not None:
+            variable.kind //= 2
@@ -0,0 +1,254 @@
+import ctypes
+import os
+import numpy as np
+from code_generation.subimplementation import Subimplementation
+from code_generation.interface import Declaration
+from comparison.similarity import UnitSimilarity, CHUNK_SIZE
+from dynamic_analysis.state_store import StateStore, EXAMPLE_COLUMN, HIT_COLUMN
+
+try:
+    from _ctypes import dlclose
+except ImportError:
+    dlclose = None
+
+
+class Implementation:
+    """
+    Class that calls the procedure of a built subimplementation in this process, through its shared library.
+    The library is loaded with RTLD_LOCAL, so the same symbols of both implementations of a program do not clash,
+    and its core is linked into it, so it has its own copy of every module variable.
+    An input state is set by writing the module variables in place and passing each argument by address, where arrays that already have
+    the type and layout of an intent(in) argument are passed without copying, and other values are copied into a buffer that is reused.
+    Module variables that an input state does not set are restored to their values when the library was loaded, so calls do not depend
+    on the states run before them, except for allocatable and pointer module variables, which cannot be set from Python.
+    A procedure that stops or crashes ends this process, so procedures that may do so should be run in a worker process.
+    """
+
+    def __init__(self, subimpl : Subimplementation, library : str = None):
+        """
+        :subimpl: Subimplementation of a function or subroutine that is not internal, whose interface was extracted
+        :library: Path to its shared library, or None for the library it was built into
+        """
+        interface = subimpl.interface
+        library = library if library is not None else subimpl.library
+        if interface is None:
+            raise Exception(subimpl.interface_error or "The internal procedure {} cannot be called from a library".format(subimpl.programunit.name))
+        if library is None:
+            raise Exception("The subimplementation of {} has not been built".format(subimpl.programunit.name))
+
+        # Arguments are passed by address, except for assumed-shape arrays, which are passed by descriptors that are not built here
+        for argument in interface.arguments:
+            if argument.assumed_shape or argument.dtype is None and argument.type != "character":
+                raise Exception("The argument {} of {} cannot be passed from Python".format(argument.name, subimpl.programunit.name))
+        if interface.result is not None and (interface.result.dtype is None or interface.result.dimensions or interface.result.dtype.kind not in "iuf"):
+            raise Exception("The result of {} cannot be returned to Python".format(subimpl.programunit.name))
+
+        self.subimpl = subimpl
+        self.interface = interface
+        self.library = ctypes.CDLL(os.path.abspath(library), mode=os.RTLD_LOCAL)
+        self.procedure = getattr(self.library, interface.symbol)
+        self.procedure.restype = np.ctypeslib.as_ctypes_type(interface.result.dtype) if interface.result is not None else None
+        self.buffers : dict[str, np.ndarray] = dict()       # Buffer that each argument is copied into, by name
+        self.views : dict[str, np.ndarray] = dict()         # Array that views the storage of each module variable in the library, by name
+        self.initial : dict[str, np.ndarray] = dict()       # Value of each module variable when the library was loaded, by name
+
+        # View the storage of each module variable by its declared type and shape
+        for name, (symbol, declaration) in interface.externals.items():
+            if declaration.dtype is None or declaration.shape is None or declaration.attributes & {"allocatable", "pointer"}: continue
+            size = int(np.prod(declaration.shape))
+            buffer = (ctypes.c_char * (size * declaration.dtype.itemsize)).from_address(ctypes.addressof(ctypes.c_char.in_dll(self.library, symbol)))
+            view = self.views[name] = np.frombuffer(buffer, dtype=declaration.dtype, count=size).reshape(declaration.shape, order="F")
+            self.initial[name] = view.copy(order="F")
+
+    def run(self, state : dict) -> dict:
+        """
+        Call the procedure on an input state
+        :state: Value of each argument and module variable, by name, as a number, bool, str, or array indexed like the Fortran variable
+        :return: Output state: the value of each argument without intent(in), of each module variable in state, and of the result of a function,
+            which are copies that later calls do not change
+        """
+
+        # Write the module variables into the library, and restore those that the input state does not set
+        for name, (_, declaration) in self.interface.externals.items():
+            if name not in state: continue
+            view = self.views.get(name)
+            if view is None:
+                raise Exception("The module variable {} cannot be set from Python, and needs a driver".format(name))
+            value = state[name]
+            if declaration.type == "character":
+                value = self.__encode(declaration, value)
+            if np.shape(value) != view.shape:
+                raise Exception("The value of the module variable {} has shape {}, but it is declared with shape {}".format(name, np.shape(value), view.shape))
+            view[...] = value
+        for name, view in self.views.items():
+            if name not in state:
+                view[...] = self.initial[name]
+
+        # Pass arguments by address, and the lengths of character arguments after them
+        arguments, lengths = [], []
+        for declaration in self.interface.arguments:
+            value = state.get(declaration.name)
+            if value is None:
+                if "optional" not in declaration.attributes:
+                    raise Exception("The input state has no value of the argument {} of {}".format(declaration.name, self.subimpl.programunit.name))
+                arguments.append(None)
+                continue
+            if declaration.type == "character":
+                data = value.encode() if isinstance(value, str) else bytes(value)
+                length = declaration.length if declaration.length is not None else len(data)
+                arguments.append(ctypes.create_string_buffer(data[:length].ljust(length), length))
+                lengths.append(ctypes.c_size_t(length))
+                continue
+            array = self.__get_argument(declaration, value)
+            if "value" in declaration.attributes:
+                arguments.append(np.ctypeslib.as_ctypes_type(array.dtype)(array.item()))
+            else:
+                arguments.append(ctypes.c_void_p(array.ctypes.data))
+        result = self.procedure(*arguments, *lengths)
+
+        # Read the outputs, copying them out of the buffers and the library
+        outputs = dict()
+        for declaration, argument in zip(self.interface.arguments, arguments):
+            if argument is None or declaration.intent == "in" or "value" in declaration.attributes: continue
+            if declaration.type == "character":
+                outputs[declaration.name] = argument.raw.decode(errors="replace")
+            else:
+                outputs[declaration.name] = self.__from_storage(declaration, self.buffers[declaration.name])
+        for name in state:
+            if name in self.views and name in self.interface.externals:
+                outputs[name] = self.__from_storage(self.interface.externals[name][1], self.views[name])
+        if self.interface.result is not None:
+            outputs[self.interface.result.name] = bool(result) if self.interface.result.type == "logical" else result
+        return outputs
+
+    def close(self):
+        """
+        Unload the library, after which the implementation cannot be run
+        """
+        if dlclose is not None and self.library is not None:
+            self.views.clear()
+            dlclose(self.library._handle)
+        self.library = None
+
+    def __get_argument(self, declaration : Declaration, value) -> np.ndarray:
+        """
+        Get the array whose address is passed for an argument, which is value itself if it is an intent(in) array with the dtype
+        and Fortran layout of the argument, and otherwise is the buffer of the argument with value copied into it
+        """
+        if declaration.intent == "in" and isinstance(value, np.ndarray) and value.dtype == declaration.dtype and value.flags.f_contiguous:
+            return value
+        shape = np.shape(value)
+        buffer = self.buffers.get(declaration.name)
+        if buffer is None or buffer.shape != shape:
+            buffer = self.buffers[declaration.name] = np.empty(shape, dtype=declaration.dtype, order="F")
+        buffer[...] = value
+        return buffer
+
+    def __encode(self, declaration : Declaration, value) -> np.ndarray:
+        """
+        Encode the value of a character variable as bytes of its declared length, padded with blanks
+        """
+        value = np.char.encode(np.asarray(value, dtype=str))
+        if value.dtype.itemsize > declaration.length and (np.char.str_len(np.char.rstrip(value)) > declaration.length).any():
+            raise Exception("The value of the character variable {} is longer than its declared length {}".format(declaration.name, declaration.length))
+        return np.char.ljust(value, declaration.length).astype(declaration.dtype)
+
+    def __from_storage(self, declaration : Declaration, storage : np.ndarray):
+        """
+        Convert the storage of a variable to a copy of its value, where logical values are bools and characters are strs
+        """
+        if declaration.type == "character":
+            value = np.char.decode(storage, errors="replace")
+            return str(value) if value.ndim == 0 else value
+        if declaration.type == "logical":
+            return storage != 0
+        return storage.copy(order="F")
+
+
+class TestRunner:
+    """
+    Class that runs the subimplementations of a pair of similar procedures on the same input states and compares their output states,
+    with both libraries loaded in this process, so replaying an input state is two calls instead of the runs of two executables
+    """
+
+    def __init__(self, subimpl1 : Subimplementation, subimpl2 : Subimplementation, names : dict[str, str] = None):
+        """
+        :subimpl1: Built subimplementation of the procedure of the first program
+        :subimpl2: Built subimplementation of the similar procedure of the second program
+        :names: Name of each variable of the second procedure, by the name of the variable of the first procedure it maps to,
+            where variables that are not in names have the same name
+        """
+        self.implementations = (Implementation(subimpl1), Implementation(subimpl2))
+        self.names = names if names is not None else dict()
+
+    def run(self, state : dict) -> tuple[dict, dict]:
+        """
+        Run both procedures on an input state, named by the variables of the first procedure
+        :return: Output state of each procedure
+        """
+        outputs1 = self.implementations[0].run(state)
+        outputs2 = self.implementations[1].run({self.names.get(name, name) : value for name, value in state.items()})
+        return outputs1, outputs2
+
+    def compare(self, state : dict, similarity : UnitSimilarity, chunk_size : int = CHUNK_SIZE) -> float:
+        """
+        Run both procedures on an input state, and add their output states to a similarity
+        :return: Quantified similarity of the output states, or None if they have no values in common
+        """
+        outputs1, outputs2 = self.run(state)
+        values = ((name, value, outputs2[self.names.get(name, name)]) for name, value in outputs1.items() if self.names.get(name, name) in outputs2)
+        return similarity.add_state(values, chunk_size)
+
+    def replay(self, store : StateStore, unit : str, capture_ids : list[int] = None, similarity : UnitSimilarity = None,
+               chunk_size : int = CHUNK_SIZE) -> UnitSimilarity:
+        """
+        Replay the captured input states of a procedure from a store, reading each value as a view of the store
+        :store: Store of the captured input states
+        :unit: Key of the procedure in the store
+        :capture_ids: Ids of the captures to replay, or None for every capture
+        :similarity: Similarity to add the output states to, or None for a new one
+        :return: similarity
+        """
+        if similarity is None:
+            similarity = UnitSimilarity()
+        for state in iter_states(store, unit, capture_ids):
+            self.compare(state, similarity, chunk_size)
+        return similarity
+
+    def close(self):
+        """
+        Unload the libraries of both procedures
+        """
+        for implementation in self.implementations:
+            implementation.close()
+
+
+def iter_states(store : StateStore, unit : str, capture_ids : list[int] = None):
+    """
+    Iterate over the captured input states of a procedure in a store, leaving out the columns that record where captures came from
+    Columns whose values all have the same dimensions are viewed as one array, whose rows are read without looking up the capture
+    :store: Store of the captured input states
+    :unit: Key of the procedure in the store
+    :capture_ids: Ids of the captures, or None for every capture
+    :return: Generator of each input state, with the value of each variable that was captured as a view of the store
+    """
+    variables = [var for var in store.variables(unit) if var not in (EXAMPLE_COLUMN, HIT_COLUMN)]
+    captures = {var : store.capture_ids(unit, var) for var in variables}
+    if capture_ids is None:
+        capture_ids = np.unique(np.concatenate([ids for ids in captures.values()] or [np.zeros(0, dtype=np.int64)]))
+    columns = dict()
+    for var in variables:
+        if store.columns[unit][var]["kind"] == "array":
+            try:
+                columns[var] = np.asarray(store.values(unit, var))
+            except Exception:
+                pass
+
+    for capture_id in capture_ids:
+        state = dict()
+        for var in variables:
+            ids = captures[var]
+            i = np.searchsorted(ids, capture_id)
+            if i < len(ids) and ids[i] == capture_id:
+                state[var] = columns[var][i] if var in columns else store.get(unit, var, int(capture_id))
+        yield state
@@ -0,0 +1,365 @@
+import json
+import multiprocessing
+import os
+import shutil
+import socket
+import sys
+import tempfile
+import threading
+import time
+import traceback
+import numpy as np
+from code_generation.subimplementation import Subimplementation
+from code_generation.runner import TestRunner
+from code_generation.driver import BatchRunner, DEFAULT_BATCH_SIZE
+from code_generation.work_queue import WorkQueue
+from comparison.similarity import ProgramSimilarity
+from dynamic_analysis.breakpoints import get_qualified_name
+from dynamic_analysis.state_store import StateStore
+
+# Default number of input states of each work item
+DEFAULT_ITEM_SIZE = 1024
+
+# Default seconds after which the claim of a work item whose worker stopped renewing it expires
+DEFAULT_LEASE = 60.0
+
+# Default number of times that a work item is run again after it failed or its worker died
+DEFAULT_RETRIES = 2
+
+# Multiple of the estimated run time of a work item, and least number of seconds, after which the item is abandoned as hung by default
+DEADLINE_FACTOR = 10.0
+MIN_DEADLINE = 60.0
+
+# Seconds between two polls of a work queue that had nothing new
+POLL_INTERVAL = 0.05
+
+# Number of runners that a worker keeps loaded, so consecutive items of the same pair do not load its libraries again
+RUNNER_CACHE_SIZE = 16
+
+
+class WorkItem:
+    """
+    Class that represents a work item of the comparison tests: a batch of the captured input states of a pair of similar procedures
+    """
+
+    __slots__ = ("key", "capture_ids", "cost", "attempts", "deadline")
+
+    def __init__(self, key : str, capture_ids : np.ndarray, cost : float):
+        self.key = key                      # Key of the pair of procedures, which is the key of the first procedure in the store
+        self.capture_ids = capture_ids      # Ids of the captures to replay, in increasing order
+        self.cost = cost                    # Estimated seconds to run the item
+        self.attempts = 0                   # Number of times the item failed or its worker died
+        self.deadline : float = None        # Seconds after which the item is abandoned as hung, or None to never abandon it
+
+
+class Timings:
+    """
+    Class that records the seconds that the test of each pair of procedures took per input state, in a JSON file that persists between runs,
+    to estimate how long work items take. Each new measurement is averaged with the recorded one.
+    """
+
+    def __init__(self, filepath : str = None):
+        """
+        :filepath: Path to the JSON file of the timings, or None to not persist them
+        """
+        self.filepath = filepath
+        self.seconds : dict[str, float] = dict()       # Seconds per input state of each pair of procedures, by key
+        if filepath is not None and os.path.exists(filepath):
+            with open(filepath) as f:
+                self.seconds = json.load(f)
+
+    def estimate(self, key : str, count : int) -> float:
+        """
+        Estimate the seconds that a number of input states of a pair of procedures take to run,
+        where pairs without timings take the average time per input state of the pairs with timings
+        """
+        seconds = self.seconds.get(key)
+        if seconds is None:
+            seconds = sum(self.seconds.values()) / len(self.seconds) if self.seconds else 1.0
+        return seconds * count
+
+    def record(self, key : str, seconds : float, count : int):
+        """
+        Record the seconds that a number of input states of a pair of procedures took to run
+        """
+        if count == 0: return
+        previous = self.seconds.get(key)
+        self.seconds[key] = seconds / count if previous is None else (previous + seconds / count) / 2
+
+    def save(self):
+        """
+        Write the timings to their file, if they have one
+        """
+        if self.filepath is None: return
+        os.makedirs(os.path.dirname(os.path.abspath(self.filepath)), exist_ok=True)
+        fd, tmp_filepath = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(self.filepath)), suffix=".tmp")
+        with os.fdopen(fd, 'w') as f:
+            json.dump(self.seconds, f, indent=1, sort_keys=True)
+        os.replace(tmp_filepath, self.filepath)
+
+
+def get_work_items(store : StateStore, keys : list[str], timings : Timings = None, item_size : int = DEFAULT_ITEM_SIZE) -> list[WorkItem]:
+    """
+    Shard the captured input states of pairs of similar procedures into work items of at most item_size input states
+    Items are sorted from the longest to the shortest estimated run time, so that the longest items start first and do not hold up the end of the run
+    :store: Store of the captured input states of the first program
+    :keys: Key of the first procedure of each pair in the store
+    :timings: Recorded timings that run times are estimated with, or None to estimate them by the number of input states
+    :return: Work items, in the order to run them
+    """
+    timings = timings if timings is not None else Timings()
+    items = []
+    for key in keys:
+        ids = [store.capture_ids(key, var) for var in store.variables(key)]
+        capture_ids = np.unique(np.concatenate(ids)) if ids else np.zeros(0, dtype=np.int64)
+        for i in range(0, len(capture_ids), item_size):
+            batch = capture_ids[i:i + item_size]
+            items.append(WorkItem(key, batch, timings.estimate(key, len(batch))))
+    items.sort(key=lambda item: item.cost, reverse=True)
+    return items
+
+
+def run_tests(pairs : list[tuple[Subimplementation, Subimplementation]], store_dirpath : str, queue_dirpath : str = None, workers : int = None,
+              names : dict[str, dict[str, str]] = None, timings_filepath : str = None, item_size : int = DEFAULT_ITEM_SIZE,
+              batch_size : int = DEFAULT_BATCH_SIZE, retries : int = DEFAULT_RETRIES, lease : float = DEFAULT_LEASE,
+              timeout : float = None, callback = None) -> tuple[ProgramSimilarity, dict[str, str]]:
+    """
+    Run the comparison tests of pairs of similar procedures on their captured input states, and accumulate the similarity of the programs.
+    The input states of each pair are sharded into work items, which are put in a work queue from the longest to the shortest, and are claimed
+    by local worker processes and by workers started on other nodes with run_worker() on the same queue directory.
+    A pair is run by its drivers if both were built, and otherwise by its libraries in the worker process.
+    An item that fails, or whose worker died, which a crash of a procedure in its process does, is split in two and run again,
+    so that the input states that fail are isolated from the others. The result of each item is merged into the similarity as it arrives.
+    An item that runs past its deadline, such as one with an input state that never terminates, fails the same way: its worker kills the drivers
+    that run it, or exits if the item runs in its process, since a call into a library cannot be interrupted.
+    :pairs: Built subimplementations of each pair of similar procedures, such as those returned by code_generation()
+    :store_dirpath: Directory of the store of the captured input states of the first program, which every worker can reach
+    :queue_dirpath: Directory of the work queue, which every worker can reach, or None for a temporary directory, which only local workers reach
+    :workers: Number of local worker processes, 0 to only use workers on other nodes, or None for one per CPU
+    :names: Name of each variable of the second procedure of each pair, by the name of the variable of the first procedure it maps to, by key
+    :timings_filepath: Path to the JSON file of the timings that run times are estimated with and that are updated, or None to not keep them
+    :item_size: Largest number of input states of a work item
+    :batch_size: Number of input states of each invocation of a driver
+    :retries: Number of times that a work item is run again after it failed or its worker died
+    :lease: Seconds after which the claim of a work item by a worker that stopped renewing it expires, and the item is put back
+    :timeout: Seconds after which a work item is abandoned as hung, or None for DEADLINE_FACTOR times its estimated run time, and at least MIN_DEADLINE
+    :callback: Function called with the similarity, the number of input states compared, and the total number of input states,
+        after each result is merged, or None
+    :return: Accumulated similarity of the programs, whose similarity is None if no output states were compared, such as when every
+        work item failed, and the error of each pair that had a work item fail every attempt, by key
+    """
+    similarity, failures = ProgramSimilarity(), dict()
+    names = names if names is not None else dict()
+    timings = Timings(timings_filepath)
+    store = StateStore(store_dirpath)
+
+    # Pairs that can be run by their drivers or libraries are tested
+    tests = dict()
+    for subimpl1, subimpl2 in pairs:
+        key = get_qualified_name(subimpl1.programunit)
+        if key not in store.columns: continue
+        if (subimpl1.driver is None or subimpl2.driver is None) and (subimpl1.library is None or subimpl2.library is None):
+            failures[key] = "The subimplementations of {} have not been built".format(key)
+            continue
+        tests[key] = (subimpl1.detach(), subimpl2.detach(), names.get(key))
+    items = get_work_items(store, list(tests), timings, item_size)
+    total, done = sum(len(item.capture_ids) for item in items), 0
+
+    # Put every item in the queue, ranked by its order
+    tmp_dirpath = tempfile.mkdtemp() if queue_dirpath is None else None
+    queue = WorkQueue(queue_dirpath if queue_dirpath is not None else tmp_dirpath)
+    queue.clear()
+    queue.set_context({"tests" : tests, "store_dirpath" : os.path.abspath(store_dirpath), "batch_size" : batch_size})
+    outstanding : dict[str, tuple[int, WorkItem]] = dict()     # Rank and item of each item without a result, by name
+    for rank, item in enumerate(items):
+        item.deadline = timeout if timeout is not None else max(DEADLINE_FACTOR * item.cost, MIN_DEADLINE)
+        outstanding[str(rank)] = (rank, item)
+        queue.put(str(rank), item, rank)
+
+    # Local workers are named by this process, so they are distinct from the workers of other nodes
+    prefix = "{}-{}-".format(socket.gethostname(), os.getpid())
+    processes : dict[str, multiprocessing.Process] = dict()     # Process of each local worker that is running, by name
+    leases : dict[str, tuple[int, float]] = dict()              # Renewal count of each claimed item, and the local time it was first seen, by path
+    started = 0
+
+    try:
+        while outstanding:
+            progress = False
+
+            # Merge the results, and put back the items that failed
+            for name, (unit, seconds, error) in queue.results():
+                if name not in outstanding: continue
+                progress = True
+                rank, item = outstanding.pop(name)
+                queue.discard(name)
+                if error is not None:
+                    __put_back(queue, outstanding, failures, name, rank, item, error, retries)
+                    continue
+                program = ProgramSimilarity()
+                program.units[item.key] = unit
+                similarity.merge(program)
+                timings.record(item.key, seconds, len(item.capture_ids))
+                done += len(item.capture_ids)
+                if callback is not None:
+                    callback(similarity, done, total)
+
+            # Take back the items of local workers that died, and of other workers whose leases expired
+            # A lease expires once its renewal count has not changed for lease seconds of this process's clock, so clocks of other nodes do not matter
+            running, now = queue.running(), time.monotonic()
+            leases = {path : leases[path] if path in leases and leases[path][0] == count else (count, now) for path, _, count in running}
+            for path, worker, _ in running:
+                process = processes.get(worker)
+                if process is not None and process.is_alive() or process is None and now - leases[path][1] < lease: continue
+                name, rank, item = queue.take_back(path)
+                if name not in outstanding: continue
+                progress = True
+                del outstanding[name]
+                error = "The worker {} died or stopped renewing its lease on {} input states of {}".format(worker, len(item.capture_ids), item.key)
+                __put_back(queue, outstanding, failures, name, rank, item, error, retries)
+
+            # Start the local workers, replacing those that died
+            for worker, process in list(processes.items()):
+                if not process.is_alive():
+                    del processes[worker]
+            while outstanding and len(processes) < (workers if workers is not None else os.cpu_count()):
+                worker = "{}{}".format(prefix, started)
+                processes[worker] = multiprocessing.Process(target=run_worker, args=(queue.dirpath, worker, lease), daemon=True)
+                processes[worker].start()
+                started += 1
+
+            if not progress:
+                time.sleep(POLL_INTERVAL)
+    finally:
+        queue.stop()
+        for process in processes.values():
+            process.join(timeout=lease)
+            if process.is_alive():
+                process.terminate()
+        timings.save()
+        if tmp_dirpath is not None:
+            shutil.rmtree(tmp_dirpath, ignore_errors=True)
+
+    return similarity, failures
+
+
+def run_worker(queue_dirpath : str, worker : str = None, lease : float = DEFAULT_LEASE):
+    """
+    Run the work items claimed from a work queue of comparison tests until the queue is stopped and no item is pending.
+    This is what each local worker process runs, and what is started on each other node, such as with
+    "python -m code_generation.scheduler queue_dirpath", so the node's workers share the queue directory with the run.
+    :queue_dirpath: Directory of the work queue
+    :worker: Name of the worker, which is unique among the workers of the queue, or None for the host name and process id
+    :lease: Seconds after which the claim of a work item expires, which is renewed several times within that time while the item runs
+    The context is read again whenever the queue is given a new one, such as by the next run on the same queue directory,
+    and the runners of the previous context are closed, since its pairs and libraries may have changed.
+    """
+    queue = WorkQueue(queue_dirpath)
+    worker = worker if worker is not None else "{}-{}".format(socket.gethostname(), os.getpid())
+    context_id, context, store = None, None, None
+    runners = dict()        # Runner of each pair of procedures that was run last, by key
+    try:
+        while True:
+            path, item = queue.claim(worker)
+            if path is None:
+                if queue.stopped: break
+                time.sleep(POLL_INTERVAL)
+                continue
+            if queue.get_context_id() != context_id:
+                for runner in runners.values():
+                    if isinstance(runner, TestRunner):
+                        runner.close()
+                runners.clear()
+                context_id, context = queue.get_context()
+                store = StateStore(context["store_dirpath"])
+
+            # Renew the lease in a thread while the item runs, since calls into libraries and drivers release the GIL
+            # The thread also abandons the item once it runs past its deadline
+            start = time.perf_counter()
+            runner = None
+            expired = threading.Event()
+            stopped = threading.Event()
+            def expire():
+                expired.set()
+                error = "The item of {} input states of {} ran past its deadline of {} seconds".format(len(item.capture_ids), item.key, item.deadline)
+                if isinstance(runner, BatchRunner):
+                    runner.kill()
+                    return
+                queue.complete(path, (None, time.perf_counter() - start, error))
+                os._exit(1)
+            renewer = threading.Thread(target=__renew, args=(queue, path, lease / 4, stopped, item.deadline, expire), daemon=True)
+            renewer.start()
+            try:
+                runner = runners.pop(item.key, None) or __get_runner(context["tests"][item.key], context["batch_size"])
+                runners[item.key] = runner
+                while len(runners) > RUNNER_CACHE_SIZE:
+                    evicted = runners.pop(next(iter(runners)))
+                    if isinstance(evicted, TestRunner):
+                        evicted.close()
+                result = (runner.replay(store, item.key, item.capture_ids), time.perf_counter() - start, None)
+            except Exception:
+                error = traceback.format_exc()
+                if expired.is_set():
+                    error += "The item ran past its deadline of {} seconds, and its drivers were killed\n".format(item.deadline)
+                result = (None, time.perf_counter() - start, error)
+            finally:
+                stopped.set()
+                renewer.join()
+            queue.complete(path, result)
+    finally:
+        for runner in runners.values():
+            if isinstance(runner, TestRunner):
+                runner.close()
+
+
+def __put_back(queue : WorkQueue, outstanding : dict[str, tuple[int, WorkItem]], failures : dict[str, str], name : str, rank : int,
+               item : WorkItem, error : str, retries : int):
+    """
+    Put an item that failed or whose worker died back in the queue, split in two halves so that the input states that fail are isolated
+    from the others, unless it has failed more than retries times, in which case the error is recorded as the failure of its pair
+    """
+    item.attempts += 1
+    if item.attempts > retries:
+        failures[item.key] = error
+        return
+    halves = np.array_split(item.capture_ids, 2) if len(item.capture_ids) > 1 else [item.capture_ids]
+    for k, capture_ids in enumerate(halves):
+        half = WorkItem(item.key, capture_ids, item.cost * len(capture_ids) / len(item.capture_ids))
+        half.attempts = item.attempts
+        half.deadline = item.deadline
+        outstanding["{}-{}".format(name, k)] = (rank, half)
+        queue.put("{}-{}".format(name, k), half, rank)
+
+
+def __get_runner(test : tuple[Subimplementation, Subimplementation, dict[str, str]], batch_size : int):
+    """
+    Get the runner of a pair of procedures, which runs their drivers if both were built, and otherwise loads their libraries
+    """
+    subimpl1, subimpl2, names = test
+    if subimpl1.driver is not None and subimpl2.driver is not None:
+        return BatchRunner(subimpl1, subimpl2, names, batch_size)
+    return TestRunner(subimpl1, subimpl2, names)
+
+
+def __renew(queue : WorkQueue, path : str, interval : float, stopped : threading.Event, deadline : float = None, expire = None):
+    """
+    Renew the lease of a claimed item every interval until stopped is set or the lease is lost
+    Once deadline seconds pass, the lease is no longer renewed and expire is called, unless deadline is None
+    """
+    end = time.monotonic() + deadline if deadline is not None else None
+    while not stopped.wait(interval if end is None else max(min(interval, end - time.monotonic()), 0)):
+        if end is not None and time.monotonic() >= end:
+            expire()
+            break
+        if not queue.renew(path):
+            break
+
+
+if __name__ == "__main__":
+
+    # Get the queue directory to work on from the command line arguments
+    if len(sys.argv) == 2 or len(sys.argv) == 3:
+        queue_dirpath = sys.argv[1]
+        lease = float(sys.argv[2]) if len(sys.argv) == 3 else DEFAULT_LEASE
+    else:
+        raise Exception("Usage: python3 -m code_generation.scheduler queue_directory_path [lease_seconds]")
+    run_worker(queue_dirpath, lease=lease)
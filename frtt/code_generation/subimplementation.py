@@ -0,0 +1,513 @@
+import logging
+import os
+from utilities.types.generic import Program, ProgramUnit
+from utilities.types.dependency_graph import DependencyGraph
+from code_generation.fortran_source import FortranSource, Span, Statement, read_source, get_specification, split_declaration, get_entity_name, format_statement
+from code_generation.fortran_source import INTERFACE_STMT, END_INTERFACE_STMT, TYPE_DEFINITION_STMT, END_TYPE_STMT
+from code_generation.interface import Interface, Declaration, get_parameters, get_declarations, get_symbol, get_module_symbol
+
+# Logger of the subimplementations whose interface could not be extracted
+logger = logging.getLogger(__name__)
+
+# Names of the source files of a subimplementation
+CORE_FILENAME = "core.f90"
+UNIT_FILENAME = "unit.f90"
+
+# Values that mocked procedures assign to their outputs, by the start of their type without spaces
+ZERO_VALUES = {"integer" : "0", "real" : "0", "doubleprecision" : "0", "doublecomplex" : "0", "complex" : "0", "logical" : ".false.", "character" : "''"}
+
+# Keywords of the prefix of a procedure statement that are not part of the type of a function
+PREFIX_KEYWORDS = frozenset(("recursive", "pure", "elemental", "impure", "non_recursive", "module"))
+
+
+class Requirements:
+    """
+    Class that represents the definitions that a piece of code needs to compile: modules, names declared by modules, and external procedures
+    """
+
+    __slots__ = ("modules", "names", "externals")
+
+    def __init__(self):
+        self.modules : set[ProgramUnit] = set()                         # Modules that are used, which need every module they use
+        self.names : set[tuple[ProgramUnit, str]] = set()               # Module and name of each variable or module procedure that is referenced
+        self.externals : set[ProgramUnit] = set()                       # External procedures that are referenced
+
+
+class Subimplementation:
+    """
+    Class that represents the minimal complete subimplementation of a procedure.
+    The procedure is kept whole with its host procedure, if any. Modules keep only the variables that are referenced and their parameters
+    and types, and every other procedure that is referenced is mocked to set its outputs to zero.
+    The source is split into a core, which is the same for similar procedures, and the unit that holds the procedure.
+    """
+
+    def __init__(self, programunit : ProgramUnit, root : ProgramUnit):
+        self.programunit = programunit                                  # Procedure to test
+        self.root = root                                                # Procedure whose source is kept whole, which is the outermost host of programunit
+        self.modules : list[ProgramUnit] = []                           # Modules, with the modules each module uses first
+        self.variables : dict[ProgramUnit, set[str]] = dict()           # Names of the variables that each module keeps
+        self.mocks : list[ProgramUnit] = []                             # Procedures that are mocked
+        self.core : str = ""                                            # Source of the modules and mocks that do not depend on root
+        self.unit : str = ""                                            # Source of root, and of the modules that contain or depend on it
+        self.library : str = None                                       # Path to the shared library of unit linked with core, once built
+        self.interface : Interface = None                               # Interface of the procedure, or None if it is internal and has no symbol or could not be extracted
+        self.interface_error : str = None                               # Reason the interface could not be extracted, or None
+        self.driver : str = None                                        # Path to the executable that runs batches of input states, once built
+
+    def write(self, dirpath : str):
+        """
+        Write the core and unit source files to a directory
+        """
+        os.makedirs(dirpath, exist_ok=True)
+        for filename, text in ((CORE_FILENAME, self.core), (UNIT_FILENAME, self.unit)):
+            with open(os.path.join(dirpath, filename), 'w') as f:
+                f.write(text)
+
+    def detach(self) -> "Subimplementation":
+        """
+        Get a copy that only keeps what running the built procedure needs: its name and type, interface, library, and driver.
+        The copy does not refer to the rest of the program, so it is small to send to worker processes.
+        """
+        programunit = ProgramUnit()
+        programunit.name, programunit.type, programunit.filepath = self.programunit.name, self.programunit.type, self.programunit.filepath
+        subimpl = Subimplementation(programunit, programunit)
+        subimpl.library, subimpl.interface, subimpl.driver = self.library, self.interface, self.driver
+        subimpl.interface_error = self.interface_error
+        return subimpl
+
+
+class SubimplementationExtractor:
+    """
+    Class that extracts the minimal complete subimplementations of the procedures of a program.
+    The requirements of each module, mocked procedure, and kept procedure are computed once and shared by every subimplementation that needs them,
+    as are the modules each module uses, the names visible in each module, and the pruned source of each module,
+    so extracting many subimplementations costs about the size of each subimplementation instead of the size of the program.
+    """
+
+    def __init__(self, program : Program):
+        """
+        :program: Object representation of a program with resolved references
+        """
+        self.program = program
+        self.order = {punit : i for i, punit in enumerate(program.declared_programunits)}      # Index of each program unit, which orders the mocks
+        modules = [punit for punit in program.declared_programunits if punit.type == "module"]
+        self.module_graph = DependencyGraph(modules, [[module for module in punit.referenced_modules if module.type == "module"] for punit in modules])
+
+        # Cached results, shared by every subimplementation
+        self.sources : dict[str, FortranSource] = dict()                # Source of each source file
+        self.spans : dict[ProgramUnit, Span] = dict()                   # Span of each program unit in its source
+        self.closures : dict[ProgramUnit, list[ProgramUnit]] = dict()   # Modules that each module directly or indirectly uses
+        self.tables : dict[ProgramUnit, dict[str, ProgramUnit]] = dict()    # Module that declares each name visible in each module
+        self.module_statements : dict[ProgramUnit, list[tuple]] = dict()    # Statements of the specification part of each module, and their declarations
+        self.declaration_names : dict[ProgramUnit, dict[str, set[str]]] = dict()    # Variables of each module that the declaration of each of its variables references
+        self.requirements : dict[tuple, Requirements] = dict()          # Requirements of each module, mocked procedure, and kept procedure, by program unit and whether it is kept
+        self.mock_sources : dict[ProgramUnit, str] = dict()             # Source of the mock of each procedure
+        self.module_sources : dict[tuple, str] = dict()                 # Pruned source of each module, by module, kept variables, and mocks
+        self.parameters : dict[ProgramUnit, dict[str, int]] = dict()    # Integer named constants in scope of each module
+        self.declarations : dict[ProgramUnit, dict[str, Declaration]] = dict()  # Declaration of each variable of each module
+
+    def extract(self, punit : ProgramUnit) -> Subimplementation:
+        """
+        Extract the minimal complete subimplementation of a procedure
+        """
+        root = punit
+        while isinstance(root.parent, ProgramUnit) and root.parent.type != "module":
+            root = root.parent
+        host = root.parent if isinstance(root.parent, ProgramUnit) else None
+        subimpl = Subimplementation(punit, root)
+
+        # Gather the requirements of root, then of each module it needs and each procedure it mocks, until no requirement is new
+        modules : set[ProgramUnit] = set()
+        names : dict[ProgramUnit, set[str]] = dict()
+        mocks : dict[ProgramUnit, None] = dict()
+        pending = [self.__get_requirements(root, root)]
+        if host is not None:
+            names[host] = set()
+            pending.append(Requirements())
+            pending[-1].modules.add(host)
+        while pending:
+            requirements = pending.pop()
+            for module in requirements.modules:
+                if module in modules: continue
+                for used in self.__get_closure(module):
+                    if used not in modules:
+                        modules.add(used)
+                        names.setdefault(used, set())
+                        pending.append(self.__get_requirements(used, used))
+            for module, name in requirements.names:
+                procedure = module.declared_procedures_map.get(name)
+                if procedure is None:
+                    names.setdefault(module, set()).add(name)
+                elif procedure is not root and procedure not in mocks:
+                    mocks[procedure] = None
+                    pending.append(self.__get_requirements(procedure, None))
+                if module not in modules:
+                    pending.append(self.__get_requirements(module, module))
+            for procedure in requirements.externals:
+                if procedure is not root and procedure not in mocks:
+                    mocks[procedure] = None
+                    pending.append(self.__get_requirements(procedure, None))
+
+        # Order the modules so that each module comes after the modules it uses
+        subimpl.modules = [module for module in self.module_graph.topological_order() if module in modules]
+        subimpl.mocks = sorted(mocks, key=lambda procedure : self.order.get(procedure, len(self.order)))
+        subimpl.variables = {module : self.__get_kept_variables(module, names.get(module, set())) for module in subimpl.modules}
+
+        # Put the modules that contain or use the module of root in the unit, and the other modules and external mocks in the core
+        core, unit = [], []
+        for module in subimpl.modules:
+            in_unit = host is not None and (module is host or self.module_graph.depends_on(module, host))
+            procedures = [procedure for procedure in module.declared_procedures if procedure in mocks or procedure is root]
+            (unit if in_unit else core).append(self.__get_module_source(module, subimpl.variables[module], procedures, root))
+        for procedure in subimpl.mocks:
+            if not isinstance(procedure.parent, ProgramUnit):
+                core.append(self.__get_mock_source(procedure))
+        if host is None:
+            source, span = self.__get_source(root)
+            unit.append(source.text(span.start, span.end))
+        subimpl.core = "\n".join(core)
+        subimpl.unit = "\n".join(unit)
+
+        # A declaration that the interface cannot be extracted from only leaves this subimplementation without one
+        try:
+            subimpl.interface = self.__get_interface(subimpl)
+        except Exception as e:
+            subimpl.interface = None
+            subimpl.interface_error = "The interface of {} could not be extracted: {}".format(punit.name, e)
+            logger.warning(subimpl.interface_error)
+        return subimpl
+
+    def __get_source(self, punit : ProgramUnit) -> tuple[FortranSource, Span]:
+        """
+        Get the source and span of a program unit
+        """
+        source = self.sources.get(punit.filepath)
+        if source is None:
+            source = self.sources[punit.filepath] = read_source(punit.filepath)
+        span = self.spans.get(punit)
+        if span is None:
+            names = [punit.name]
+            parent = punit.parent
+            while isinstance(parent, ProgramUnit):
+                names.append(parent.name)
+                parent = parent.parent
+            span = source.find(names[::-1])
+            if span is None or span.end is None:
+                raise Exception("No source of the {} {} found in {}".format(punit.type, punit.name, punit.filepath))
+            self.spans[punit] = span
+        return source, span
+
+    def __get_closure(self, module : ProgramUnit) -> list[ProgramUnit]:
+        """
+        Get a module and the modules that it directly or indirectly uses
+        """
+        closure = self.closures.get(module)
+        if closure is None:
+            closure = self.closures[module] = [module] + [used for used in self.module_graph.transitive_closure(module) if used is not module]
+        return closure
+
+    def __get_table(self, module : ProgramUnit) -> dict[str, ProgramUnit]:
+        """
+        Get the module that declares each name visible in a module, where the names of a module shadow the names of the modules it uses
+        """
+        table = self.tables.get(module)
+        if table is None:
+            table = dict()
+            for used in module.referenced_modules:
+                if used is not module and used in self.module_graph:
+                    table.update(self.__get_table(used))
+            table.update((name, module) for name in module.declared_variables_map)
+            table.update((name, module) for name in module.declared_procedures_map)
+            self.tables[module] = table
+        return table
+
+    def __get_requirements(self, punit : ProgramUnit, kept : ProgramUnit) -> Requirements:
+        """
+        Get the requirements of the statements of a program unit that are kept
+        The whole source of a kept procedure is kept, only the specification part of a module is kept, and only the specification part
+        of a procedure is kept in its mock. Names in the kept statements are looked up in the modules the program unit and its
+        subprograms use, then in the module that contains it, and then among the external procedures of the program.
+        :punit: Program unit
+        :kept: punit if its whole source is kept, or None if it is mocked
+        """
+        requirements = self.requirements.get((punit, kept))
+        if requirements is not None:
+            return requirements
+        requirements = self.requirements[(punit, kept)] = Requirements()
+        source, span = self.__get_source(punit)
+
+        # Get the names of the statements that are kept, leaving out the declarations of modules that are pruned later
+        scopes = [punit]
+        own = {punit}
+        if punit.type == "module":
+            statements = [statement for statement, declaration in self.__get_module_statements(punit) if declaration is None]
+        elif kept is punit:
+            statements = source.statements[span.start:span.end + 1]
+            scopes.extend(self.__iter_subprograms(punit))
+            own.update(scopes)
+        else:
+            statements = get_specification(source, span)
+        names = set()
+        for statement in statements:
+            names.update(statement.names())
+
+        # Look up the names in the tables of the modules that are used, shadowed by the module that contains the program unit
+        table = dict()
+        for scope in scopes:
+            for module in scope.referenced_modules:
+                if module in self.module_graph:
+                    requirements.modules.add(module)
+                    table.update(self.__get_table(module))
+        host = punit if punit.type == "module" else punit.parent
+        while isinstance(host, ProgramUnit) and host.type != "module":
+            host = host.parent
+        if isinstance(host, ProgramUnit):
+            requirements.modules.add(host)
+            table.update(self.__get_table(host))
+        for name in names:
+            module = table.get(name)
+            if module is not None:
+                if module.declared_procedures_map.get(name) not in own:
+                    requirements.names.add((module, name))
+                continue
+            procedure = self.program.declared_procedures_map.get(name)
+            if procedure is not None and procedure not in own:
+                requirements.externals.add(procedure)
+
+        # Add the references that were resolved, in case a name is not in the kept statements
+        if kept is punit:
+            for scope in scopes:
+                for procedure in scope.referenced_procedures:
+                    if procedure in own: continue
+                    if isinstance(procedure.parent, ProgramUnit) and procedure.parent.type == "module":
+                        requirements.names.add((procedure.parent, procedure.name))
+                    elif not isinstance(procedure.parent, ProgramUnit):
+                        requirements.externals.add(procedure)
+
+        return requirements
+
+    def __get_interface(self, subimpl : Subimplementation) -> Interface:
+        """
+        Get the interface of the procedure of a subimplementation, from the declarations of its arguments and result,
+        and the declarations of the variables that its modules keep
+        :return: Interface, or None if the procedure is internal
+        """
+        punit = subimpl.programunit
+        symbol = get_symbol(punit)
+        if symbol is None:
+            return None
+        interface = Interface(symbol)
+
+        # Named constants of the host module and the used modules are in scope of the declarations of the procedure
+        parameters = dict()
+        for module in ([punit.parent] if punit.parent in self.module_graph else []) + punit.referenced_modules:
+            if module in self.module_graph:
+                parameters.update(self.__get_parameters(module))
+        source, span = self.__get_source(punit)
+        specification = get_specification(source, span)
+        get_parameters(specification, parameters)
+
+        # The type of a function may be given by the prefix of its statement instead of a declaration of its result
+        statements = list(specification)
+        if span.result is not None:
+            spec = self.__get_prefix_type(span)
+            if spec:
+                statements.insert(0, Statement(0, 0, "{} :: {}".format(spec, span.result)))
+        declarations = get_declarations(statements, parameters, set(span.arguments) | {span.result} - {None})
+        interface.arguments = [declarations[name] for name in span.arguments]
+        interface.result = declarations.get(span.result)
+
+        # Variables of modules that are not named constants make up the external state
+        for module, variables in subimpl.variables.items():
+            declarations = self.__get_module_declarations(module)
+            for name in sorted(variables):
+                if name in declarations and "parameter" not in declarations[name].attributes:
+                    interface.externals[name] = (get_module_symbol(module, name), declarations[name])
+        return interface
+
+    def __get_prefix_type(self, span : Span) -> str:
+        """
+        Get the type that the prefix of the statement of a function gives its result, such as "double precision" in
+        "recursive double precision function f(x)"
+        :return: Type, or an empty string if the prefix has none
+        """
+        return " ".join(word for word in span.prefix.split() if word not in PREFIX_KEYWORDS) if span.prefix else ""
+
+    def __get_parameters(self, module : ProgramUnit) -> dict[str, int]:
+        """
+        Get the integer named constants in scope of a module, which are its own and those of the modules it uses
+        """
+        parameters = self.parameters.get(module)
+        if parameters is None:
+            parameters = dict()
+            for used in module.referenced_modules:
+                if used is not module and used in self.module_graph:
+                    parameters.update(self.__get_parameters(used))
+            source, span = self.__get_source(module)
+            get_parameters(get_specification(source, span), parameters)
+            self.parameters[module] = parameters
+        return parameters
+
+    def __get_module_declarations(self, module : ProgramUnit) -> dict[str, Declaration]:
+        """
+        Get the declaration of each variable of a module, leaving out the components of its types and the declarations of its interfaces
+        """
+        declarations = self.declarations.get(module)
+        if declarations is None:
+            statements = [statement for statement, declaration in self.__get_module_statements(module) if declaration is not None]
+            declarations = get_declarations(statements, self.__get_parameters(module))
+            declarations = self.declarations[module] = {name : declaration for name, declaration in declarations.items() if name in module.declared_variables_map}
+
+            # Variables of a module that is private by default are private unless they are made public
+            if any(statement.code == "private" for statement, _ in self.__get_module_statements(module)):
+                for declaration in declarations.values():
+                    if "public" not in declaration.attributes:
+                        declaration.attributes.add("private")
+        return declarations
+
+    def __iter_subprograms(self, punit : ProgramUnit):
+        """
+        Iterate over the subprograms of a program unit, and their subprograms
+        """
+        stack = list(punit.declared_procedures)
+        while stack:
+            procedure = stack.pop()
+            yield procedure
+            stack.extend(procedure.declared_procedures)
+
+    def __get_module_statements(self, module : ProgramUnit) -> list[tuple]:
+        """
+        Get the statements of the specification part of a module, and the declaration of the statements whose entities are pruned
+        Declarations of parameters, and declarations in type definitions and interfaces, are kept whole
+        :return: List of each statement, and its type and attributes and its entities, or None if it is kept whole
+        """
+        statements = self.module_statements.get(module)
+        if statements is not None:
+            return statements
+        statements = self.module_statements[module] = []
+        source, span = self.__get_source(module)
+        depth = 0
+        for statement in source.statements[span.start + 1:span.contains if span.contains is not None else span.end]:
+            if INTERFACE_STMT.match(statement.code) or TYPE_DEFINITION_STMT.match(statement.code):
+                depth += 1
+            elif END_INTERFACE_STMT.match(statement.code) or END_TYPE_STMT.match(statement.code):
+                depth -= 1
+            declaration = split_declaration(statement) if depth == 0 else None
+            if declaration is not None and "parameter" in declaration[0].replace(" ", "").split(","):
+                declaration = None
+            statements.append((statement, declaration))
+        return statements
+
+    def __get_kept_variables(self, module : ProgramUnit, names : set[str]) -> set[str]:
+        """
+        Get the variables that a module keeps, which are the variables that are referenced and the variables their declarations reference
+        """
+        references = self.declaration_names.get(module)
+        if references is None:
+            references = self.declaration_names[module] = dict()
+            for _, declaration in self.__get_module_statements(module):
+                if declaration is None: continue
+                for entity in declaration[1]:
+                    referenced = Statement(0, 0, entity).names() & module.declared_variables_map.keys()
+                    references.setdefault(get_entity_name(entity), set()).update(referenced)
+
+        variables = set(names)
+        pending = list(variables)
+        while pending:
+            for referenced in references.get(pending.pop(), ()):
+                if referenced not in variables:
+                    variables.add(referenced)
+                    pending.append(referenced)
+        return variables
+
+    def __get_module_source(self, module : ProgramUnit, variables : set[str], procedures : list[ProgramUnit], root : ProgramUnit) -> str:
+        """
+        Get the source of a module that declares only some of its variables, whose procedures are mocked except for root
+        Parameters, types, interfaces, and every other statement of the specification part are kept
+        """
+        key = (module, frozenset(variables), tuple(procedures), root if root in procedures else None)
+        text = self.module_sources.get(key)
+        if text is not None:
+            return text
+
+        # Names that are left out of the declaration and access statements
+        pruned = set(module.declared_variables_map) - variables
+        pruned.update(name for name, procedure in module.declared_procedures_map.items() if procedure not in procedures)
+
+        source, span = self.__get_source(module)
+        text = format_statement(source.statements[span.start].text)
+        for statement, declaration in self.__get_module_statements(module):
+            if declaration is None:
+                text += format_statement(statement.text)
+                continue
+            prefix, entities = declaration
+            entities = [entity for entity in entities if get_entity_name(entity) not in pruned]
+            if entities:
+                text += format_statement("{} :: {}".format(prefix, ", ".join(entities)))
+
+        # Keep root whole and mock the other procedures
+        if procedures:
+            text += "contains\n"
+        for procedure in procedures:
+            if procedure is root:
+                procedure_source, procedure_span = self.__get_source(procedure)
+                text += procedure_source.text(procedure_span.start, procedure_span.end)
+            else:
+                text += self.__get_mock_source(procedure)
+        text += "end module {}\n".format(module.name)
+        self.module_sources[key] = text
+        return text
+
+    def __get_mock_source(self, procedure : ProgramUnit) -> str:
+        """
+        Get the source of a mock of a procedure, which has the specification part of the procedure and sets its outputs to zero
+        Outputs are the dummy arguments with intent(out) or intent(inout), and the result of a function.
+        Outputs that are allocatable, pointers, or of derived types are left undefined.
+        """
+        text = self.mock_sources.get(procedure)
+        if text is not None:
+            return text
+        source, span = self.__get_source(procedure)
+        specification = get_specification(source, span)
+        lines = [source.statements[span.start].text]
+        lines.extend(statement.text for statement in specification)
+
+        # Get the type and attributes of each output from the declaration and attribute statements that name it
+        attributes : dict[str, list[str]] = dict()
+        for statement in specification:
+            declaration = split_declaration(statement)
+            if declaration is None: continue
+            prefix, entities = declaration
+            for entity in entities:
+                attributes.setdefault(get_entity_name(entity), []).append(prefix.replace(" ", ""))
+        outputs = [name for name in span.arguments if any("intent(out)" in prefix or "intent(inout)" in prefix for prefix in attributes.get(name, []))]
+        if span.result is not None:
+            outputs.append(span.result)
+            if span.result not in attributes:
+                spec = self.__get_prefix_type(span)
+                attributes[span.result] = [spec.replace(" ", "") if spec else ("integer" if "i" <= span.result[0] <= "n" else "real")]
+
+        # Assign zero to each output by its type
+        for name in outputs:
+            prefixes = attributes.get(name, [])
+            if any("allocatable" in prefix or "pointer" in prefix for prefix in prefixes):
+                continue
+            for prefix in prefixes:
+                value = next((value for word, value in ZERO_VALUES.items() if prefix.startswith(word)), None)
+                if value is not None:
+                    lines.append("{} = {}".format(name, value))
+                    break
+        lines.append("end {} {}".format(span.kind, span.name))
+        text = self.mock_sources[procedure] = "".join(format_statement(line) for line in lines)
+        return text
+
+
+def extract_subimplementations(program : Program, programunits : list[ProgramUnit]) -> list[Subimplementation]:
+    """
+    Extract the minimal complete subimplementations of procedures of a program in one sweep, sharing the work common to them
+    :program: Object representation of a program with resolved references
+    :programunits: Procedures to extract the subimplementations of
+    :return: Subimplementation of each procedure, in the same order
+    """
+    extractor = SubimplementationExtractor(program)
+    return [extractor.extract(punit) for punit in programunits]
@@ -0,0 +1,210 @@
+import os
+import pickle
+import tempfile
+import uuid
+
+# Subdirectories of a work queue, which hold the items waiting to be claimed, the items that workers claimed, and the results of items
+PENDING_DIRNAME = "pending"
+RUNNING_DIRNAME = "running"
+RESULTS_DIRNAME = "results"
+
+# Names of the file that holds what every worker needs to run items, and of the file that tells workers to stop once no item is pending
+CONTEXT_FILENAME = "context.pickle"
+STOP_FILENAME = "stop"
+
+
+class WorkQueue:
+    """
+    Class that represents a queue of work items in a directory, which workers on any node that can reach it, such as on a shared file system,
+    claim items from without a server or locks.
+    Each item is a file whose name sorts by its rank, and a worker claims an item by renaming its file into the running directory, which is atomic,
+    so every item is claimed by one worker. A claim is a lease that the worker renews by appending a byte to the file, so the size of the file
+    counts its renewals, and the items of a worker that died are found by a count that stopped changing and can be put back.
+    Renewals are counted instead of timed by modification times, so nodes whose clocks disagree with each other or with a shared file system
+    share a queue.
+    Items, results, and the context are written to temporary files that are renamed into place, so they are never read partially written.
+    The context is written after a new id, so that workers find that it changed by reading its id.
+    """
+
+    def __init__(self, dirpath : str):
+        """
+        :dirpath: Directory of the queue, which is created if it does not exist
+        """
+        self.dirpath = dirpath
+        for dirname in (PENDING_DIRNAME, RUNNING_DIRNAME, RESULTS_DIRNAME):
+            os.makedirs(os.path.join(dirpath, dirname), exist_ok=True)
+
+    def put(self, name : str, item, rank : int = 0):
+        """
+        Add an item to the pending items
+        :name: Name of the item, which is unique in the queue and has no "@"
+        :item: Picklable item
+        :rank: Rank of the item, where items of lower rank are claimed first
+        """
+        self.__write(os.path.join(self.dirpath, PENDING_DIRNAME, "{:012d}.{}".format(rank, name)), item)
+
+    def claim(self, worker : str) -> tuple[str, object]:
+        """
+        Claim the pending item of lowest rank
+        :worker: Name of the worker, which is unique among the workers of the queue and has no "@"
+        :return: Path to the file of the claimed item, which is passed to renew() and complete(), and the item,
+            or None and None if no item is pending
+        """
+        pending_dirpath = os.path.join(self.dirpath, PENDING_DIRNAME)
+        for filename in sorted(os.listdir(pending_dirpath)):
+            if filename.endswith(".tmp"): continue
+            path = os.path.join(self.dirpath, RUNNING_DIRNAME, "{}@{}".format(filename, worker))
+            try:
+                os.rename(os.path.join(pending_dirpath, filename), path)
+                with open(path, 'rb') as f:
+                    return path, pickle.load(f)
+            except FileNotFoundError:
+                # Another worker claimed the item first, or its lease was taken back before it was renewed
+                continue
+        return None, None
+
+    def renew(self, path : str) -> bool:
+        """
+        Renew the lease of a claimed item, by appending a byte after the pickled item, which loading it ignores
+        :return: False if the lease expired and the item was taken back
+        """
+        # Open the file without creating it, so an item that was taken back is not written again
+        try:
+            fd = os.open(path, os.O_WRONLY | os.O_APPEND)
+        except FileNotFoundError:
+            return False
+        try:
+            os.write(fd, b"\0")
+        finally:
+            os.close(fd)
+        return True
+
+    def complete(self, path : str, result):
+        """
+        Write the result of a claimed item, and remove the item from the running items
+        """
+        self.__write(os.path.join(self.dirpath, RESULTS_DIRNAME, self.get_name(path)), result)
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+
+    def results(self) -> list[tuple[str, object]]:
+        """
+        Read and remove the results written since the last call
+        :return: Name of the item and its result, for each result
+        """
+        results = []
+        results_dirpath = os.path.join(self.dirpath, RESULTS_DIRNAME)
+        for filename in sorted(os.listdir(results_dirpath)):
+            if filename.endswith(".tmp"): continue
+            path = os.path.join(results_dirpath, filename)
+            with open(path, 'rb') as f:
+                results.append((filename, pickle.load(f)))
+            os.remove(path)
+        return results
+
+    def running(self) -> list[tuple[str, str, int]]:
+        """
+        Get the claimed items that have no result yet
+        :return: Path to the file of each claimed item, the name of its worker, and a count that increases each time its lease is renewed
+        """
+        running = []
+        for entry in os.scandir(os.path.join(self.dirpath, RUNNING_DIRNAME)):
+            try:
+                running.append((entry.path, entry.name.rpartition("@")[2], entry.stat().st_size))
+            except FileNotFoundError:
+                continue
+        return running
+
+    def take_back(self, path : str) -> tuple[str, int, object]:
+        """
+        Remove a claimed item whose worker died or whose lease expired, so it can be put again
+        If its worker completes it anyway, its result is still written
+        :return: Name, rank, and item, or None, None, and None if the item was completed or taken back first
+        """
+        try:
+            with open(path, 'rb') as f:
+                item = pickle.load(f)
+            os.remove(path)
+        except FileNotFoundError:
+            return None, None, None
+        return self.get_name(path), int(os.path.basename(path).partition(".")[0]), item
+
+    def discard(self, name : str):
+        """
+        Remove the pending copies of an item, such as one that was put back after its worker was thought to have died but completed it
+        """
+        pending_dirpath = os.path.join(self.dirpath, PENDING_DIRNAME)
+        for filename in os.listdir(pending_dirpath):
+            if filename.partition(".")[2] == name:
+                try:
+                    os.remove(os.path.join(pending_dirpath, filename))
+                except FileNotFoundError:
+                    pass
+
+    def get_name(self, path : str) -> str:
+        """
+        Get the name of an item from the path to its file
+        """
+        return os.path.basename(path).rpartition("@")[0].partition(".")[2]
+
+    def clear(self):
+        """
+        Remove every pending item, claimed item, and result, such as those left by an earlier run in the same directory
+        """
+        for dirname in (PENDING_DIRNAME, RUNNING_DIRNAME, RESULTS_DIRNAME):
+            for entry in os.scandir(os.path.join(self.dirpath, dirname)):
+                try:
+                    os.remove(entry.path)
+                except FileNotFoundError:
+                    pass
+
+    def set_context(self, context):
+        """
+        Write what every worker needs to run items, such as the tests that items refer to, and reopen the queue to workers
+        """
+        self.__write(os.path.join(self.dirpath, CONTEXT_FILENAME), uuid.uuid4().hex, context)
+        try:
+            os.remove(os.path.join(self.dirpath, STOP_FILENAME))
+        except FileNotFoundError:
+            pass
+
+    def get_context(self):
+        """
+        Read what every worker needs to run items, as written by set_context()
+        :return: Id of the context, which is new each time set_context() is called, and the context
+        """
+        with open(os.path.join(self.dirpath, CONTEXT_FILENAME), 'rb') as f:
+            return pickle.load(f), pickle.load(f)
+
+    def get_context_id(self) -> str:
+        """
+        Read the id of the context without the context, to find whether it changed since it was read
+        """
+        with open(os.path.join(self.dirpath, CONTEXT_FILENAME), 'rb') as f:
+            return pickle.load(f)
+
+    def stop(self):
+        """
+        Tell workers to stop once no item is pending
+        """
+        open(os.path.join(self.dirpath, STOP_FILENAME), 'w').close()
+
+    @property
+    def stopped(self) -> bool:
+        return os.path.exists(os.path.join(self.dirpath, STOP_FILENAME))
+
+    def __write(self, path : str, *objs):
+        """
+        Pickle objects one after the other to a temporary file and rename it to path
+        """
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                for obj in objs:
+                    pickle.dump(obj, f, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(tmp_path, path)
+        except BaseException:
+            os.remove(tmp_path)
+            raise
@@ -0,0 +1 @@
+from comparison.similarity import ratios, iter_chunks, compare_stores, SimilarityAccumulator, UnitSimilarity, ProgramSimilarity, CHUNK_SIZE
@@ -0,0 +1,217 @@
+import numpy as np
+from dynamic_analysis.state_store import StateStore, EXAMPLE_COLUMN, HIT_COLUMN
+
+# Number of values whose ratios are computed at once, which bounds the memory of comparing memory-mapped values
+CHUNK_SIZE = 1 << 20
+
+
+def ratios(a, b) -> np.ndarray:
+    """
+    Get the ratio of each pair of values of two output states, which is in [0, 1] and is 1 for equal values.
+    Numbers are compared by the ratio of their magnitudes that is less than or equal to 1, where two zeros give 1,
+    and values of different signs, or where exactly one is zero, NaN, or infinite, give 0.
+    Complex numbers give the average of the ratios of their real and imaginary parts.
+    Logical and character values, and values of different types, give 1 if they are equal and 0 otherwise.
+    :a: Value or array of values of the first output state
+    :b: Value or array of values of the second output state, of the same shape
+    :return: Array of the ratios of each pair of values, of their shape
+    """
+    a, b = np.asarray(a), np.asarray(b)
+    if a.shape != b.shape:
+        raise Exception("Values of shapes {} and {} cannot be compared".format(a.shape, b.shape))
+    shape, kinds = a.shape, a.dtype.kind + b.dtype.kind
+    if 'c' in kinds and all(kind in "iufc" for kind in kinds):
+        a, b = a.astype(np.complex128, copy=False).reshape(-1), b.astype(np.complex128, copy=False).reshape(-1)
+        result = __real_ratios(a.real, b.real)
+        result += __real_ratios(a.imag, b.imag)
+        result /= 2
+        return result.reshape(shape)
+    if all(kind in "iuf" for kind in kinds):
+        return __real_ratios(a.reshape(-1), b.reshape(-1)).reshape(shape)
+    return np.asarray(a == b, dtype=np.float64)
+
+
+def __real_ratios(a : np.ndarray, b : np.ndarray) -> np.ndarray:
+    """
+    Get the ratio of each pair of integer or real values, of flattened arrays
+    """
+    # Equal values, including equal infinities and NaNs, give 1 before they are cast
+    equal = a == b
+    if a.dtype.kind == 'f' and b.dtype.kind == 'f':
+        equal |= np.isnan(a) & np.isnan(b)
+    signs = ((a < 0) & (b > 0)) | ((a > 0) & (b < 0))
+
+    # Divide the smaller magnitude by the larger, which gives NaN for two zeros, two infinities, or a NaN
+    a, b = np.abs(a, dtype=np.float64), np.abs(b, dtype=np.float64)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        result = np.minimum(a, b)
+        result /= np.maximum(a, b)
+    np.nan_to_num(result, copy=False, nan=0.0)
+    result[signs] = 0.0
+    result[equal] = 1.0
+    return result
+
+
+def iter_chunks(a, b, chunk_size : int = CHUNK_SIZE):
+    """
+    Iterate over two values of the same shape in chunks of their flattened values, so that memory-mapped values are read one chunk at a time
+    :a: Value or array of values of the first output state
+    :b: Value or array of values of the second output state
+    :chunk_size: Number of values of each chunk
+    :return: Generator of the chunks of each value
+    """
+    a, b = np.asarray(a), np.asarray(b)
+    if a.shape != b.shape:
+        raise Exception("Values of shapes {} and {} cannot be compared".format(a.shape, b.shape))
+    a, b = a.reshape(-1), b.reshape(-1)
+    for i in range(0, len(a), chunk_size):
+        yield a[i:i + chunk_size], b[i:i + chunk_size]
+
+
+class SimilarityAccumulator:
+    """
+    Class that accumulates the sum and number of ratios, whose average is their quantified similarity
+    """
+
+    __slots__ = ("total", "count")
+
+    def __init__(self):
+        self.total = 0.0        # Sum of the ratios
+        self.count = 0          # Number of ratios
+
+    def add(self, a, b, chunk_size : int = CHUNK_SIZE):
+        """
+        Add the ratios of each pair of values of two output states, one chunk at a time
+        """
+        for chunk_a, chunk_b in iter_chunks(a, b, chunk_size):
+            result = ratios(chunk_a, chunk_b)
+            self.total += float(result.sum())
+            self.count += result.size
+
+    def add_similarity(self, similarity : float):
+        """
+        Add the quantified similarity of a state or program unit as one ratio, to average the similarities
+        """
+        self.total += similarity
+        self.count += 1
+
+    def merge(self, other : "SimilarityAccumulator"):
+        """
+        Add the ratios accumulated by another accumulator
+        """
+        self.total += other.total
+        self.count += other.count
+
+    @property
+    def similarity(self) -> float:
+        """
+        Average of the ratios, or None if there are none, since nothing was compared
+        """
+        return self.total / self.count if self.count else None
+
+
+class UnitSimilarity:
+    """
+    Class that accumulates the quantified similarity of a pair of similar program units over their pairs of output states.
+    The similarity of the program units is the average of the similarities of each pair of output states,
+    and the similarity of a pair of output states is the average of the ratios of all of their values.
+    A pair of output states without values is not counted, and the similarity is None until a pair with values is added.
+    """
+
+    def __init__(self):
+        self.variables : dict[str, SimilarityAccumulator] = dict()      # Ratios of the values of each variable over every output state
+        self.states = SimilarityAccumulator()                           # Similarities of each pair of output states
+
+    def add_state(self, values, chunk_size : int = CHUNK_SIZE) -> float:
+        """
+        Add a pair of output states
+        :values: Iterable of the name of each variable, and its value in each output state
+        :return: Quantified similarity of the pair of output states, or None if they have no values
+        """
+        state = SimilarityAccumulator()
+        for name, a, b in values:
+            variable = SimilarityAccumulator()
+            variable.add(a, b, chunk_size)
+            self.variables.setdefault(name, SimilarityAccumulator()).merge(variable)
+            state.merge(variable)
+        if state.count:
+            self.states.add_similarity(state.similarity)
+        return state.similarity
+
+    def merge(self, other : "UnitSimilarity"):
+        """
+        Add the output states accumulated by another accumulator of the same program units
+        """
+        for name, variable in other.variables.items():
+            self.variables.setdefault(name, SimilarityAccumulator()).merge(variable)
+        self.states.merge(other.states)
+
+    @property
+    def similarity(self) -> float:
+        return self.states.similarity
+
+
+class ProgramSimilarity:
+    """
+    Class that accumulates the quantified similarity of two implementations, which is the average of the similarities of
+    each pair of similar program units that has output states, or None if no pair has any
+    """
+
+    def __init__(self):
+        self.units : dict[str, UnitSimilarity] = dict()     # Accumulator of each pair of similar program units, by key
+
+    def add_state(self, unit : str, values, chunk_size : int = CHUNK_SIZE) -> float:
+        """
+        Add a pair of output states of a pair of similar program units
+        :unit: Key of the program units
+        :values: Iterable of the name of each variable, and its value in each output state
+        :return: Quantified similarity of the pair of output states, or None if they have no values
+        """
+        if unit not in self.units:
+            self.units[unit] = UnitSimilarity()
+        return self.units[unit].add_state(values, chunk_size)
+
+    def merge(self, other : "ProgramSimilarity"):
+        """
+        Add the output states accumulated by another accumulator, such as one of another worker
+        """
+        for key, unit in other.units.items():
+            if key not in self.units:
+                self.units[key] = UnitSimilarity()
+            self.units[key].merge(unit)
+
+    @property
+    def similarity(self) -> float:
+        units = SimilarityAccumulator()
+        for unit in self.units.values():
+            if unit.states.count:
+                units.add_similarity(unit.similarity)
+        return units.similarity
+
+
+def compare_stores(store1 : StateStore, store2 : StateStore, units : list[str] = None, chunk_size : int = CHUNK_SIZE) -> ProgramSimilarity:
+    """
+    Compare the output states of two implementations in two stores, where a pair of output states is the captures of a program unit
+    with the same id in both stores. Values are compared as views of the memory-mapped columns, one chunk at a time.
+    :store1: Store of the output states of the first implementation
+    :store2: Store of the output states of the second implementation
+    :units: Keys of the program units to compare, or None for every program unit in both stores
+    :chunk_size: Number of values whose ratios are computed at once
+    :return: Accumulated similarity of the implementations
+    """
+    similarity = ProgramSimilarity()
+    if units is None:
+        units = [unit for unit in store1.units() if unit in store2.columns]
+    for unit in units:
+
+        # Compare the variables of both output states, leaving out the columns that record where captures came from
+        variables = [var for var in store1.variables(unit) if var in store2.columns.get(unit, dict()) and var not in (EXAMPLE_COLUMN, HIT_COLUMN)]
+        captures = dict()
+        for var in variables:
+            for capture_id in np.intersect1d(store1.capture_ids(unit, var), store2.capture_ids(unit, var)):
+                captures.setdefault(int(capture_id), []).append(var)
+        for capture_id in sorted(captures):
+            values = ((var, store1.get(unit, var, capture_id), store2.get(unit, var, capture_id)) for var in captures[capture_id])
+            similarity.add_state(unit, values, chunk_size)
+
+    return similarity
@@ -0,0 +1,70 @@
+import os
+from concurrent.futures import ProcessPoolExecutor
+from utilities.types.generic import Program, ProgramUnit
+from dynamic_analysis.breakpoints import Breakpoint, get_breakpoints
+from dynamic_analysis.capture import capture_example, load_states, get_states_filepath
+from dynamic_analysis.capture_policies import CapturePolicy, FirstN, EveryK, Reservoir, Deduplicate
+from dynamic_analysis.state_store import StateStore, ingest_states, parse_gdb_value
+
+
+def dynamic_analysis(program : Program, executable : str, examples : list[list[str]], storage_dirpath : str, programunits : list[ProgramUnit] = None,
+                     workers : int = None, gdb : str = "gdb", timeout : float = None, policy : CapturePolicy = None,
+                     store : StateStore = None) -> tuple[list[str], dict[str, tuple[int, int]], list[str]]:
+    """
+    Capture the input states of the procedures of a program by running its executable on each input example under gdb.
+    Each input example is run by its own gdb process in a pool of worker processes, so runs do not wait on each other,
+    and each run streams its states to its own states file.
+    A run that fails, such as one killed by the timeout, keeps the states it captured and is reported without stopping the other runs.
+
+    Args:
+        program (Program): Object representation of the program with resolved references
+        executable (str): Path to the executable of the program, compiled with debugging information
+        examples (list[list[str]]): Command line arguments of each input example
+        storage_dirpath (str): Directory to write the states file of each input example to
+        programunits (list[ProgramUnit], optional): Procedures to capture the input states of. Defaults to None (every procedure).
+        workers (int, optional): Number of worker processes, or None for one per CPU. Defaults to None.
+        gdb (str, optional): Command of the gdb executable. Defaults to "gdb".
+        timeout (float, optional): Seconds after which the run of an input example is killed. Defaults to None.
+        policy (CapturePolicy, optional): Policy that decides which hits are captured in each run, such as FirstN, EveryK, Reservoir,
+            or Deduplicate. Defaults to None (every hit).
+        store (StateStore, optional): Store to append the captured states to after every run, to read them by program unit,
+            variable, and capture without parsing the states files again. Defaults to None.
+
+    Returns:
+        filepaths (list[str]): Path to the states file of each input example, which is read with load_states()
+        counts (dict[str, tuple[int, int]]): Number of hits and number of captured states of each procedure, over every input example
+        errors (list[str]): Reason the run of each input example failed, or None if it exited
+    """
+    os.makedirs(storage_dirpath, exist_ok=True)
+    breakpoints = get_breakpoints(program, programunits)
+    filepaths = [get_states_filepath(storage_dirpath, i) for i in range(len(examples))]
+
+    # Run each input example in a worker process
+    if workers == 1:
+        results = [capture_example(executable, arguments, breakpoints, filepath, gdb, timeout, policy) for arguments, filepath in zip(examples, filepaths)]
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            futures = [executor.submit(capture_example, executable, arguments, breakpoints, filepath, gdb, timeout, policy) for arguments, filepath in zip(examples, filepaths)]
+            results = [__get_result(future) for future in futures]
+
+    # Sum the hits and captured states of each procedure
+    counts = {bp.key : (0, 0) for bp in breakpoints}
+    for result, _ in results:
+        for key, (hits, captures) in result.items():
+            counts[key] = (counts[key][0] + hits, counts[key][1] + captures)
+
+    # Ingest the states files that were written, including those of failed runs
+    if store is not None:
+        ingest_states(store, [filepath for filepath in filepaths if os.path.exists(filepath)])
+
+    return filepaths, counts, [error for _, error in results]
+
+
+def __get_result(future) -> tuple[dict[str, tuple[int, int]], str]:
+    """
+    Get the result of the run of an input example in a worker process, or no counts and the reason if the worker process failed
+    """
+    try:
+        return future.result()
+    except Exception as e:
+        return dict(), "worker process failed: {}".format(e)
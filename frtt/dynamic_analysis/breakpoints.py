@@ -0,0 +1,73 @@
+from utilities.types.generic import Program, ProgramUnit, Variable
+
+
+class Breakpoint:
+    """
+    Class that represents a breakpoint at the entry of a procedure, and the expressions that make up its input state.
+    The arguments of the procedure are listed by gdb when the breakpoint is hit, so only the variables it references
+    from other program units are evaluated as expressions.
+    """
+
+    __slots__ = ("key", "location", "expressions")
+
+    def __init__(self, key : str, location : str, expressions : list[tuple[str, str]]):
+        self.key = key                      # Name of the procedure qualified by the names of its parents, which identifies its input states
+        self.location = location            # Location of the breakpoint given to gdb
+        self.expressions = expressions      # Name and gdb expression of each variable referenced from another program unit
+
+
+def get_breakpoints(program : Program, programunits : list[ProgramUnit] = None) -> list[Breakpoint]:
+    """
+    Get a breakpoint at the entry of each procedure of a resolved program
+    :program: Object representation of a program with resolved references
+    :programunits: Procedures to get breakpoints for, or None for every function and subroutine of the program
+    :return: List of breakpoints, in the order of the program units of the program
+    """
+    if programunits is None:
+        programunits = [punit for punit in program.declared_programunits if punit.type != "module"]
+
+    # Map each declared variable to the program unit that declares it
+    owners : dict[Variable, ProgramUnit] = dict()
+    for punit in program.declared_programunits:
+        for var in punit.declared_variables:
+            owners[var] = punit
+
+    breakpoints = []
+    for punit in programunits:
+
+        # Variables of modules are qualified by the module, and variables of host procedures are in scope by name
+        expressions = []
+        names = set()
+        for var in punit.referenced_variables:
+            owner = owners.get(var)
+            if owner is None or owner is punit or var.name in names: continue
+            names.add(var.name)
+            if owner.type == "module":
+                expressions.append((var.name, "{}::{}".format(owner.name, var.name)))
+            else:
+                expressions.append((var.name, var.name))
+
+        breakpoints.append(Breakpoint(get_qualified_name(punit), get_location(punit), expressions))
+
+    return breakpoints
+
+
+def get_qualified_name(punit : ProgramUnit) -> str:
+    """
+    Get the name of a program unit qualified by the names of its parents, such as "module::procedure"
+    """
+    names = [punit.name]
+    while isinstance(punit.parent, ProgramUnit):
+        punit = punit.parent
+        names.append(punit.name)
+    return "::".join(reversed(names))
+
+
+def get_location(punit : ProgramUnit) -> str:
+    """
+    Get the gdb location of the entry of a procedure
+    Module procedures are qualified by their module, and other procedures are found by name
+    """
+    if isinstance(punit.parent, ProgramUnit) and punit.parent.type == "module":
+        return "{}::{}".format(punit.parent.name, punit.name)
+    return punit.name
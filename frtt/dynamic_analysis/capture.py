@@ -0,0 +1,155 @@
+import copy
+import marshal
+import os
+import shlex
+from dynamic_analysis.gdb_mi import GdbMI
+from dynamic_analysis.breakpoints import Breakpoint
+from dynamic_analysis.capture_policies import CapturePolicy
+
+# Reasons for which the inferior stopped that end a run
+EXIT_REASONS = frozenset(("exited-normally", "exited", "exited-signalled", "signal-received"))
+
+
+def capture_example(executable : str, arguments : list[str], breakpoints : list[Breakpoint], filepath : str, gdb : str = "gdb", timeout : float = None,
+                    policy : CapturePolicy = None) -> tuple[dict[str, tuple[int, int]], str]:
+    """
+    Run an executable on one input example under its own gdb process, and capture the input state at breakpoint hits.
+    States are written to the states file as they are captured, so memory use does not grow with the number of hits.
+    If the run fails, such as when gdb is killed by the timeout, the states captured so far are kept and the failure is returned.
+    :executable: Path to the executable
+    :arguments: Command line arguments of the input example
+    :breakpoints: Breakpoints at the entry of each procedure to capture
+    :filepath: Path to the states file to write
+    :gdb: Command of the gdb executable
+    :timeout: Seconds after which the run is killed, or None to never kill it
+    :policy: Policy that decides which hits are captured, which is copied for the run, or None to capture every hit
+    :return: Dictionary that maps the key of each breakpoint to its number of hits and number of captured states,
+             and the reason the run failed, or None if it exited
+    """
+    policy = copy.deepcopy(policy) if policy is not None else CapturePolicy()
+    hits = [0] * len(breakpoints)           # Number of hits of each breakpoint before its next stop
+    captures = [0] * len(breakpoints)
+    error = None
+    with open(filepath, 'wb') as f:
+        marshal.dump((list(arguments), [bp.key for bp in breakpoints]), f)
+
+        # Capture the states of the run, keeping those written before a failure
+        try:
+            with GdbMI(executable, gdb, timeout) as mi:
+                __run_example(mi, arguments, breakpoints, policy, hits, captures, f)
+        except Exception as e:
+            error = str(e)
+
+        # Write the states that the policy held back
+        keys = {bp.key : i for i, bp in enumerate(breakpoints)}
+        for key, hit, state in policy.finish():
+            marshal.dump((keys[key], hit, state), f)
+            captures[keys[key]] += 1
+
+    return {bp.key : (hit, capture) for bp, hit, capture in zip(breakpoints, hits, captures)}, error
+
+
+def __run_example(mi : GdbMI, arguments : list[str], breakpoints : list[Breakpoint], policy : CapturePolicy, hits : list[int], captures : list[int], f):
+    """
+    Run the inferior on an input example until it exits, writing the captured states to the states file
+    The number of hits and captured states of each breakpoint is updated in place, so that it is known when the run fails
+    """
+
+    # Print every element of arrays and strings
+    mi.command("-gdb-set confirm off")
+    mi.command("-gdb-set print elements unlimited")
+    mi.command("-gdb-set print repeats unlimited")
+    mi.command("-interpreter-exec console {}".format(__c_string("set args " + " ".join(shlex.quote(arg) for arg in arguments))))
+
+    # Insert each breakpoint, pending until its shared library is loaded if it is not found yet
+    indices = dict()
+    for i, bp in enumerate(breakpoints):
+        try:
+            results = mi.command("-break-insert -f {}".format(__c_string(bp.location)))
+        except Exception:
+            continue
+        indices[results["bkpt"]["number"]] = i
+
+    # Let gdb ignore the hits that the policy skips before the first stop
+    for number, i in indices.items():
+        hits[i] = __skip(mi, number, policy.next_skip(breakpoints[i].key))
+
+    # Capture the input state of the breakpoint hits that stop until the inferior exits
+    mi.command("-exec-run")
+    while True:
+        stop = mi.wait_stopped()
+        if stop.get("reason") in EXIT_REASONS:
+            break
+        number = stop.get("bkptno")
+        i = indices.get(number)
+        if i is not None:
+            key = breakpoints[i].key
+            state = __get_state(mi, breakpoints[i])
+            if policy.capture(key, hits[i], state):
+                marshal.dump((i, hits[i], state), f)
+                captures[i] += 1
+            hits[i] += 1 + __skip(mi, number, policy.next_skip(key))
+        mi.command("-exec-continue")
+
+    # Count the hits of each breakpoint as gdb does, including hits that were ignored after the last stop
+    for bkpt in mi.command("-break-list").get("BreakpointTable", dict()).get("body", []):
+        if bkpt.get("number") in indices and "times" in bkpt:
+            hits[indices[bkpt["number"]]] = int(bkpt["times"])
+
+
+def __skip(mi : GdbMI, number : str, skip : int) -> int:
+    """
+    Let gdb ignore a number of hits of a breakpoint before it stops again
+    :return: Number of hits that are ignored
+    """
+    if skip > 0:
+        mi.command("-break-after {} {}".format(number, skip))
+    return skip
+
+
+def load_states(filepath : str):
+    """
+    Iterate over the states of a states file
+    :filepath: Path to the states file
+    :return: Generator of the key of the breakpoint, the number of earlier hits of the breakpoint, and the state as a list of
+             (name, value) pairs, where value is the string printed by gdb or None if it could not be evaluated
+    """
+    with open(filepath, 'rb') as f:
+        _, keys = marshal.load(f)
+        while True:
+            try:
+                i, hit, state = marshal.load(f)
+            except EOFError:
+                return
+            yield keys[i], hit, state
+
+
+def get_states_filepath(storage_dirpath : str, example : int) -> str:
+    """
+    Get the path to the states file of an input example
+    """
+    return os.path.join(storage_dirpath, "example{}.states".format(example))
+
+
+def __get_state(mi : GdbMI, bp : Breakpoint) -> list[tuple[str, str]]:
+    """
+    Get the values of the arguments of the current frame, then the values of the other variables referenced by the procedure
+    """
+    state = []
+    frames = mi.command("-stack-list-arguments --all-values 0 0")["stack-args"]
+    for arg in frames[0]["args"] if frames else []:
+        state.append((arg["name"], arg.get("value")))
+    for name, expression in bp.expressions:
+        try:
+            value = mi.command("-data-evaluate-expression {}".format(__c_string(expression)))["value"]
+        except Exception:
+            value = None
+        state.append((name, value))
+    return state
+
+
+def __c_string(string : str) -> str:
+    """
+    Quote a string as a C string parameter of an MI command
+    """
+    return '"{}"'.format(string.replace('\\', '\\\\').replace('"', '\\"'))
@@ -0,0 +1,144 @@
+import hashlib
+import marshal
+import math
+import random
+
+# Number of hits that gdb ignores to never stop at a breakpoint again while still counting its hits
+NEVER = 2 ** 31 - 1
+
+
+class CapturePolicy:
+    """
+    Class that decides which hits of each breakpoint capture an input state. The base policy captures every hit.
+    A policy is copied for each run, and decides per breakpoint key.
+    Hits that a policy skips are ignored by gdb without stopping, so they cost no round trip to the debugger.
+    """
+
+    def next_skip(self, key : str) -> int:
+        """
+        Get the number of hits to skip before stopping at a breakpoint again
+        :key: Key of the breakpoint
+        :return: Number of hits, or NEVER to not stop at the breakpoint again
+        """
+        return 0
+
+    def capture(self, key : str, hit : int, state : list) -> bool:
+        """
+        Decide whether to write the state of a hit that stopped
+        :key: Key of the breakpoint
+        :hit: Number of earlier hits of the breakpoint
+        :state: Input state, as (name, value) pairs
+        :return: True to write the state now
+        """
+        return True
+
+    def finish(self) -> list[tuple[str, int, list]]:
+        """
+        Get the states that were held back until the end of the run
+        :return: List of the key of the breakpoint, the hit, and the state of each held back state
+        """
+        return []
+
+
+class FirstN(CapturePolicy):
+    """
+    Capture the first n hits of each breakpoint
+    """
+
+    def __init__(self, n : int):
+        self.n = n
+        self.captures : dict[str, int] = dict()     # Number of states captured of each breakpoint
+
+    def next_skip(self, key : str) -> int:
+        return 0 if self.captures.get(key, 0) < self.n else NEVER
+
+    def capture(self, key : str, hit : int, state : list) -> bool:
+        self.captures[key] = self.captures.get(key, 0) + 1
+        return True
+
+
+class EveryK(CapturePolicy):
+    """
+    Capture every k-th hit of each breakpoint, starting with the first
+    """
+
+    def __init__(self, k : int):
+        self.k = k
+        self.started : set[str] = set()     # Keys of the breakpoints whose first hit was captured
+
+    def next_skip(self, key : str) -> int:
+        return self.k - 1 if key in self.started else 0
+
+    def capture(self, key : str, hit : int, state : list) -> bool:
+        self.started.add(key)
+        return True
+
+
+class Reservoir(CapturePolicy):
+    """
+    Capture a uniform sample of n hits of each breakpoint by reservoir sampling.
+    The number of hits to skip until the next hit that enters the reservoir is drawn directly (Li's Algorithm L),
+    so only the hits that enter the reservoir stop.
+    """
+
+    def __init__(self, n : int, seed : int = None):
+        self.n = n
+        self.random = random.Random(seed)
+        self.reservoirs : dict[str, list] = dict()     # Sampled hits and states of each breakpoint
+        self.weights : dict[str, float] = dict()       # W of Algorithm L for each breakpoint with a full reservoir
+
+    def next_skip(self, key : str) -> int:
+        reservoir = self.reservoirs.get(key, [])
+        if len(reservoir) < self.n:
+            return 0
+        if key not in self.weights:
+            self.weights[key] = math.exp(math.log(self.__uniform()) / self.n)
+        return min(math.floor(math.log(self.__uniform()) / math.log(1 - self.weights[key])), NEVER)
+
+    def capture(self, key : str, hit : int, state : list) -> bool:
+        reservoir = self.reservoirs.setdefault(key, [])
+        if len(reservoir) < self.n:
+            reservoir.append((hit, state))
+        else:
+            reservoir[self.random.randrange(self.n)] = (hit, state)
+            self.weights[key] *= math.exp(math.log(self.__uniform()) / self.n)
+        return False
+
+    def finish(self) -> list[tuple[str, int, list]]:
+        return [(key, hit, state) for key, reservoir in self.reservoirs.items() for hit, state in sorted(reservoir, key=lambda sample : sample[0])]
+
+    def __uniform(self) -> float:
+        """
+        Draw from (0, 1), excluding the 0 of random() that has no logarithm
+        """
+        u = self.random.random()
+        while u == 0.0:
+            u = self.random.random()
+        return u
+
+
+class Deduplicate(CapturePolicy):
+    """
+    Capture the hits of each breakpoint whose input state differs from every state captured before, up to a limit.
+    Every hit stops so that its state can be hashed, and only the digest of each captured state is kept.
+    """
+
+    def __init__(self, limit : int = None):
+        """
+        :limit: Number of distinct states to capture of each breakpoint, or None for no limit
+        """
+        self.limit = limit
+        self.digests : dict[str, set[bytes]] = dict()      # Digests of the states captured of each breakpoint
+
+    def next_skip(self, key : str) -> int:
+        if self.limit is not None and len(self.digests.get(key, ())) >= self.limit:
+            return NEVER
+        return 0
+
+    def capture(self, key : str, hit : int, state : list) -> bool:
+        digests = self.digests.setdefault(key, set())
+        digest = hashlib.blake2b(marshal.dumps(state), digest_size=16).digest()
+        if digest in digests:
+            return False
+        digests.add(digest)
+        return True
@@ -0,0 +1,201 @@
+import re
+import threading
+from subprocess import DEVNULL, PIPE, Popen
+
+# Characters that end a run of plain characters in a C string
+SPECIAL_CHARS = re.compile(r'["\\]')
+
+# Escape sequences of the C strings in GDB/MI output
+ESCAPES = {'n' : '\n', 't' : '\t', 'r' : '\r', '"' : '"', '\\' : '\\', 'a' : '\a', 'b' : '\b', 'f' : '\f', 'v' : '\v'}
+
+
+class GdbMI:
+    """
+    Class that controls a gdb process through the GDB/MI interface.
+    Commands are sent one at a time and their result records are read synchronously,
+    while the asynchronous records that report where the inferior stopped are queued until they are waited for.
+    """
+
+    def __init__(self, executable : str, gdb : str = "gdb", timeout : float = None):
+        """
+        :executable: Path to the executable to debug
+        :gdb: Command of the gdb executable
+        :timeout: Seconds after which the gdb process is killed, or None to never kill it
+        """
+        self.process = Popen([gdb, "--interpreter=mi3", "--nx", "--quiet", executable], stdin=PIPE, stdout=PIPE, stderr=DEVNULL, text=True, bufsize=1)
+        self.token = 0                  # Token of the last command sent
+        self.stops = []                 # Results of the *stopped records that were not waited for yet
+        self.timeout = timeout
+        self.timed_out = False          # True once the timer killed the gdb process
+        self.timer = None               # Timer that kills the gdb process once the timeout passes
+        if timeout is not None:
+            self.timer = threading.Timer(timeout, self.__kill)
+            self.timer.daemon = True
+            self.timer.start()
+
+    def command(self, command : str) -> dict:
+        """
+        Send a command and wait for its result record
+        :command: MI command, such as "-exec-continue"
+        :return: Results of the ^done or ^running record
+        """
+        self.token += 1
+        try:
+            self.process.stdin.write("{}{}\n".format(self.token, command))
+            self.process.stdin.flush()
+        except OSError:
+            raise self.__get_exit_error()
+        while True:
+            token, kind, record_class, results = self.__read_record()
+            if kind == '^' and token == self.token:
+                if record_class == "error":
+                    raise Exception("gdb command {} failed: {}".format(command, results.get("msg")))
+                return results
+
+    def wait_stopped(self) -> dict:
+        """
+        Wait until the inferior stops
+        :return: Results of the *stopped record, whose "reason" is why the inferior stopped
+        """
+        while not self.stops:
+            self.__read_record()
+        return self.stops.pop(0)
+
+    def close(self):
+        """
+        Exit gdb, killing the inferior and gdb itself if they do not exit
+        """
+        if self.timer is not None:
+            self.timer.cancel()
+        if self.process.poll() is None:
+            try:
+                self.process.stdin.write("-gdb-exit\n")
+                self.process.stdin.flush()
+                self.process.wait(timeout=5)
+            except Exception:
+                self.process.kill()
+                self.process.wait()
+        try:
+            self.process.stdin.close()
+        except OSError:
+            pass
+        self.process.stdout.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+        return False
+
+    def __kill(self):
+        self.timed_out = True
+        self.process.kill()
+
+    def __get_exit_error(self) -> Exception:
+        """
+        Get the exception to raise once the gdb process exited, which tells whether the timer killed it
+        """
+        code = self.process.wait()
+        if self.timed_out:
+            return Exception("gdb was killed after the timeout of {} seconds".format(self.timeout))
+        return Exception("gdb exited unexpectedly with code {}".format(code))
+
+    def __read_record(self) -> tuple:
+        """
+        Read the next output record, queueing it if it is a *stopped record
+        :return: Token, kind, class, and results of the record, or kind None for stream records and prompts
+        """
+        line = self.process.stdout.readline()
+        if not line:
+            raise self.__get_exit_error()
+        record = parse_mi_record(line.rstrip('\n'))
+        if record[1] == '*' and record[2] == "stopped":
+            self.stops.append(record[3])
+        return record
+
+
+def parse_mi_record(line : str) -> tuple:
+    """
+    Parse a line of GDB/MI output
+    :line: Line without its newline
+    :return: Token (or None), kind ('^', '*', '+', '=', or None for stream records and prompts), class, and results
+    """
+
+    # Token of the command that the record answers
+    i = 0
+    while i < len(line) and line[i].isdigit():
+        i += 1
+    token = int(line[:i]) if i else None
+
+    # Stream records, prompts, and other output
+    if i >= len(line) or line[i] not in "^*+=":
+        return token, None, line, dict()
+
+    # Class of the record, followed by its results
+    kind = line[i]
+    j = line.find(',', i)
+    if j == -1:
+        return token, kind, line[i + 1:], dict()
+    results, _ = __parse_results(line, j + 1, None)
+    return token, kind, line[i + 1:j], results
+
+
+def __parse_results(line : str, i : int, end : str) -> tuple[dict, int]:
+    """
+    Parse comma separated results "variable=value" until the end of a tuple or the line
+    """
+    results = dict()
+    while i < len(line) and line[i] != end:
+        j = line.index('=', i)
+        results[line[i:j]], i = __parse_value(line, j + 1)
+        if i < len(line) and line[i] == ',':
+            i += 1
+    return results, i
+
+
+def __parse_value(line : str, i : int) -> tuple:
+    """
+    Parse a C string, tuple, or list starting at line[i]
+    :return: Value and the index after it
+    """
+    c = line[i]
+
+    # C string
+    if c == '"':
+        chars = []
+        i += 1
+        while True:
+            k = SPECIAL_CHARS.search(line, i).start()
+            chars.append(line[i:k])
+            if line[k] == '"':
+                return "".join(chars), k + 1
+
+            # Octal escape sequence, or a single escaped character
+            i = k + 1
+            k = i
+            while k < i + 3 and line[k] in "01234567":
+                k += 1
+            if k > i:
+                chars.append(chr(int(line[i:k], 8)))
+                i = k
+            else:
+                chars.append(ESCAPES.get(line[i], line[i]))
+                i += 1
+
+    # Tuple of results
+    if c == '{':
+        results, i = __parse_results(line, i + 1, '}')
+        return results, i + 1
+
+    # List of values, or of results whose names are dropped
+    values = []
+    i += 1
+    while line[i] != ']':
+        if line[i] not in "\"{[":
+            i = line.index('=', i) + 1
+        value, i = __parse_value(line, i)
+        values.append(value)
+        if line[i] == ',':
+            i += 1
+    return values, i + 1
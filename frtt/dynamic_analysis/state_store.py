@@ -0,0 +1,325 @@
+import json
+import os
+import re
+import tempfile
+import numpy as np
+from dynamic_analysis.capture import load_states
+
+# Name of the file that holds the type of each column of a store
+COLUMNS_FILENAME = "columns.json"
+
+# Columns that record where each capture came from, whose names cannot be Fortran names
+EXAMPLE_COLUMN = "_example"
+HIT_COLUMN = "_hit"
+
+# Tokens of the values that gdb prints for Fortran variables
+# Complex values are printed as "(re,im)", whereas the elements of arrays are separated by ", ", and NaNs are printed with their payload
+NUMBER = r"[+-]?(?:nan\(0x[0-9a-f]+\)|[^\s(),']+)"
+VALUE_TOKENS = re.compile(r"\s*(?:\(({0}),({0})\)|(\()|(\))|(,)|'((?:[^']|'')*)'|(\.TRUE\.|\.FALSE\.)|({0}))".format(NUMBER), re.IGNORECASE)
+INTEGER = re.compile(r"[+-]?[0-9]+")
+NAN_PAYLOAD = re.compile(r"\(0x[0-9a-f]+\)", re.IGNORECASE)
+
+
+class StateStore:
+    """
+    Class that stores the values of captured states in columns, with one column per variable of each program unit.
+    A column is a data file of contiguous values of one dtype, and an index file with one row per capture:
+    the capture id, the offset of its first value in the data file, and its dimensions.
+    Both files are only appended to, and are memory-mapped for reading, so reading a value copies nothing.
+    Appended values are buffered per column and written by flush(), which reading a column does first.
+    The dtype of a column is promoted, such as from integer to real, if a later value does not fit it.
+    """
+
+    def __init__(self, dirpath : str):
+        """
+        :dirpath: Directory of the store, which is created if it does not exist
+        """
+        self.dirpath = dirpath
+        os.makedirs(dirpath, exist_ok=True)
+        columns_filepath = os.path.join(dirpath, COLUMNS_FILENAME)
+        self.columns : dict[str, dict[str, dict]] = dict()      # Dtype and number of dimensions of each column of each program unit
+        if os.path.exists(columns_filepath):
+            with open(columns_filepath) as f:
+                self.columns = json.load(f)
+        self.maps = dict()                                       # Memory maps of the index and data file of each column, and the file sizes they map
+        self.tails = dict()                                      # Number of values in the data file and last capture id of each column, including buffered values
+        self.buffers = dict()                                    # Values and index rows of each column that are not written yet
+
+    def append(self, unit : str, capture_id : int, state : dict):
+        """
+        Append the values of a captured state, creating the columns of new variables
+        :unit: Key of the program unit
+        :capture_id: Id of the capture, which is greater than the ids of earlier captures of the program unit
+        :state: Value of each variable, as a number, string, bool, or array
+        The values are buffered until flush() is called or their columns are read
+        """
+        columns = self.columns.setdefault(unit, dict())
+        changed = False
+        for name, value in state.items():
+            if isinstance(value, str):
+                kind, value = "str", np.frombuffer(value.encode(), dtype=np.uint8)
+            else:
+                kind, value = "array", np.asarray(value)
+            column = columns.get(name)
+            if column is None:
+                column = columns[name] = {"kind" : kind, "dtype" : value.dtype.str, "ndim" : value.ndim}
+                changed = True
+            if kind != column["kind"] or value.ndim != column["ndim"]:
+                raise Exception("Value of {} in {} does not match its column: {}".format(name, unit, value))
+            if not np.can_cast(value.dtype, np.dtype(column["dtype"]), 'safe'):
+                self.__promote_column(unit, name, column, value.dtype)
+                changed = True
+            self.__append_value(unit, name, column, capture_id, value)
+        if changed:
+            self.__save_columns()
+
+    def flush(self):
+        """
+        Write the buffered values of every column
+        """
+        for unit, variable in list(self.buffers):
+            self.__flush_column(unit, variable)
+
+    def next_capture_id(self, unit : str) -> int:
+        """
+        Get the id after the ids of every capture of a program unit
+        """
+        return max((int(self.capture_ids(unit, variable)[-1]) + 1 for variable in self.variables(unit) if len(self.capture_ids(unit, variable))), default=0)
+
+    def units(self) -> list[str]:
+        return list(self.columns)
+
+    def variables(self, unit : str) -> list[str]:
+        return list(self.columns.get(unit, dict()))
+
+    def capture_ids(self, unit : str, variable : str) -> np.ndarray:
+        """
+        Get the ids of the captures that have a value of a variable, in increasing order
+        """
+        index, _ = self.__get_maps(unit, variable)
+        return index[:, 0]
+
+    def get(self, unit : str, variable : str, capture_id : int):
+        """
+        Get the value of a variable in a capture
+        :return: Array that views the data file, or str for character variables
+        """
+        index, data = self.__get_maps(unit, variable)
+        i = np.searchsorted(index[:, 0], capture_id)
+        if i == len(index) or index[i, 0] != capture_id:
+            raise KeyError((unit, variable, capture_id))
+        shape = tuple(index[i, 2:])
+        value = data[index[i, 1]:index[i, 1] + int(np.prod(shape))].reshape(shape)
+        if self.columns[unit][variable]["kind"] == "str":
+            return value.tobytes().decode()
+        return value
+
+    def values(self, unit : str, variable : str) -> np.ndarray:
+        """
+        Get the values of a variable in every capture as one array, whose first axis is in the order of capture_ids()
+        The values of every capture must have the same dimensions
+        :return: Array that views the data file
+        """
+        index, data = self.__get_maps(unit, variable)
+        if len(index) == 0:
+            return data[:0]
+        shape = index[0, 2:]
+        if not (index[:, 2:] == shape).all():
+            raise Exception("Values of {} in {} have different dimensions".format(variable, unit))
+        return data.reshape((len(index),) + tuple(shape))
+
+    def __append_value(self, unit : str, variable : str, column : dict, capture_id : int, value : np.ndarray):
+        """
+        Buffer a value of a column, and its row of the index file
+        """
+        tail = self.tails.get((unit, variable))
+        if tail is None:
+            tail = self.tails[(unit, variable)] = self.__read_tail(unit, variable, column)
+
+        # Capture ids are increasing so that captures are found by binary search
+        if tail[1] is not None and tail[1] >= capture_id:
+            raise Exception("Capture {} of {} in {} is not after the last capture".format(capture_id, variable, unit))
+
+        values, rows = self.buffers.setdefault((unit, variable), ([], []))
+        values.append(value)
+        rows.append((capture_id, tail[0]) + value.shape)
+        tail[0] += value.size
+        tail[1] = capture_id
+
+    def __read_tail(self, unit : str, variable : str, column : dict) -> list:
+        """
+        Get the number of values in the data file of a column, and the id of its last capture, or None if it has none
+        """
+        data_filepath, index_filepath = self.__get_filepaths(unit, variable)
+        count = os.path.getsize(data_filepath) // np.dtype(column["dtype"]).itemsize if os.path.exists(data_filepath) else 0
+        row_size = (2 + column["ndim"]) * 8
+        if not os.path.exists(index_filepath) or os.path.getsize(index_filepath) < row_size:
+            return [count, None]
+        with open(index_filepath, 'rb') as f:
+            f.seek(-row_size, os.SEEK_END)
+            return [count, int(np.frombuffer(f.read(8), dtype=np.int64)[0])]
+
+    def __flush_column(self, unit : str, variable : str):
+        """
+        Append the buffered values of a column to its data file, and their rows to its index file
+        """
+        buffer = self.buffers.pop((unit, variable), None)
+        if buffer is None:
+            return
+        values, rows = buffer
+        dtype = np.dtype(self.columns[unit][variable]["dtype"])
+        data_filepath, index_filepath = self.__get_filepaths(unit, variable)
+        with open(data_filepath, 'ab') as f:
+            for value in values:
+                f.write(np.asarray(value, dtype=dtype).tobytes())
+        with open(index_filepath, 'ab') as f:
+            for row in rows:
+                f.write(np.array(row, dtype=np.int64).tobytes())
+
+    def __promote_column(self, unit : str, variable : str, column : dict, dtype : np.dtype):
+        """
+        Promote the dtype of a column to one that also fits values of another dtype, converting the values in its data file
+        Offsets in the index file count values, so they do not change
+        """
+        self.__flush_column(unit, variable)
+        old_dtype = np.dtype(column["dtype"])
+        new_dtype = np.promote_types(old_dtype, dtype)
+        data_filepath, _ = self.__get_filepaths(unit, variable)
+        if os.path.exists(data_filepath):
+            data = np.fromfile(data_filepath, dtype=old_dtype).astype(new_dtype)
+            fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(data_filepath), suffix=".tmp")
+            try:
+                with os.fdopen(fd, 'wb') as f:
+                    f.write(data.tobytes())
+                os.replace(tmp_path, data_filepath)
+            except BaseException:
+                os.remove(tmp_path)
+                raise
+        column["dtype"] = new_dtype.str
+        self.maps.pop((unit, variable), None)
+
+    def __get_maps(self, unit : str, variable : str) -> tuple[np.ndarray, np.ndarray]:
+        """
+        Get the memory maps of the index and data file of a column, mapping them again if they were appended to
+        """
+        column = self.columns.get(unit, dict()).get(variable)
+        if column is None:
+            raise KeyError((unit, variable))
+        self.__flush_column(unit, variable)
+        data_filepath, index_filepath = self.__get_filepaths(unit, variable)
+        sizes = (os.path.getsize(index_filepath), os.path.getsize(data_filepath))
+        maps = self.maps.get((unit, variable))
+        if maps is None or maps[2] != sizes:
+            index = np.memmap(index_filepath, dtype=np.int64, mode='r') if sizes[0] else np.zeros(0, dtype=np.int64)
+            data = np.memmap(data_filepath, dtype=np.dtype(column["dtype"]), mode='r') if sizes[1] else np.zeros(0, dtype=np.dtype(column["dtype"]))
+            maps = self.maps[(unit, variable)] = (index.reshape(-1, 2 + column["ndim"]), data, sizes)
+        return maps[0], maps[1]
+
+    def __get_filepaths(self, unit : str, variable : str) -> tuple[str, str]:
+        """
+        Get the paths to the data file and index file of a column
+        """
+        dirpath = os.path.join(self.dirpath, unit.replace("::", "."))
+        os.makedirs(dirpath, exist_ok=True)
+        return os.path.join(dirpath, variable + ".data"), os.path.join(dirpath, variable + ".index")
+
+    def __save_columns(self):
+        """
+        Write the types of the columns to a temporary file that replaces the columns file
+        """
+        fd, tmp_path = tempfile.mkstemp(dir=self.dirpath, suffix=".tmp")
+        try:
+            with os.fdopen(fd, 'w') as f:
+                json.dump(self.columns, f)
+            os.replace(tmp_path, os.path.join(self.dirpath, COLUMNS_FILENAME))
+        except BaseException:
+            os.remove(tmp_path)
+            raise
+
+
+def parse_gdb_value(value : str):
+    """
+    Parse the value of a Fortran variable as printed by gdb
+    Numbers without a decimal point or exponent are parsed as ints, so integer(8) values keep their precision,
+    although gdb also prints whole real values without them, which the store promotes to reals once the column has a real value
+    Arrays are printed as nested parentheses with the first dimension innermost, and are returned with the first dimension first
+    :value: Value printed by gdb
+    :return: int, float, complex, bool, str, or array, or None if the value cannot be parsed
+    """
+    tokens = []
+    i, end = 0, len(value.rstrip())
+    while i < end:
+        match = VALUE_TOKENS.match(value, i)
+        if match is None:
+            return None
+        tokens.append(match)
+        i = match.end()
+    try:
+        parsed, i = __parse_value_tokens(tokens, 0)
+        if i != len(tokens):
+            return None
+    except (ValueError, IndexError):
+        return None
+
+    # Nested lists are arrays, whose innermost list is the first dimension
+    if isinstance(parsed, list):
+        return np.asarray(parsed).transpose()
+    return parsed
+
+
+def __parse_value_tokens(tokens : list, i : int) -> tuple:
+    """
+    Parse a scalar, or a parenthesized list of values, starting at tokens[i]
+    """
+    real, imag, opening, _, _, string, logical, scalar = tokens[i].groups()
+    if real is not None:
+        return complex(__parse_real(real), __parse_real(imag)), i + 1
+    if opening:
+        values = []
+        i += 1
+        while not tokens[i].group(4):
+            if tokens[i].group(5):
+                i += 1
+                continue
+            value, i = __parse_value_tokens(tokens, i)
+            values.append(value)
+        return values, i + 1
+    if string is not None:
+        return string.replace("''", "'"), i + 1
+    if logical:
+        return logical.upper() == ".TRUE.", i + 1
+    if INTEGER.fullmatch(scalar):
+        return int(scalar), i + 1
+    return __parse_real(scalar), i + 1
+
+
+def __parse_real(scalar : str) -> float:
+    """
+    Parse a real number, including infinities and NaNs, whose payload gdb prints in parentheses
+    """
+    return float(NAN_PAYLOAD.sub("", scalar))
+
+
+def ingest_states(store : StateStore, filepaths : list[str]):
+    """
+    Append the states of the states files of input examples to a store.
+    Captures are numbered per program unit after the captures already in the store, and the input example and hit of each capture
+    are stored in the EXAMPLE_COLUMN and HIT_COLUMN columns. Values that could not be evaluated or parsed are left out of their capture.
+    :store: Store to append to
+    :filepaths: Path to the states file of each input example, in the order of the input examples
+    """
+    capture_ids = dict()
+    for example, filepath in enumerate(filepaths):
+        for unit, hit, state in load_states(filepath):
+            if unit not in capture_ids:
+                capture_ids[unit] = store.next_capture_id(unit)
+            values = dict()
+            for name, value in state:
+                value = parse_gdb_value(value) if value is not None else None
+                if value is not None:
+                    values[name] = value
+            values[EXAMPLE_COLUMN] = example
+            values[HIT_COLUMN] = hit
+            store.append(unit, capture_ids[unit], values)
+            capture_ids[unit] += 1
+    store.flush()
@@ -1,17 +1,31 @@
+import os
 from utilities.types.generic import Program
-from static_analysis.parsing import parsing
+from utilities.types.isomorphism import Isomorphism
+from static_analysis.parsing import parsing, parallel_parsing
 from static_analysis.resolution import resolution
 from static_analysis.isomorphism import isomorphism
+from static_analysis.incremental import incremental_analysis
 
-def static_analysis(filepaths1 : list[str], filepaths2 : list[str]) -> tuple[Program, Program, dict]:
+def static_analysis(filepaths1 : list[str], filepaths2 : list[str], cache_dirpath : str = None, workers : int = 1, state_dirpath : str = None,
+                    discard : set[str] = None, lazy : bool = False) -> tuple[Program, Program, Isomorphism]:
 
-    # Run the parsing phase
-    program1 = parsing(filepaths1)
-    program2 = parsing(filepaths2)
-    
-    # Run the resolution phase
-    resolution(program1)
-    resolution(program2)
+    # Run the parsing and resolution phases incrementally from the programs saved by the previous run
+    if state_dirpath is not None:
+        program1 = incremental_analysis(filepaths1, os.path.join(state_dirpath, "program1.state"), cache_dirpath, workers, discard, lazy)
+        program2 = incremental_analysis(filepaths2, os.path.join(state_dirpath, "program2.state"), cache_dirpath, workers, discard, lazy)
+
+    else:
+
+        # Run the parsing phase, parsing both programs in one pool of worker processes if parallel
+        if workers != 1:
+            program1, program2 = parallel_parsing([filepaths1, filepaths2], cache_dirpath, workers, discard, lazy)
+        else:
+            program1 = parsing(filepaths1, cache_dirpath, discard=discard, lazy=lazy)
+            program2 = parsing(filepaths2, cache_dirpath, discard=discard, lazy=lazy)
+        
+        # Run the resolution phase
+        resolution(program1)
+        resolution(program2)
     
     # Run the isomorphism phase
     mapping = isomorphism(program1, program2)
@@ -0,0 +1,161 @@
+from utilities.types.generic import Program, ProgramUnit
+from static_analysis.parsing import parse_file, parallel_parsing, add_programunits
+from static_analysis.resolution.module_resolution import resolve_modules
+from static_analysis.resolution.procedure_resolution import resolve_procedures
+from static_analysis.resolution.variable_resolution import resolve_variables
+from static_analysis.resolution.dependency_resolution import resolve_dependencies
+from static_analysis.incremental.analysis_state import FileRecord, get_file_record, save_state, load_state, add_global_name
+
+
+def incremental_analysis(filepaths : list[str], state_filepath : str, cache_dirpath : str = None, workers : int = 1, discard : set[str] = None,
+                         lazy : bool = False) -> Program:
+    """
+    Parse and resolve the source files in a program, reusing the program saved by the previous run.
+    Only the source files whose content changed are parsed again, and only the program units that could resolve differently are resolved again.
+    The result is the same as parsing() followed by resolution().
+
+    Args:
+        filepaths (list[str]): List of the paths to each source file in a program
+        state_filepath (str): File that holds the program and the state of its source files between runs
+        cache_dirpath (str, optional): Directory of the persistent parse tree cache. Defaults to None.
+        workers (int, optional): Number of worker processes, or None for one per CPU. Defaults to 1 (serial).
+        discard (set[str], optional): Labels whose nodes are built without their subtrees, such as LITERAL_LABELS. Defaults to None (every subtree).
+        lazy (bool, optional): Build and parse the subtree of one program unit at a time, as parse_file() does. Defaults to False.
+
+    Returns:
+        program (Program): Object representation of a program with resolved references
+    """
+
+    # Load the program of the previous run, unless it was parsed with other options
+    options = {"discard" : sorted(discard or ()), "lazy" : lazy}
+    old_program, old_files = load_state(state_filepath, options)
+    if old_program is None:
+        old_program, old_files = Program(), dict()
+
+    # Find the source files whose content changed since the previous run
+    files = dict()
+    changed_filepaths = []
+    for filepath in filepaths:
+        old_record = old_files.get(filepath)
+        files[filepath] = get_file_record(filepath, old_record)
+        if old_record is None or files[filepath].digest != old_record.digest:
+            changed_filepaths.append(filepath)
+
+    # Group the program units of the previous run by source file
+    old_programunits = dict()
+    for punit in old_program.declared_programunits:
+        old_programunits.setdefault(punit.filepath, []).append(punit)
+
+    # Source files that were removed or changed, whose program units of the previous run are replaced
+    stale_filepaths = set(old_programunits).difference(filepaths).union(changed_filepaths)
+    stale_programunits = [punit for filepath in stale_filepaths for punit in old_programunits.get(filepath, [])]
+
+    # Reuse the program of the previous run if no source file was added, removed, or changed
+    if not stale_filepaths and list(old_programunits) == [filepath for filepath in filepaths if filepath in old_programunits]:
+        if old_files != files:
+            save_state(state_filepath, old_program, files, options)
+        resolve_dependencies(old_program)
+        return old_program
+
+    # Parse the source files that changed
+    parsed_programunits = __parse_files(changed_filepaths, cache_dirpath, workers, discard, lazy)
+
+    # Assemble the program in the same order as a full run, reusing the program units of unchanged source files
+    program = Program()
+    for filepath in filepaths:
+        for punit in parsed_programunits.get(filepath, old_programunits.get(filepath, [])):
+            program.declared_programunits.append(punit)
+            add_global_name(program, punit)
+    new_programunits = [punit for filepath in changed_filepaths for punit in parsed_programunits[filepath]]
+
+    # Names declared by the program units that were replaced or added
+    changed_names = set()
+    for punit in stale_programunits + new_programunits:
+        changed_names.add(punit.name)
+        changed_names.update(punit.declared_variables_map)
+
+    # Resolve the module references of new program units, and of program units that reference a module that was replaced or added
+    affected = set(new_programunits)
+    affected.update(punit for punit in program.declared_programunits if not punit.referenced_module_names.isdisjoint(changed_names))
+    module_programunits = [punit for punit in program.declared_programunits if punit in affected]
+    for punit in module_programunits:
+        punit.referenced_modules = []
+    resolve_modules(program, module_programunits)
+
+    # Resolve the procedure and variable references of program units whose local scope hierarchy includes an affected program unit,
+    # or that reference a name that was declared by a program unit that was replaced or added
+    affected = __get_dependent_scopes(program, affected)
+    affected.update(punit for punit in program.declared_programunits if not punit.referenced_procedure_names.isdisjoint(changed_names))
+    affected.update(punit for punit in program.declared_programunits if not punit.referenced_names.isdisjoint(changed_names))
+    reference_programunits = [punit for punit in program.declared_programunits if punit in affected]
+    for punit in reference_programunits:
+        punit.referenced_procedures = []
+        punit.referenced_variables = []
+    resolve_procedures(program, reference_programunits)
+    resolve_variables(program, reference_programunits)
+
+    # Rebuild the dependency graph, which is linear in the number of references
+    resolve_dependencies(program)
+
+    save_state(state_filepath, program, files, options)
+    return program
+
+
+def __parse_files(filepaths : list[str], cache_dirpath : str, workers : int, discard : set[str], lazy : bool) -> dict[str, list[ProgramUnit]]:
+    """
+    Parse the program units of each source file, including subprograms, in the order that parsing() adds them to a program
+
+    Args:
+        filepaths (list[str]): List of the paths to each source file
+        cache_dirpath (str): Directory of the persistent parse tree cache, or None
+        workers (int): Number of worker processes, or None for one per CPU
+        discard (set[str]): Labels whose nodes are built without their subtrees, or None
+        lazy (bool): Whether to build and parse the subtree of one program unit at a time
+
+    Returns:
+        dict[str, list[ProgramUnit]]: Dictionary that maps each source file to its parsed program units
+    """
+
+    # Parse the source files in worker processes
+    if workers != 1 and len(filepaths) > 1:
+        programs = parallel_parsing([[filepath] for filepath in filepaths], cache_dirpath, workers, discard, lazy)
+
+    # Parse the source files serially
+    else:
+        programs = []
+        for filepath in filepaths:
+            programs.append(Program())
+            add_programunits(programs[-1], filepath, parse_file(filepath, cache_dirpath, lazy, discard))
+
+    return {filepath : program.declared_programunits for filepath, program in zip(filepaths, programs)}
+
+
+def __get_dependent_scopes(program : Program, programunits : set[ProgramUnit]) -> set[ProgramUnit]:
+    """
+    Get the program units whose local scope hierarchy includes one of a set of program units.
+    The local scope hierarchy of a program unit is reached through referenced modules and parent program units.
+
+    Args:
+        program (Program): Object representation of a program with resolved module references
+        programunits (set[ProgramUnit]): Program units to find the dependents of
+
+    Returns:
+        set[ProgramUnit]: Program units that reach one of programunits, including programunits
+    """
+
+    # Reverse the edges from each program unit to its referenced modules and declared procedures
+    dependents = dict()
+    for punit in program.declared_programunits:
+        for module in punit.referenced_modules:
+            dependents.setdefault(module, []).append(punit)
+        dependents.setdefault(punit, []).extend(punit.declared_procedures)
+
+    # Breadth first search the dependents of each program unit
+    reached = [punit for punit in program.declared_programunits if punit in programunits]
+    visited = set(reached)
+    for punit in reached:
+        for dependent in dependents.get(punit, []):
+            if dependent not in visited:
+                visited.add(dependent)
+                reached.append(dependent)
+    return visited
@@ -0,0 +1,77 @@
+import hashlib
+import os
+from utilities.types.generic import Program, ProgramUnit
+from utilities.snapshot import save_snapshot, read_snapshot
+
+# Version of the layout of a state file, which invalidates state files written by other versions
+STATE_VERSION = 2
+
+
+class FileRecord:
+    """
+    Class that represents the state of a source file when it was last parsed.
+    """
+
+    __slots__ = ("mtime", "size", "digest")
+
+    def __init__(self, mtime : int, size : int, digest : str):
+        self.mtime = mtime          # Modification time of the source file in nanoseconds
+        self.size = size            # Size of the source file in bytes
+        self.digest = digest        # Hex digest of the content of the source file
+
+
+def get_file_record(filepath : str, record : FileRecord = None) -> FileRecord:
+    """
+    Get the state of a source file, only hashing its content if its modification time or size differ from a previous record
+    :filepath: Path to the source file
+    :record: Previous state of the source file, or None if it was not parsed before
+    :rvalue: Current state of the source file
+    """
+    stat = os.stat(filepath)
+    if record is not None and record.mtime == stat.st_mtime_ns and record.size == stat.st_size:
+        return record
+    digest = hashlib.sha256()
+    with open(filepath, 'rb') as f:
+        for chunk in iter(lambda : f.read(1 << 20), b""):
+            digest.update(chunk)
+    return FileRecord(stat.st_mtime_ns, stat.st_size, digest.hexdigest())
+
+
+def save_state(filepath : str, program : Program, files : dict[str, FileRecord], options : dict = None):
+    """
+    Save a resolved program and the state of its source files, as a snapshot file whose metadata is the state of the source files
+    :filepath: Path to the state file, which is replaced atomically
+    :program: Resolved object representation of a program
+    :files: State of each source file of the program
+    :options: Options that the program was parsed with, which marshal can encode, or None
+    """
+    records = {filepath : (record.mtime, record.size, record.digest) for filepath, record in files.items()}
+    save_snapshot(program, filepath, (STATE_VERSION, records, options))
+
+
+def load_state(filepath : str, options : dict = None) -> tuple[Program, dict[str, FileRecord]]:
+    """
+    Load a resolved program and the state of its source files
+    Every program unit is loaded whole, since the program units of unchanged source files are resolved again in place
+    :filepath: Path to the state file
+    :options: Options that the program must have been parsed with, or None
+    :rvalue: Program and the state of each of its source files, or (None, None) if there is no state file of the current version and options
+    """
+    try:
+        program, (version, records, saved_options) = read_snapshot(filepath, lazy=False)
+    except Exception:
+        return None, None
+    if version != STATE_VERSION or saved_options != options:
+        return None, None
+    return program, {filepath : FileRecord(*record) for filepath, record in records.items()}
+
+
+def add_global_name(program : Program, punit : ProgramUnit):
+    """
+    Map the name of a program unit declared at the global scope to the program unit, as parsing does
+    """
+    if punit.parent is None:
+        if punit.type == "module":
+            program.declared_modules_map[punit.name] = punit
+        else:
+            program.declared_procedures_map[punit.name] = punit
@@ -1,4 +1,246 @@
+from utilities.types.generic import Program, ProgramUnit
 from utilities.types.isomorphism import Isomorphism
+from static_analysis.isomorphism.reference_graph import ReferenceGraph, EDGE_ATTRIBUTES
+from static_analysis.isomorphism.neighborhood_matching import match_neighborhoods
 
-def isomorphism(program1, program2) -> Isomorphism:
-    return None
\ No newline at end of file
+# Buckets with at most this many nodes of each program are matched exactly
+EXACT_MATCHING_LIMIT = 8
+
+# Edge labels from a variable or program unit to the program unit that declares it
+OWNER_LABELS = (-(EDGE_ATTRIBUTES.index("declared_procedures") + 1), -(EDGE_ATTRIBUTES.index("declared_variables") + 1))
+
+# Edge label from a program unit to the variables it declares
+DECLARED_VARIABLE_LABEL = EDGE_ATTRIBUTES.index("declared_variables")
+
+
+def isomorphism(program1 : Program, program2 : Program) -> Isomorphism:
+    """
+    Match the program units and variables of two programs by the structure of their reference graphs.
+    Nodes are colored by iterated Weisfeiler-Lehman refinement over both programs at once, and only nodes of equal color are matched.
+    Buckets of equally colored nodes are matched from smallest to largest:
+    small buckets by exact matching of neighborhoods, and large buckets by declaring program unit and name.
+    Local variables do not color their program units, but break ties between program units of equal color.
+    Nodes that are left unmatched, such as those of a program unit whose input or output state differs, are then matched by the colors
+    of earlier rounds of refinement, and local variables are matched within the program units that declare them.
+
+    Args:
+        program1 (Program): Object representation of the first program, with resolved references
+        program2 (Program): Object representation of the second program, with resolved references
+
+    Returns:
+        Isomorphism: Mappings from the program units and variables of program1 to those of program2
+    """
+
+    # Color the nodes of both programs in one reference graph
+    graph = ReferenceGraph([program1, program2])
+    graph.refine()
+
+    # Bucket the nodes of each program by color, with program units before variables
+    buckets = dict()
+    for i, node in enumerate(graph.nodes):
+        if i in graph.locals: continue
+        key = (not isinstance(node, ProgramUnit), graph.colors[i])
+        if key not in buckets:
+            buckets[key] = ([], [])
+        buckets[key][graph.programs[i]].append(i)
+
+    # Describe the local variables of each program unit by their initial colors and the edges to them
+    locals_signatures = dict()
+    for i, owner in graph.locals.items():
+        locals_signatures.setdefault(owner, []).append((graph.rounds[0][i], graph.local_labels.get(i, ())))
+    for owner, signature in locals_signatures.items():
+        locals_signatures[owner] = tuple(sorted(signature))
+
+    # Match the buckets that have nodes in both programs, from smallest to largest
+    # Program units with equal local variables are matched first, then the rest of the bucket
+    forward = dict()
+    backward = dict()
+    for key in sorted(buckets, key=lambda key : (key[0], max(len(buckets[key][0]), len(buckets[key][1])), key[1])):
+        nodes1, nodes2 = buckets[key]
+        if not nodes1 or not nodes2: continue
+        if not key[0]:
+            groups = dict()
+            for i in nodes1 + nodes2:
+                groups.setdefault(locals_signatures.get(i, ()), ([], []))[graph.programs[i]].append(i)
+            if len(groups) > 1:
+                for group1, group2 in groups.values():
+                    if group1 and group2:
+                        __match_bucket(graph, group1, group2, forward, backward)
+        __match_bucket(graph, nodes1, nodes2, forward, backward)
+
+    # Match the nodes that are left by the colors of earlier rounds, from finest to coarsest
+    for colors in reversed(graph.rounds[:-1]):
+        __match_partially(graph, colors, forward, backward)
+
+    # Match the local variables of each matched program unit by their initial color and the edges to them
+    groups = dict()
+    for i, owner in graph.locals.items():
+        owner = owner if graph.programs[i] == 0 else backward.get(owner)
+        if owner in forward:
+            groups.setdefault((owner, graph.rounds[0][i], graph.local_labels.get(i)), ([], []))[graph.programs[i]].append(i)
+    for nodes1, nodes2 in groups.values():
+        __match_by_name(graph, nodes1, nodes2, forward, backward)
+
+    # Fill the mappings in the order of the first program
+    result = Isomorphism()
+    for i in sorted(forward):
+        if isinstance(graph.nodes[i], ProgramUnit):
+            result.programunit_map[graph.nodes[i]] = graph.nodes[forward[i]]
+        else:
+            result.variable_map[graph.nodes[i]] = graph.nodes[forward[i]]
+
+    return result
+
+
+def __match_bucket(graph : ReferenceGraph, nodes1 : list[int], nodes2 : list[int], forward : dict[int, int], backward : dict[int, int]):
+    """
+    Match the unmatched nodes of a bucket exactly if it is small, or by declaring program unit and name otherwise
+    """
+    if len(nodes1) <= EXACT_MATCHING_LIMIT and len(nodes2) <= EXACT_MATCHING_LIMIT:
+        __match_exactly(graph, nodes1, nodes2, forward, backward)
+    else:
+        __match_by_owner(graph, nodes1, nodes2, forward, backward)
+
+
+def __match_exactly(graph : ReferenceGraph, nodes1 : list[int], nodes2 : list[int], forward : dict[int, int], backward : dict[int, int]):
+    """
+    Match the nodes of a small bucket whose neighborhoods match exactly, trying pairs with equal names first.
+    The variables declared by each matched program unit are matched along with it.
+
+    Args:
+        graph (ReferenceGraph): Reference graph with refined colors
+        nodes1 (list[int]): Ids of the nodes of the first program in the bucket
+        nodes2 (list[int]): Ids of the nodes of the second program in the bucket
+        forward (dict[int, int]): Nodes of the first program that are matched, mapped to their match
+        backward (dict[int, int]): Nodes of the second program that are matched, mapped to their match
+    """
+
+    # A node that is alone in its color in both programs has only one possible match
+    if len(nodes1) == 1 and len(nodes2) == 1:
+        i1, i2 = nodes1[0], nodes2[0]
+        if i1 not in forward and i2 not in backward:
+            __add_match(i1, i2, forward, backward)
+        return
+
+    pairs = [(i1, i2) for i1 in nodes1 for i2 in nodes2]
+    pairs.sort(key=lambda pair : (graph.nodes[pair[0]].name != graph.nodes[pair[1]].name, pair))
+    for i1, i2 in pairs:
+        if i1 in forward or i2 in backward: continue
+        mapping = match_neighborhoods(graph, i1, i2, forward, backward)
+        if mapping is None: continue
+        __add_match(i1, i2, forward, backward)
+
+        # Match the declared variables as they were matched in the neighborhood
+        for a, labels in graph.neighborhood(i1).items():
+            if DECLARED_VARIABLE_LABEL in labels and a not in forward and mapping[a] not in backward:
+                __add_match(a, mapping[a], forward, backward)
+
+
+def __match_by_owner(graph : ReferenceGraph, nodes1 : list[int], nodes2 : list[int], forward : dict[int, int], backward : dict[int, int]):
+    """
+    Match the nodes of a large bucket whose declaring program units are matched, then the rest of the bucket.
+    Nodes of equal color cannot be told apart by refinement, so within each group nodes with equal names are matched first,
+    and the remaining nodes are matched in order of name.
+
+    Args:
+        graph (ReferenceGraph): Reference graph with refined colors
+        nodes1 (list[int]): Ids of the nodes of the first program in the bucket
+        nodes2 (list[int]): Ids of the nodes of the second program in the bucket
+        forward (dict[int, int]): Nodes of the first program that are matched, mapped to their match
+        backward (dict[int, int]): Nodes of the second program that are matched, mapped to their match
+    """
+
+    # Group the nodes by the match of their owner in the second program
+    groups = dict()
+    for i1 in nodes1:
+        owner = forward.get(__get_owner(graph, i1))
+        if owner is not None:
+            groups.setdefault(owner, ([], []))[0].append(i1)
+    for i2 in nodes2:
+        owner = __get_owner(graph, i2)
+        if owner in groups:
+            groups[owner][1].append(i2)
+
+    # Match each group, then the nodes that are left in the bucket
+    for group1, group2 in groups.values():
+        __match_by_name(graph, group1, group2, forward, backward)
+    __match_by_name(graph, nodes1, nodes2, forward, backward)
+
+
+def __match_partially(graph : ReferenceGraph, colors : list[int], forward : dict[int, int], backward : dict[int, int]):
+    """
+    Match the unmatched nodes that are equally colored in an earlier round of refinement.
+    Nodes in such a bucket differ somewhere in their neighborhoods, so only nodes with equal names or with a single candidate are matched,
+    grouped by the match of their declaring program unit where it has one.
+
+    Args:
+        graph (ReferenceGraph): Reference graph with refined colors
+        colors (list[int]): Color of each id in the earlier round
+        forward (dict[int, int]): Nodes of the first program that are matched, mapped to their match
+        backward (dict[int, int]): Nodes of the second program that are matched, mapped to their match
+    """
+
+    # Match the program units first, so that the variables they declare can be grouped by their match
+    for variables in (False, True):
+
+        # Bucket the unmatched nodes by color and by the match of their owner in the second program, skipping those whose owner is unmatched
+        buckets = dict()
+        for i, node in enumerate(graph.nodes):
+            if isinstance(node, ProgramUnit) == variables or i in graph.locals or i in forward or i in backward: continue
+            owner = __get_owner(graph, i)
+            if owner is not None and (forward if graph.programs[i] == 0 else backward).get(owner) is None: continue
+            if graph.programs[i] == 0 and owner is not None:
+                owner = forward[owner]
+            buckets.setdefault((colors[i], owner), ([], []))[graph.programs[i]].append(i)
+
+        for nodes1, nodes2 in buckets.values():
+
+            # Match nodes with equal names, then a single pair of nodes that is left
+            names = dict()
+            for i2 in nodes2:
+                names.setdefault(graph.nodes[i2].name, []).append(i2)
+            for i1 in nodes1:
+                candidates = names.get(graph.nodes[i1].name)
+                if candidates:
+                    __add_match(i1, candidates.pop(0), forward, backward)
+            nodes1 = [i1 for i1 in nodes1 if i1 not in forward]
+            nodes2 = [i2 for i2 in nodes2 if i2 not in backward]
+            if len(nodes1) == 1 and len(nodes2) == 1:
+                __add_match(nodes1[0], nodes2[0], forward, backward)
+
+
+def __match_by_name(graph : ReferenceGraph, nodes1 : list[int], nodes2 : list[int], forward : dict[int, int], backward : dict[int, int]):
+    """
+    Match the unmatched nodes with equal names, then the remaining unmatched nodes in order of name
+    """
+    nodes1 = sorted((i for i in nodes1 if i not in forward), key=lambda i : (graph.nodes[i].name or "", i))
+    nodes2 = sorted((i for i in nodes2 if i not in backward), key=lambda i : (graph.nodes[i].name or "", i))
+
+    # Match nodes with equal names
+    names = dict()
+    for i2 in nodes2:
+        names.setdefault(graph.nodes[i2].name, []).append(i2)
+    for i1 in nodes1:
+        candidates = names.get(graph.nodes[i1].name)
+        if candidates:
+            __add_match(i1, candidates.pop(0), forward, backward)
+
+    # Match the remaining nodes in order
+    nodes2 = [i2 for i2 in nodes2 if i2 not in backward]
+    for i1, i2 in zip((i1 for i1 in nodes1 if i1 not in forward), nodes2):
+        __add_match(i1, i2, forward, backward)
+
+
+def __get_owner(graph : ReferenceGraph, i : int) -> int:
+    """
+    Get the id of the program unit that declares a node, or None if it is declared at the global scope
+    """
+    for label, j in graph.adjacency[i]:
+        if label in OWNER_LABELS:
+            return j
+    return None
+
+
+def __add_match(i1 : int, i2 : int, forward : dict[int, int], backward : dict[int, int]):
+    forward[i1] = i2
+    backward[i2] = i1
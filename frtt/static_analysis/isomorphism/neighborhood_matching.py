@@ -0,0 +1,95 @@
+from static_analysis.isomorphism.reference_graph import ReferenceGraph
+
+# Upper bound on the number of candidate pairs tried by one exact match
+MAX_STATES = 10000
+
+
+def match_neighborhoods(graph : ReferenceGraph, i1 : int, i2 : int, forward : dict[int, int], backward : dict[int, int]) -> dict[int, int]:
+    """
+    Find an exact matching between the neighborhoods of two nodes in the style of the VF2 algorithm.
+    A neighborhood is a node, its neighbors, and every edge between them.
+    The matching maps i1 to i2, preserves the colors of nodes and the labels of edges, and agrees with the nodes that are already matched.
+
+    Args:
+        graph (ReferenceGraph): Reference graph with refined colors that contains both nodes
+        i1 (int): Id of the node in the first program
+        i2 (int): Id of the node in the second program
+        forward (dict[int, int]): Nodes of the first program that are already matched, mapped to their match
+        backward (dict[int, int]): Nodes of the second program that are already matched, mapped to their match
+
+    Returns:
+        dict[int, int]: Mapping from the neighborhood of i1 to the neighborhood of i2, or None if there is none or the search gives up
+    """
+
+    # Neighborhoods must have the same size, counting a node that references itself once
+    nodes1 = set(graph.neighborhood(i1))
+    nodes1.add(i1)
+    nodes2 = set(graph.neighborhood(i2))
+    nodes2.add(i2)
+    if len(nodes1) != len(nodes2): return None
+
+    # Match the node first, then its neighbors that are already matched, then the rest by color
+    nodes1.discard(i1)
+    order = [i1] + sorted(nodes1, key=lambda a : (a not in forward, graph.colors[a], a))
+
+    # Depth first search the candidates of each node in order
+    mapping = dict()
+    inverse = dict()
+    stack = [iter(__get_candidates(graph, order[0], i1, i2, nodes2, forward, backward))]
+    states = 0
+    while stack:
+        a = order[len(stack) - 1]
+
+        # Undo the match of the node from the previous candidate
+        if a in mapping:
+            del inverse[mapping.pop(a)]
+
+        # Match the node to the next feasible candidate
+        for b in stack[-1]:
+            states += 1
+            if states > MAX_STATES: return None
+            if __is_feasible(graph, a, b, mapping, inverse):
+                mapping[a] = b
+                inverse[b] = a
+                break
+
+        # Backtrack if no candidate is feasible
+        else:
+            stack.pop()
+            continue
+
+        # Every node in the neighborhood was matched
+        if len(mapping) == len(order): return mapping
+        stack.append(iter(__get_candidates(graph, order[len(stack)], i1, i2, nodes2, forward, backward)))
+
+    return None
+
+
+def __get_candidates(graph : ReferenceGraph, a : int, i1 : int, i2 : int, nodes2 : set[int], forward : dict[int, int], backward : dict[int, int]) -> list[int]:
+    """
+    Get the nodes of the second neighborhood that a node of the first neighborhood can be matched to, with equal names first
+    """
+    if a == i1:
+        return [i2]
+    if a in forward:
+        return [forward[a]] if forward[a] in nodes2 else []
+    name = graph.nodes[a].name
+    candidates = [b for b in nodes2 if graph.colors[b] == graph.colors[a] and b not in backward]
+    candidates.sort(key=lambda b : (graph.nodes[b].name != name, b))
+    return candidates
+
+
+def __is_feasible(graph : ReferenceGraph, a : int, b : int, mapping : dict[int, int], inverse : dict[int, int]) -> bool:
+    """
+    True if matching a to b keeps the labels of the edges to every node that is already matched
+    """
+    if b in inverse: return False
+    neighborhood1 = graph.neighborhood(a)
+    neighborhood2 = graph.neighborhood(b)
+    for a2, labels in neighborhood1.items():
+        if a2 in mapping and neighborhood2.get(mapping[a2]) != labels:
+            return False
+    for b2, labels in neighborhood2.items():
+        if b2 in inverse and neighborhood1.get(inverse[b2]) != labels:
+            return False
+    return True
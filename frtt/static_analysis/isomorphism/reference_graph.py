@@ -0,0 +1,130 @@
+from typing import Union
+from utilities.types.generic import Program, ProgramUnit, Variable
+
+# Attributes of a ProgramUnit that hold its edges in the reference graph, in the order of their edge labels
+# The reverse of the edge with label k has label -(k + 1)
+EDGE_ATTRIBUTES = ("referenced_modules", "referenced_procedures", "referenced_variables", "declared_procedures", "declared_variables")
+
+# Upper bound on the number of refinement rounds
+MAX_ROUNDS = 64
+
+
+class ReferenceGraph:
+    """
+    Class that represents the reference graphs of one or more programs as a single labeled graph.
+    Nodes are the program units and variables of each program, and edges are the references and declarations between them.
+    Each node is given an integer id, and a color that is refined until nodes of equal color have equally colored neighborhoods.
+    Local variables, which are declared by a program unit and referenced by no other program unit, are nodes without edges,
+    so that a program unit is colored by its input and output state rather than by its locals.
+    """
+
+    def __init__(self, programs : list[Program]):
+        """
+        :programs: Programs whose program units and variables are added to the graph
+        """
+        self.nodes : list[Union[ProgramUnit, Variable]] = list()           # ProgramUnit or Variable of each id
+        self.ids : dict[Union[ProgramUnit, Variable], int] = dict()         # Id of each ProgramUnit or Variable
+        self.programs : list[int] = list()                                   # Index of the program of each id
+        self.adjacency : list[list[tuple[int, int]]] = list()                # (Edge label, neighbor id) of each edge of each id
+        self.colors : list[int] = list()                                     # Color of each id
+        self.rounds : list[list[int]] = list()                               # Colors of each id after each round of refinement, from coarsest to finest
+        self.locals : dict[int, int] = dict()                                # Id of the declaring program unit of each local variable, by id
+        self.local_labels : dict[int, tuple[int]] = dict()                   # Labels of the edges from its program unit to each local variable, by id
+
+        # Add the nodes of each program, including variables that are only referenced
+        for p, program in enumerate(programs):
+            for punit in program.declared_programunits:
+                self.__add_node(punit, p)
+            for punit in program.declared_programunits:
+                for var in punit.declared_variables:
+                    self.__add_node(var, p)
+                for var in punit.referenced_variables:
+                    self.__add_node(var, p)
+
+        # Find the local variables, whose only references are from the program unit that declares them
+        referrers = dict()
+        for i in range(len(self.nodes)):
+            if not isinstance(self.nodes[i], ProgramUnit): continue
+            for var in self.nodes[i].referenced_variables:
+                referrers.setdefault(self.ids[var], set()).add(i)
+        for i in range(len(self.nodes)):
+            if not isinstance(self.nodes[i], ProgramUnit): continue
+            for var in self.nodes[i].declared_variables:
+                j = self.ids[var]
+                if referrers.get(j, set()) <= {i} and not any(attribute.startswith("intent") for attribute in var.attributes):
+                    self.locals[j] = i
+
+        # Add the edges out of each program unit and their reverse edges, except those of local variables
+        for i in range(len(self.nodes)):
+            if not isinstance(self.nodes[i], ProgramUnit): continue
+            for label, attribute in enumerate(EDGE_ATTRIBUTES):
+                for neighbor in getattr(self.nodes[i], attribute):
+                    j = self.ids.get(neighbor)
+                    if j is None: continue
+                    if j in self.locals:
+                        self.local_labels[j] = self.local_labels.get(j, ()) + (label,)
+                        continue
+                    self.adjacency[i].append((label, j))
+                    self.adjacency[j].append((-(label + 1), i))
+
+        self.__neighborhoods = dict()        # Edge labels to each neighbor of each id, by id
+
+    def __add_node(self, node : Union[ProgramUnit, Variable], program : int):
+        if node in self.ids: return
+        self.ids[node] = len(self.nodes)
+        self.nodes.append(node)
+        self.programs.append(program)
+        self.adjacency.append([])
+
+    def refine(self):
+        """
+        Refine the colors of the nodes in the style of the Weisfeiler-Lehman test
+        Each round colors a node by its previous color and the multiset of (edge label, color) pairs of its neighbors.
+        Signatures are numbered exactly rather than hashed, so that colors are comparable between programs and never collide.
+        Rounds stop once they no longer split any color class.
+        The colors of every round are kept, so that nodes left unmatched by the final colors can be matched by coarser ones.
+        """
+
+        # Color each node by its initial label
+        palette = dict()
+        colors = [palette.setdefault(self.__get_label(node), len(palette)) for node in self.nodes]
+        count = len(palette)
+        self.rounds = [colors]
+
+        for _ in range(MAX_ROUNDS):
+
+            # Number the signature of each node in order of first appearance
+            palette = dict()
+            new_colors = []
+            for i, edges in enumerate(self.adjacency):
+                signature = (colors[i], tuple(sorted((label, colors[j]) for label, j in edges)))
+                new_colors.append(palette.setdefault(signature, len(palette)))
+
+            # Colors are stable if no color class was split
+            if len(palette) == count: break
+            colors, count = new_colors, len(palette)
+            self.rounds.append(colors)
+
+        self.colors = colors
+
+    def neighborhood(self, i : int) -> dict[int, tuple[int]]:
+        """
+        Get the sorted edge labels between a node and each of its neighbors, building them only once per node
+        """
+        neighborhood = self.__neighborhoods.get(i)
+        if neighborhood is None:
+            neighborhood = dict()
+            for label, j in self.adjacency[i]:
+                neighborhood[j] = neighborhood.get(j, ()) + (label,)
+            for j, labels in neighborhood.items():
+                neighborhood[j] = tuple(sorted(labels))
+            self.__neighborhoods[i] = neighborhood
+        return neighborhood
+
+    def __get_label(self, node : Union[ProgramUnit, Variable]) -> tuple:
+        """
+        Get the initial label of a node, which includes its structure but not its name
+        """
+        if isinstance(node, ProgramUnit):
+            return ("programunit", node.type)
+        return ("variable", node.type, node.kind, tuple(node.dimensions), tuple(sorted(node.attributes)))
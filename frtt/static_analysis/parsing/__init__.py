@@ -1,42 +1,146 @@
-from utilities.types.generic import Program
-from static_analysis.parsing.abstract_syntax_tree import get_abstract_syntax_tree
-from static_analysis.parsing.tree_parsing import parse_program
+import os
+from concurrent.futures import ProcessPoolExecutor
+from utilities.types.generic import Program, ProgramUnit
+from static_analysis.parsing.abstract_syntax_tree import get_abstract_syntax_tree, LITERAL_LABELS
+from static_analysis.parsing.lazy_parse_tree import get_lazy_parse_tree
+from static_analysis.parsing.tree_parsing import parse_program, iter_parse_program
 
-def parsing(filepaths : list[str]) -> Program:
-    """ 
+def parsing(filepaths : list[str], cache_dirpath : str = None, workers : int = 1, discard : set[str] = None, lazy : bool = False) -> Program:
+    """
     Parse the source files in a program for its abstract structure.
 
     Args:
         filepaths (list[str]): List of the paths to each source file in a program
+        cache_dirpath (str, optional): Directory of the persistent parse tree cache. Defaults to None.
+        workers (int, optional): Number of worker processes, or None for one per CPU. Defaults to 1 (serial).
+        discard (set[str], optional): Labels whose nodes are built without their subtrees, such as LITERAL_LABELS. Defaults to None (every subtree).
+        lazy (bool, optional): Build and parse the subtree of one programunit at a time, as parse_file() does. Defaults to False.
 
     Returns:
         program (Program): Object representation of a program
     """
-     
+
+    # Parse the source files in worker processes
+    if workers != 1:
+        return parallel_parsing([filepaths], cache_dirpath, workers, discard, lazy)[0]
+
     # Initialize return values
     program = Program()
 
     # Iterate over each filepath
     for filepath in filepaths:
-        
-        # Generate the abstract syntax tree for the source file
-        tree = get_abstract_syntax_tree(filepath)
-        
+
         # Parse the programunits from the source file
-        parsed_programunits = parse_program(tree)
-        
-        # Add parsed programunits to list
-        while parsed_programunits:
-            punit = parsed_programunits.pop()
-            punit.filepath = filepath
-            parsed_programunits.extend(punit.declared_procedures)
-            program.declared_programunits.append(punit)
-
-            # Add mapping to programunit
-            if punit.parent is None:
-                if punit.type == "module":
-                    program.declared_modules_map[punit.name] = punit
-                else:
-                    program.declared_procedures_map[punit.name] = punit 
-                
-    return program
\ No newline at end of file
+        parsed_programunits = parse_file(filepath, cache_dirpath, lazy, discard)
+
+        # Add parsed programunits to program
+        add_programunits(program, filepath, parsed_programunits)
+
+    return program
+
+
+def parallel_parsing(filepaths_list : list[list[str]], cache_dirpath : str = None, workers : int = None, discard : set[str] = None,
+                     lazy : bool = False) -> list[Program]:
+    """
+    Parse the source files of one or more programs concurrently in a pool of worker processes.
+    The programunits of each program are merged in the same order as a serial run of parsing().
+
+    Args:
+        filepaths_list (list[list[str]]): List of the paths to each source file, for each program
+        cache_dirpath (str, optional): Directory of the persistent parse tree cache. Defaults to None.
+        workers (int, optional): Number of worker processes, or None for one per CPU. Defaults to None.
+        discard (set[str], optional): Labels whose nodes are built without their subtrees, such as LITERAL_LABELS. Defaults to None (every subtree).
+        lazy (bool, optional): Build and parse the subtree of one programunit at a time, as parse_file() does. Defaults to False.
+
+    Returns:
+        programs (list[Program]): Object representation of each program
+    """
+
+    # Initialize return values
+    programs = [Program() for _ in filepaths_list]
+
+    # Submit the largest source files first so that the slowest files do not start last
+    jobs = [(i, j) for i, filepaths in enumerate(filepaths_list) for j in range(len(filepaths))]
+    jobs.sort(key=lambda job : os.path.getsize(filepaths_list[job[0]][job[1]]), reverse=True)
+
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+
+        # Parse each source file in a worker process
+        futures = dict()
+        for i, j in jobs:
+            futures[(i, j)] = executor.submit(parse_file, filepaths_list[i][j], cache_dirpath, lazy, discard)
+
+        # Add the parsed programunits to each program in the order of its filepaths
+        for i, filepaths in enumerate(filepaths_list):
+            for j, filepath in enumerate(filepaths):
+                add_programunits(programs[i], filepath, futures[(i, j)].result())
+
+    return programs
+
+
+def parse_file(filepath : str, cache_dirpath : str = None, lazy : bool = False, discard : set[str] = None) -> list[ProgramUnit]:
+    """
+    Parse the programunits declared at the global scope of a source file.
+
+    Args:
+        filepath (str): Path to the source file
+        cache_dirpath (str, optional): Directory of the persistent parse tree cache. Defaults to None.
+        lazy (bool, optional): Build and parse the subtree of one programunit at a time, with iter_parse_file(). Defaults to False.
+        discard (set[str], optional): Labels whose nodes are built without their subtrees, such as LITERAL_LABELS. Defaults to None (every subtree).
+
+    Returns:
+        programunits (list[ProgramUnit]): Object representation of each programunit
+    """
+
+    # Parse each programunit from its own subtree
+    if lazy:
+        return list(iter_parse_file(filepath, cache_dirpath, discard))
+
+    # Generate the abstract syntax tree for the source file while the Flang command writes its output
+    tree = get_abstract_syntax_tree(filepath, cache_dirpath=cache_dirpath, stream=True, discard=discard)
+
+    # Parse the programunits from the source file
+    return parse_program(tree)
+
+
+def iter_parse_file(filepath : str, cache_dirpath : str = None, discard : set[str] = None, indices : list[int] = None):
+    """
+    Parse the programunits declared at the global scope of a source file one at a time, each from its own subtree.
+    Each programunit is yielded as soon as it is parsed, and only the subtree of one programunit is held in memory at a time.
+
+    Args:
+        filepath (str): Path to the source file
+        cache_dirpath (str, optional): Directory of the persistent parse tree cache. Defaults to None.
+        discard (set[str], optional): Labels whose nodes are built without their subtrees, such as LITERAL_LABELS. Defaults to None (every subtree).
+        indices (list[int], optional): Indices of the programunits to parse in the source file. Defaults to None (every programunit).
+
+    Returns:
+        programunits (Generator[ProgramUnit]): Object representation of each programunit
+    """
+    with get_lazy_parse_tree(filepath, cache_dirpath=cache_dirpath, discard=discard) as tree:
+        yield from iter_parse_program(tree, indices)
+
+
+def add_programunits(program : Program, filepath : str, parsed_programunits : list[ProgramUnit]):
+    """
+    Add the programunits parsed from a source file, and each of their subprograms, to a program.
+
+    Args:
+        program (Program): Object representation of a program
+        filepath (str): Path to the source file the programunits were parsed from
+        parsed_programunits (list[ProgramUnit]): Programunits declared at the global scope of the source file
+    """
+
+    # Add parsed programunits to list
+    while parsed_programunits:
+        punit = parsed_programunits.pop()
+        punit.filepath = filepath
+        parsed_programunits.extend(punit.declared_procedures)
+        program.declared_programunits.append(punit)
+
+        # Add mapping to programunit
+        if punit.parent is None:
+            if punit.type == "module":
+                program.declared_modules_map[punit.name] = punit
+            else:
+                program.declared_procedures_map[punit.name] = punit
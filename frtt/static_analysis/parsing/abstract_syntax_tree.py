@@ -1,23 +1,136 @@
-from subprocess import check_output
+import gc
+import re
+from sys import intern
+from subprocess import CalledProcessError, PIPE, Popen, check_output
 from utilities.types.tree_node import TreeNode
+from static_analysis.parsing.parse_tree_cache import FLANG_COMMAND, FLANG_FLAGS, get_cache
 
+# Characters that may separate the keywords of a line
+GAP_PATTERN = re.compile(r"[ =\->]*")
 
-def get_abstract_syntax_tree(filepath, is_source = True):
+# Labels of the literal constant subtrees, which no parser queries below the label itself
+LITERAL_LABELS = frozenset(("LiteralConstant",))
+
+# Parent of the lines inside a discarded subtree, which are read for their depth but never built
+__DISCARDED = TreeNode("")
+
+
+def get_abstract_syntax_tree(filepath, is_source = True, cache_dirpath = None, stream = False, discard = None):
     """
     Get the abstract syntax tree representation of a Fortran source file from the Flang command
     :filepath: Fortran source file to generate flang parse tree for
     :is_source: True if filepath is a source file, False if it is a text file containing raw representation of Flang parse tree
+    :cache_dirpath: Directory of the persistent parse tree cache, or None to always run the Flang command
+    :stream: True to build the tree while the raw representation is read line by line, instead of reading it whole first
+    :discard: Labels whose nodes are built without their subtrees, such as LITERAL_LABELS, or None to build every subtree
     :return: TreeNode representation of flang abstract syntax tree
     """
     
+    # Build the tree while reading the raw string representation of AST
+    if stream:
+        return build_abstract_syntax_tree(iter_raw_parse_tree(filepath, is_source, cache_dirpath), discard)
+
     # Get the raw string representation of AST
     if is_source:
-        raw_parse_tree = check_output("flang-new -fc1 -fdebug-dump-parse-tree-no-sema {}".format(filepath), shell=True, text=True)  
+        raw_parse_tree = get_raw_parse_tree(filepath, cache_dirpath)
     else:
         f = open(filepath)
         raw_parse_tree = f.read()
         f.close()
 
+    return build_abstract_syntax_tree(raw_parse_tree, discard)
+
+
+def get_raw_parse_tree(filepath, cache_dirpath = None):
+    """
+    Get the raw string representation of the flang parse tree of a Fortran source file
+    Runs the Flang command only if the parse tree is not already in the cache
+    :filepath: Fortran source file to generate flang parse tree for
+    :cache_dirpath: Directory of the persistent parse tree cache, or None to always run the Flang command
+    :return: Raw string representation of flang parse tree
+    """
+
+    # Run the Flang command if caching is disabled
+    if cache_dirpath is None:
+        return check_output("{} {} {}".format(FLANG_COMMAND, FLANG_FLAGS, filepath), shell=True, text=True)
+
+    # Return the cached parse tree if there is one
+    cache = get_cache(cache_dirpath)
+    key = cache.key(filepath)
+    raw_parse_tree = cache.get(key)
+    if raw_parse_tree is not None:
+        return raw_parse_tree
+
+    # Run the Flang command and cache its output
+    raw_parse_tree = check_output("{} {} {}".format(FLANG_COMMAND, FLANG_FLAGS, filepath), shell=True, text=True)
+    cache.put(key, raw_parse_tree)
+    return raw_parse_tree
+
+
+def iter_raw_parse_tree(filepath, is_source = True, cache_dirpath = None):
+    """
+    Iterate over the lines of the raw string representation of the flang parse tree of a Fortran source file
+    Lines are read incrementally from the output of the Flang command, the cache, or the text file
+    :filepath: Fortran source file to generate flang parse tree for
+    :is_source: True if filepath is a source file, False if it is a text file containing raw representation of Flang parse tree
+    :cache_dirpath: Directory of the persistent parse tree cache, or None to always run the Flang command
+    :return: Generator of the lines of raw string representation of flang parse tree
+    """
+
+    # Read the lines of the text file
+    if not is_source:
+        with open(filepath) as f:
+            yield from f
+        return
+
+    # Read the lines of the output of the Flang command if caching is disabled
+    if cache_dirpath is None:
+        yield from __iter_flang_output(filepath)
+        return
+
+    # Read the lines of the cached parse tree if there is one
+    cache = get_cache(cache_dirpath)
+    key = cache.key(filepath)
+    f = cache.open(key)
+    if f is not None:
+        with f:
+            yield from f
+        return
+
+    # Read the lines of the output of the Flang command, writing each to the cache
+    with cache.create(key) as entry:
+        for line in __iter_flang_output(filepath):
+            entry.write(line)
+            yield line
+
+
+def build_abstract_syntax_tree(raw_parse_tree, discard = None):
+    """
+    Build the abstract syntax tree from the raw string representation of a flang parse tree
+    :raw_parse_tree: Raw string representation of flang parse tree, or an iterable over its lines
+    :discard: Labels whose nodes are built without their subtrees, or None to build every subtree
+    :return: TreeNode representation of flang abstract syntax tree
+    """
+
+    # Pause the cyclic garbage collector, which would otherwise repeatedly scan every node built so far
+    # The tree contains no reference cycles, so nothing is left for the collector once building finishes
+    gc_enabled = gc.isenabled()
+    gc.disable()
+    try:
+        return __build_tree(raw_parse_tree, frozenset(discard or ()))
+    finally:
+        if gc_enabled:
+            gc.enable()
+
+
+def __build_tree(raw_parse_tree, discard):
+    """
+    Build the abstract syntax tree from the raw string representation of a flang parse tree
+    :raw_parse_tree: Raw string representation of flang parse tree, or an iterable over its lines
+    :discard: Labels whose nodes are built without their subtrees
+    :return: TreeNode representation of flang abstract syntax tree
+    """
+
     # Stack to hold all parent nodes to backtrack to
     stack = []
 
@@ -28,80 +141,33 @@ def get_abstract_syntax_tree(filepath, is_source = True):
     prev_node = head
     prev_is_extended = False
     prev_depth = -1
-    initial_program_unit = True
 
     # Current line number
     line_num = 1
 
+    # Split the raw string representation into lines
+    if isinstance(raw_parse_tree, str):
+        raw_parse_tree = raw_parse_tree.split('\n')
+
     # Iterate over each line of output 
-    for line in raw_parse_tree.split('\n'):
+    for line in raw_parse_tree:
+
+        # Remove the line terminator of lines read from a stream
+        if line[-1:] == '\n':
+            line = line[:-1]
 
         if not line: continue
 
         # Extract the depth of the node indicated by line and its associated "->" separated keywords
-        curr_depth = 0
-        curr_is_extended = False
-        keyword = ""
-        keywords = []
-        depth_state = 0
-        string_state = 1
-        gap_state = 2
-        keyword_state = 3
-        state = depth_state
-        for i in range(len(line)):
-            c = line[i]
-            match state:
-                case 0:                                         # Depth state
-                    match c:
-                        case " ":
-                            continue
-                        case "|":
-                            curr_depth += 1
-                        case "'":
-                            keyword = c
-                            state = string_state
-                        case default:
-                            keyword = c
-                            state = keyword_state
-                case 1:                                         # String state
-                    match c:
-                        case "'":
-                            keyword += c
-                            if i == len(line) - 1:
-                                keywords.append(keyword)
-                        case default:
-                            keyword += c
-                case 2:                                         # Gap state
-                    match c:
-                        case " " | "=":
-                            continue
-                        case "-" | ">":
-                            curr_is_extended = True
-                        case "'":
-                            keyword = c
-                            state = string_state
-                            curr_is_extended = False
-                        case default:
-                            keyword = c
-                            state = keyword_state
-                            curr_is_extended = False
-                case 3:                                         # Keyword state
-                    match c:
-                        case " ":
-                            keywords.append(keyword)
-                            state = gap_state
-                        case default:
-                            keyword += c
-                            if i == len(line) - 1:
-                                keywords.append(keyword)
-
-        # Add 1 to the depth of lines excluding the lines in the first program unit
-        if curr_depth == 0 and head is not None:
-            initial_program_unit = False
-        curr_depth += not initial_program_unit
+        curr_depth, curr_is_extended, keywords = __tokenize_line(line)
 
         # Get the parent of the current node
-        if curr_depth + prev_is_extended == prev_depth + 1:  # Node is at a depth of exactly one greater than the previous node (or depths are equal and previous line is extended)
+        # The first program unit shares its line with the head of the tree, and each later program unit at depth 0 is added beside it
+        if curr_depth == 0 and head is not None:
+            stack = []
+            parent = head
+            parent_is_extended = False
+        elif curr_depth + prev_is_extended == prev_depth + 1:  # Node is at a depth of exactly one greater than the previous node (or depths are equal and previous line is extended)
             stack.append((parent_is_extended, parent))
             parent = prev_node
             parent_is_extended = prev_is_extended
@@ -113,22 +179,33 @@ def get_abstract_syntax_tree(filepath, is_source = True):
         else:                                                # Node is at a depth more than one greater than the previous node
             raise Exception("Invalid depth in parse tree at line {}".format(line_num))
     
-        # Get the node associated with the current line
-        new_node = None
-        for kw in keywords:
-            child_node = TreeNode(kw)
-            if not new_node:
-                new_node = curr_node = child_node
-            else:
-                curr_node.children.append(child_node)
-                curr_node = child_node
+        # Lines inside a discarded subtree only update the depths, and their descendants are discarded along with them
+        if parent is __DISCARDED:
+            curr_node = __DISCARDED
 
-        # Add new node as a child of its parent, or initialize head if uninitialized
-        if not head:
-            head = new_node
-            parent = head
         else:
-            parent.children.append(new_node)
+
+            # Get the node associated with the current line
+            # Keywords are interned so that every node with the same keyword shares one string
+            # The keywords after a discarded label are not built, and the lines below it get the discarded parent
+            new_node = None
+            for kw in keywords:
+                child_node = TreeNode(intern(kw))
+                if not new_node:
+                    new_node = curr_node = child_node
+                else:
+                    curr_node.children.append(child_node)
+                    curr_node = child_node
+                if kw in discard:
+                    curr_node = __DISCARDED
+                    break
+
+            # Add new node as a child of its parent, or initialize head if uninitialized
+            if not head:
+                head = new_node
+                parent = head
+            else:
+                parent.children.append(new_node)
             
     
         # Update vars
@@ -137,4 +214,67 @@ def get_abstract_syntax_tree(filepath, is_source = True):
         prev_depth = curr_depth
         line_num += 1
 
-    return head
\ No newline at end of file
+    return head
+
+
+def __tokenize_line(line):
+    """
+    Split a line of the raw string representation of a flang parse tree into its depth and keywords
+    Each keyword and gap is sliced out of the line whole, instead of being built one character at a time
+    :line: Line of raw string representation of flang parse tree
+    :return: Tuple of the depth of the line, whether the line ends with "->", and the list of its keywords
+    """
+
+    # Depth is the number of '|' symbols before the first keyword
+    start = len(line) - len(line.lstrip(" |"))
+    depth = line.count("|", 0, start)
+
+    # Initialize variables
+    keywords = []
+    is_extended = False
+    last = len(line) - 1
+    i = start
+
+    # Iterate over each keyword of line
+    while i <= last:
+
+        # String keywords extend to the end of the line, and are only kept if they are terminated by the last character
+        if line[i] == "'":
+            if i < last and line[last] == "'":
+                keywords.append(line[i:])
+            return depth, False, keywords
+
+        # Other keywords extend to the next space, and are only kept if they are more than one character at the end of the line
+        end = line.find(" ", i)
+        if end == -1:
+            if i < last:
+                keywords.append(line[i:])
+            return depth, False, keywords
+        keywords.append(line[i:end])
+
+        # Skip the gap between keywords, which may contain "=" or "->"
+        i = GAP_PATTERN.match(line, end).end()
+        is_extended = "-" in line[end:i] or ">" in line[end:i]
+
+    return depth, is_extended, keywords
+
+
+
+def __iter_flang_output(filepath):
+    """
+    Iterate over the lines of the output of the Flang command as they are written
+    :filepath: Fortran source file to generate flang parse tree for
+    :return: Generator of the lines of raw string representation of flang parse tree
+    """
+    command = "{} {} {}".format(FLANG_COMMAND, FLANG_FLAGS, filepath)
+    process = Popen(command, shell=True, stdout=PIPE, text=True)
+    try:
+        yield from process.stdout
+    except BaseException:
+        process.kill()                                       # Stop the Flang command if the lines are no longer being read
+        raise
+    finally:
+        process.stdout.close()
+        returncode = process.wait()
+    if returncode:
+        raise CalledProcessError(returncode, command)
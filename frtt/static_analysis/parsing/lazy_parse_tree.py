@@ -0,0 +1,142 @@
+import os
+import tempfile
+import weakref
+from array import array
+from utilities.types.tree_node import TreeNode
+from static_analysis.parsing.abstract_syntax_tree import build_abstract_syntax_tree, iter_raw_parse_tree
+from static_analysis.parsing.parse_tree_cache import get_cache
+
+
+class LazyParseTree:
+    """
+    Class that represents the flang parse tree of a source file whose program units are built on demand.
+    A cheap pre-scan records the byte offset of each top-level program unit in the raw representation.
+    The subtree of a program unit is only built when it is requested, from the lines between its offset and the next one.
+    """
+
+    def __init__(self, filepath : str, discard : set[str] = None, delete : bool = False, file = None):
+        """
+        :filepath: Text file containing the raw representation of a flang parse tree
+        :discard: Labels whose nodes are built without their subtrees, or None to build every subtree
+        :delete: True to delete the text file once the LazyParseTree is closed or garbage collected
+        :file: Binary file object of filepath that is already open, which the LazyParseTree closes, or None to open filepath
+        """
+        self.filepath = filepath
+        self.discard = discard
+        self.file = file if file is not None else open(filepath, 'rb')     # Open for as long as the object, so that the file can be read even if it is evicted from a cache
+        self.offsets = self.__scan()                      # Offset of the first line of each top-level program unit, and the size of the file
+        self.__finalizer = weakref.finalize(self, LazyParseTree.__cleanup, self.file, filepath if delete else None)
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def __getitem__(self, i : int) -> TreeNode:
+        return self.subtree(i)
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self.subtree(i)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+        return False
+
+    def close(self):
+        """
+        Close the text file, and delete it if it is temporary
+        """
+        self.__finalizer()
+
+    def subtree(self, i : int) -> TreeNode:
+        """
+        Build the subtree of a top-level program unit
+        Each call builds a new subtree, so the caller decides how long it is kept
+        :i: Index of the program unit in the source file
+        :return: TreeNode with value "ProgramUnit"
+        """
+
+        # The first program unit shares its line with the head of the tree
+        head = build_abstract_syntax_tree(self.__iter_lines(i), self.discard)
+        while head.value != "ProgramUnit":
+            head = head.children[0]
+        return head
+
+    def __iter_lines(self, i : int):
+        """
+        Iterate over the lines of a top-level program unit, read one at a time
+        The depth of the first line is removed from every line, in case program units are nested under a "Program" line
+        """
+        self.file.seek(self.offsets[i])
+        remaining = self.offsets[i + 1] - self.offsets[i]
+        base = None
+        while remaining > 0:
+            line = self.file.readline()
+            if not line: break
+            remaining -= len(line)
+            if base is None:
+                base = len(line) - len(line.lstrip(b"| "))
+            yield line[base:].decode()
+
+    def __scan(self) -> array:
+        """
+        Find the offset of the first line of each top-level program unit
+        Program units only appear at the top level, so every line whose label is "ProgramUnit" starts one
+        """
+        offsets = array('q')
+        offset = 0
+        for line in self.file:
+            label = line.lstrip(b"| ")
+            if label.startswith(b"ProgramUnit") or (offset == 0 and label.startswith(b"Program -> ProgramUnit")):
+                offsets.append(offset)
+            offset += len(line)
+        offsets.append(offset)
+        return offsets
+
+    @staticmethod
+    def __cleanup(file, filepath):
+        file.close()
+        if filepath is not None:
+            os.remove(filepath)
+
+
+def get_lazy_parse_tree(filepath : str, is_source : bool = True, cache_dirpath : str = None, discard : set[str] = None) -> LazyParseTree:
+    """
+    Get the flang parse tree of a Fortran source file with program units that are built on demand
+    The raw representation must be in a file to be read by offset, so the output of the Flang command is written to the cache or a temporary file
+    :filepath: Fortran source file to generate flang parse tree for
+    :is_source: True if filepath is a source file, False if it is a text file containing raw representation of Flang parse tree
+    :cache_dirpath: Directory of the persistent parse tree cache, or None to always run the Flang command
+    :discard: Labels whose nodes are built without their subtrees, or None to build every subtree
+    :return: LazyParseTree object, which should be closed once it is no longer needed
+    """
+
+    # Read the text file in place
+    if not is_source:
+        return LazyParseTree(filepath, discard)
+
+    # Read the cached parse tree, running the Flang command to add it to the cache if it is missing
+    # The entry is opened through the cache, which marks it as used, and is read from the open file even if it is evicted afterwards
+    if cache_dirpath is not None:
+        cache = get_cache(cache_dirpath)
+        key = cache.key(filepath)
+        f = cache.open(key, 'rb')
+        if f is None:
+            for _ in iter_raw_parse_tree(filepath, True, cache_dirpath): pass
+            f = cache.open(key, 'rb')
+        if f is not None:
+            return LazyParseTree(cache.path(key), discard, file=f)
+
+    # Write the output of the Flang command to a temporary file otherwise, or if the entry was evicted as soon as it was added,
+    # such as by a cache smaller than the parse tree
+    fd, tmp_path = tempfile.mkstemp(suffix=".tree")
+    try:
+        with os.fdopen(fd, 'w') as f:
+            for line in iter_raw_parse_tree(filepath, True, None):
+                f.write(line)
+    except BaseException:
+        os.remove(tmp_path)
+        raise
+    return LazyParseTree(tmp_path, discard, delete=True)
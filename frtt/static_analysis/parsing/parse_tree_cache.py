@@ -0,0 +1,196 @@
+from __future__ import annotations
+import hashlib
+import os
+import tempfile
+from subprocess import check_output
+
+# Command and flags used to generate the raw representation of a flang parse tree
+FLANG_COMMAND = "flang-new"
+FLANG_FLAGS = "-fc1 -fdebug-dump-parse-tree-no-sema"
+
+# Default upper bound on the total size of a cache directory in bytes
+DEFAULT_CACHE_SIZE = 2 ** 30
+
+# Extension of the files that hold cached parse trees
+CACHE_EXTENSION = ".tree"
+
+# Version string of the flang command
+__flang_version = None
+
+# Cache objects that have been opened, by absolute path of their directory
+__caches = dict()
+
+
+class ParseTreeCache:
+    """
+    Persistent on-disk cache of raw flang parse tree dumps.
+    Entries are keyed by the content of the source file, the flang version, and the flang flags.
+    Least recently used entries are evicted once the total size of the cache exceeds its limit.
+    """
+
+    def __init__(self, dirpath : str, max_size : int = DEFAULT_CACHE_SIZE):
+        """
+        :dirpath: Directory that holds the cached parse trees (created if it does not exist)
+        :max_size: Upper bound on the total size of the cached parse trees in bytes
+        """
+        self.dirpath = dirpath
+        self.max_size = max_size
+        os.makedirs(dirpath, exist_ok=True)
+        self.size = sum(entry.stat().st_size for entry in self.__entries())   # Total size of the cached parse trees in bytes
+
+    def key(self, filepath : str, flags : str = FLANG_FLAGS) -> str:
+        """
+        Get the key of the cache entry for a source file
+        :filepath: Fortran source file
+        :flags: Flags passed to the flang command
+        :return: Hex digest of the source file content, flang version, and flags
+        """
+        digest = hashlib.sha256()
+        with open(filepath, 'rb') as f:
+            for chunk in iter(lambda : f.read(1 << 20), b""):
+                digest.update(chunk)
+        digest.update(b"\0" + get_flang_version().encode())
+        digest.update(b"\0" + flags.encode())
+        return digest.hexdigest()
+
+    def path(self, key : str) -> str:
+        """
+        Get the path of the file that holds the cache entry for a key
+        """
+        return os.path.join(self.dirpath, key + CACHE_EXTENSION)
+
+    def get(self, key : str) -> str:
+        """
+        Get the raw parse tree cached for a key, and mark it as the most recently used entry
+        :key: Key of the cache entry
+        :return: Raw representation of the flang parse tree, or None if there is no entry for the key
+        """
+        f = self.open(key)
+        if f is None:
+            return None
+        with f:
+            return f.read()
+
+    def open(self, key : str, mode : str = 'r'):
+        """
+        Open the raw parse tree cached for a key for reading, and mark it as the most recently used entry
+        An open file can still be read after its entry is evicted
+        :key: Key of the cache entry
+        :mode: Mode to open the file in, 'r' for text or 'rb' for bytes
+        :return: File object of the raw representation of the flang parse tree, or None if there is no entry for the key
+        """
+        path = self.path(key)
+        try:
+            f = open(path, mode)
+            os.utime(path)
+        except FileNotFoundError:
+            return None
+        return f
+
+    def put(self, key : str, raw_parse_tree : str):
+        """
+        Add the raw parse tree for a key to the cache, evicting the least recently used entries if it is full
+        :key: Key of the cache entry
+        :raw_parse_tree: Raw representation of the flang parse tree
+        """
+        with self.create(key) as entry:
+            entry.write(raw_parse_tree)
+
+    def create(self, key : str) -> CacheEntryWriter:
+        """
+        Create the cache entry for a key that is written incrementally
+        The entry is only added to the cache if the returned writer is closed without an exception
+        :key: Key of the cache entry
+        :return: Context manager with a write() method for the raw representation of the flang parse tree
+        """
+        return CacheEntryWriter(self, key)
+
+    def add(self, key : str, tmp_path : str):
+        """
+        Move a completely written temporary file into the cache as the entry for a key
+        :key: Key of the cache entry
+        :tmp_path: Temporary file in the cache directory that holds the raw parse tree
+        """
+        self.size += os.path.getsize(tmp_path)
+        os.replace(tmp_path, self.path(key))
+
+        # Evict entries if the cache is full
+        if self.size > self.max_size:
+            self.evict()
+
+    def evict(self):
+        """
+        Remove the least recently used entries until the total size of the cache is within its limit
+        """
+
+        # Sort entries from least to most recently used
+        entries = []
+        for entry in self.__entries():
+            try:
+                stat = entry.stat()
+            except FileNotFoundError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, entry.path))
+        entries.sort()
+
+        # Remove entries until the cache is within its limit
+        self.size = sum(size for _, size, _ in entries)
+        for _, size, path in entries:
+            if self.size <= self.max_size: break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            self.size -= size
+
+    def __entries(self):
+        return [entry for entry in os.scandir(self.dirpath) if entry.name.endswith(CACHE_EXTENSION)]
+
+
+class CacheEntryWriter:
+    """
+    Writer for a cache entry that is added to the cache once it is completely written.
+    Writes go to a temporary file so that concurrent readers never see a partial entry.
+    """
+
+    def __init__(self, cache : ParseTreeCache, key : str):
+        self.cache = cache
+        self.key = key
+        fd, self.tmp_path = tempfile.mkstemp(dir=cache.dirpath, suffix=".tmp")
+        self.file = os.fdopen(fd, 'w')
+
+    def write(self, text : str):
+        self.file.write(text)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.file.close()
+        if exc_type is None:
+            self.cache.add(self.key, self.tmp_path)
+        else:
+            os.remove(self.tmp_path)
+        return False
+
+
+def get_cache(dirpath : str) -> ParseTreeCache:
+    """
+    Get the cache for a directory, opening it only once per process
+    :dirpath: Directory that holds the cached parse trees
+    :return: ParseTreeCache object for the directory
+    """
+    abspath = os.path.abspath(dirpath)
+    if abspath not in __caches:
+        __caches[abspath] = ParseTreeCache(abspath)
+    return __caches[abspath]
+
+
+def get_flang_version() -> str:
+    """
+    Get the version string of the flang command, running it only once per process
+    """
+    global __flang_version
+    if __flang_version is None:
+        __flang_version = check_output("{} --version".format(FLANG_COMMAND), shell=True, text=True)
+    return __flang_version
@@ -1,6 +1,7 @@
 from utilities.types.generic import ProgramUnit
 from utilities.types.tree_node import TreeNode
 from static_analysis.parsing.variable_parsing import parse_variables
+from static_analysis.parsing.lazy_parse_tree import LazyParseTree
 
 def parse_program(tree : TreeNode) -> list[ProgramUnit]:
     """
@@ -14,11 +15,44 @@ def parse_program(tree : TreeNode) -> list[ProgramUnit]:
     if tree.value != "Program":
         raise Exception("Expected a \"Program\" TreeNode but received a \"{}\" TreeNode.".format(tree.value))
 
+    # Index the tree so that each query on its subtrees is a lookup instead of a traversal
+    index = tree.build_index()
+
     # Get a list of the subtrees representing a program unit
     subtrees = tree.walk("ProgramUnit")
     
     # Get the ProgramUnit representation of each subtree
-    return [parse_programunit(subtree) for subtree in subtrees]
+    programunits = [parse_programunit(subtree) for subtree in subtrees]
+
+    # Release the index once parsing is complete
+    del index
+
+    return programunits
+
+
+def iter_parse_program(tree : LazyParseTree, indices : list[int] = None):
+    """
+    Parse the top-level program units of a source file one at a time, building the subtree of each only when it is parsed.
+    Only one program unit subtree is held in memory at a time.
+    :tree: Parse tree of a source file with program units that are built on demand
+    :indices: Indices of the program units to parse, or None for every program unit in the source file
+    :rvalue: Generator of parsed programunit objects
+    """
+
+    # Iterate over each requested program unit
+    for i in (range(len(tree)) if indices is None else indices):
+
+        # Build and index the subtree of the program unit
+        subtree = tree.subtree(i)
+        index = subtree.build_index()
+
+        # Get the ProgramUnit representation of the subtree
+        programunit = parse_programunit(subtree)
+
+        # Release the subtree and its index before the next program unit is built
+        del index, subtree
+
+        yield programunit
 
 
 def parse_programunit(tree):
@@ -77,8 +111,11 @@ def parse_specificationpart(tree, obj):
     if tree.value != "SpecificationPart":
         raise Exception("Expected a \"SpecificationPart\" TreeNode but received a \"{}\" TreeNode.".format(tree.value))
     
+    # Get nodes that represent use statements, data references, and external programunit references
+    nodes = tree.walk_grouped(["UseStmt", "DataRef", "ExternalStmt"])
+
     # Get nodes that represent use statements
-    usestmts = tree.walk("UseStmt")
+    usestmts = nodes["UseStmt"]
     
     # Add the name of each data reference as a variable reference
     for usestmt in usestmts:
@@ -87,7 +124,7 @@ def parse_specificationpart(tree, obj):
         obj.referenced_module_names.add(name)
             
     # Get nodes that represent data references
-    datarefs = tree.walk("DataRef")
+    datarefs = nodes["DataRef"]
     
     # Add the name of each data reference as a name reference
     for dataref in datarefs:
@@ -96,7 +133,7 @@ def parse_specificationpart(tree, obj):
         obj.referenced_names.add(name)
         
     # Get nodes that represent external programunit references
-    externalstmts = tree.walk("ExternalStmt")
+    externalstmts = nodes["ExternalStmt"]
     
     # Add the name of each data reference as a programunit name reference
     for externalstmt in externalstmts:
@@ -143,8 +180,11 @@ def parse_executionpart(tree, obj):
     if tree.value != "ExecutionPart":
         raise Exception("Expected a \"ExecutionPart\" TreeNode but received a \"{}\" TreeNode.".format(tree.value))
     
+    # Get nodes that represent data references, function calls, and subroutine calls
+    nodes = tree.walk_grouped(["DataRef", "FunctionReferences", "CallStmt"])
+
     # Get nodes that represent data references
-    datarefs = tree.walk("DataRef")
+    datarefs = nodes["DataRef"]
     
     # Add the name of each data reference as a variable reference
     for dataref in datarefs:
@@ -153,7 +193,7 @@ def parse_executionpart(tree, obj):
         obj.referenced_names.add(name)
         
     # Get nodes that represent function calls (may be array accesses)
-    functionreferences = tree.walk("FunctionReferences")
+    functionreferences = nodes["FunctionReferences"]
     for functionreference in functionreferences:
         proceduredesignator = functionreference.step("ProcedureDesignator", exception_handling=True)
         namestmt = proceduredesignator.step("Name", exception_handling=True)
@@ -162,7 +202,7 @@ def parse_executionpart(tree, obj):
             obj.referenced_names.add(name)
         
     # Get nodes that represent subroutine calls
-    callstmts = tree.walk("CallStmt")
+    callstmts = nodes["CallStmt"]
     for callstmt in callstmts:
         proceduredesignator = callstmt.step("ProcedureDesignator", exception_handling=True)
         namestmt = proceduredesignator.step("Name", exception_handling=True)
@@ -28,33 +28,73 @@ def parse_variables(tree : TreeNode, obj : ProgramUnit):
             obj.declared_variables.append(var)
             obj.declared_variables_map[name] = var
     
+    # Get the subtrees that make up the declaration of each distinct variable in a single pass
+    declarations = __get_declarations(tree, set(obj.declared_variables_map))
+
     # Iterate over each distinct variable
     for var in obj.declared_variables:
-        vname = var.name
         
         # Get subtree representing variable declaration statements
-        # Subtree consists of all branches under "ImplicitPart" that have either no entitydecl or the entitydecl associated with target variable (and possible others)
-        subtree = tree.deep_copy()
-        queue = [(subtree, next) for next in subtree.children]
-        while queue:
-            prev, curr = queue.pop()
-            leaves = set([leaf.value[1:-1] for leaf in curr.leaves()])
-            skip = False
-            if vname not in leaves:
-                for other_var in obj.declared_variables:
-                    other_vname = other_var.name
-                    if other_vname in leaves:
-                        skip = True
-                        prev.children.remove(curr)
-                        del curr
-                        break
-            if not skip:
-                queue.extend([(curr, next) for next in curr.children])
+        # Subtree shares the branches under "ImplicitPart" that have either no entitydecl or the entitydecl associated with target variable (and possible others)
+        subtree = TreeNode(tree.value)
+        subtree.children = declarations[var.name]
                 
         # Parse object representation of Variable from subtree representing a variable declaration
         parse_variable(subtree, var)
         
         
+def __get_declarations(tree : TreeNode, vnames : set[str]) -> dict[str, list[TreeNode]]:
+    """
+    Get the branches of a tree that make up the declaration of each variable, without copying any subtrees.
+    A branch belongs to the declaration of a variable if its leaves include the variable name, or no declared variable names.
+    :tree: Head of tree with value "ImplicitPart".
+    :vnames: Names of the declared variables.
+    :rvalue: Dictionary mapping each variable name to the roots of the maximal branches in its declaration, in tree order.
+    """
+
+    # Declared variable names among the leaves of each node, by node id
+    # Leaves contribute their own name to their parent, but have no names themselves
+    no_names = frozenset()
+    names = dict()
+    stack = [(tree, False)]
+    while stack:
+        node, visited = stack.pop()
+        if not node.children:
+            names[id(node)] = no_names
+        elif not visited:
+            stack.append((node, True))
+            stack.extend((child, False) for child in node.children)
+        else:
+            node_names = set()
+            for child in node.children:
+                if child.children:
+                    node_names.update(names[id(child)])
+                elif child.value[1:-1] in vnames:
+                    node_names.add(child.value[1:-1])
+            names[id(node)] = frozenset(node_names) if node_names else no_names
+
+    # Dictionary to return
+    declarations = {vname : [] for vname in vnames}
+
+    # Descend only into branches whose leaves include more than one variable name
+    # Every other branch belongs whole to the declaration of each variable it names, or of every variable that its parent names
+    stack = [(vnames, iter(tree.children))]
+    while stack:
+        node_names, children = stack[-1]
+        child = next(children, None)
+        if child is None:
+            stack.pop()
+            continue
+        child_names = names[id(child)]
+        if len(child_names) > 1:
+            stack.append((child_names, iter(child.children)))
+        else:
+            for vname in (child_names or node_names):
+                declarations[vname].append(child)
+
+    return declarations
+        
+        
 def parse_variable(tree : TreeNode, obj : Variable):
     """
     Parse variable declarations from a tree representing a declaration for a single variable.
@@ -1,4 +1,5 @@
 from utilities.types.generic import Program, ProgramUnit
+from utilities.types.dependency_graph import DependencyGraph
 
 
 def resolve_dependencies(program : Program):
@@ -11,25 +12,35 @@ def resolve_dependencies(program : Program):
         program (Program): Object representation of a program
     """
     
-    
     # Iterate over each programunit
+    dependencies = []
+    for programunit in program.declared_programunits:
+        
+        # Add the dependencies of the programunit
+        dependencies.append(__get_dependencies(programunit))
     
+    # Set the dependency graph of the program
+    program.dependency_graph = DependencyGraph(program.declared_programunits, dependencies)
+
+
+def __get_dependencies(programunit : ProgramUnit) -> list[ProgramUnit]:
+    """
+    Get the program units that a program unit depends on for linking and execution
+
+    Args:
+        programunit (ProgramUnit): Object representation of a program unit
+
+    Returns:
+        list[ProgramUnit]: Referenced modules, referenced procedures, and the parent program unit of an internal procedure
+    """
     
-    # Depth first search dependencies
-    stack = []
-    stack.extend(program.declared_programunits)
-    while stack:
-        curr = stack.pop()
-        
-        # Iterate over each referenced module
-        for module in curr.referenced_modules:
-            pass
+    # Referenced modules and procedures
+    dependencies = []
+    dependencies.extend(programunit.referenced_modules)
+    dependencies.extend(programunit.referenced_procedures)
+
+    # Internal procedures can only be linked with their host
+    if isinstance(programunit.parent, ProgramUnit):
+        dependencies.append(programunit.parent)
         
-        # Iterate over each referenced procedure
-        for procedure in curr.referenced_procedures:
-            pass
-    
-    # Iterate over each programunit
-    for programunit in program.declared_programunits:
-        pass
-    
\ No newline at end of file
+    return dependencies
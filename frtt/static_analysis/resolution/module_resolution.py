@@ -1,18 +1,19 @@
 from utilities.types.generic import Program, ProgramUnit
 
-def resolve_modules(program : Program):
+def resolve_modules(program : Program, programunits : list[ProgramUnit] = None):
     """
     Resolve the module references
         
     Args:
         program (Program): Object representation of a program
+        programunits (list[ProgramUnit], optional): Program units whose references are resolved. Defaults to every program unit in program.
         
     Assumptions:
         1. Modules can only be declared at the global scope
     """
 
     # Iterate over each programunit
-    for programunit in program.declared_programunits:
+    for programunit in (program.declared_programunits if programunits is None else programunits):
             
         # Iterate over each module reference
         for module_reference in programunit.referenced_module_names:
@@ -0,0 +1,53 @@
+from utilities.types.generic import ProgramUnit
+
+
+def get_symbol_table(scope : ProgramUnit, map_name : str, tables : dict[ProgramUnit, dict]) -> dict:
+    """
+    Get the effective symbol table of a local scope, building it only once per scope
+    The table holds every declaration visible from the scope, in the order the local scope hierarchy is searched:
+    the scope itself and each directly or indirectly referenced module in breadth first order, then the parent scope.
+    Earlier declarations shadow later declarations with the same name.
+
+    Args:
+        scope (ProgramUnit): Local scope
+        map_name (str): Name of the attribute of each scope that maps names to declarations, such as "declared_variables_map"
+        tables (dict[ProgramUnit, dict]): Symbol tables that have already been built, which the new table is added to
+
+    Returns:
+        dict: Dictionary that maps each visible name to its declaration
+
+    Assumptions:
+        1. Modules can only be declared at the global scope
+    """
+
+    # Entire local scope hierarchy was searched
+    if scope is None: return dict()
+
+    # Return the symbol table if it was already built
+    table = tables.get(scope)
+    if table is not None: return table
+
+    # Get the symbol table of the next higher local scope
+    parent_table = get_symbol_table(scope.parent, map_name, tables)
+
+    # Breadth first search the current local scope and the local scope of each directly or indirectly referenced module
+    scopes = [scope]
+    visited = set(scopes)
+    for curr in scopes:
+        for module in curr.referenced_modules:
+            if module not in visited:
+                visited.add(module)
+                scopes.append(module)
+
+    # Share the symbol table of the parent scope if no scope adds declarations to it
+    if not any(getattr(curr, map_name) for curr in scopes):
+        table = parent_table
+
+    # Add declarations so that scopes found earlier in the search overwrite those found later
+    else:
+        table = dict(parent_table)
+        for curr in reversed(scopes):
+            table.update(getattr(curr, map_name))
+
+    tables[scope] = table
+    return table
@@ -1,25 +1,32 @@
-from queue import Queue
+from static_analysis.resolution.symbol_tables import get_symbol_table
 from utilities.types.generic import Program, ProgramUnit, Variable
 
-def resolve_variables(program : Program):
+def resolve_variables(program : Program, programunits : list[ProgramUnit] = None):
     """
     Resolve the variable references
         
     Args:
         program (Program): Object representation of a program
+        programunits (list[ProgramUnit], optional): Program units whose references are resolved. Defaults to every program unit in program.
         
     Assumptions:
         1. Implicit variables are not used 
     """
 
+    # Effective symbol table of each local scope, built once per program
+    tables = dict()
+
     # Iterate over each programunit
-    for programunit in program.declared_programunits:
+    for programunit in (program.declared_programunits if programunits is None else programunits):
+
+        # Get the declarations visible from the local scope hierarchy
+        table = get_symbol_table(programunit, "declared_variables_map", tables)
             
         # Iterate over each variable reference
         for variable_reference in programunit.referenced_names:
             
             # Search the local scope hierarchy for variable declaration
-            variable_declaration = __search_local(programunit, variable_reference)
+            variable_declaration = table.get(variable_reference)
             if variable_declaration is not None:
                 programunit.referenced_variables.append(variable_declaration)
                 continue
@@ -36,52 +43,6 @@ def resolve_variables(program : Program):
             #raise Exception(error_msg.format(variable_reference, programunit.type, programunit.name))
                 
                 
-def __search_local(curr : ProgramUnit, variable_reference : str, visited : set[ProgramUnit] = None) -> Variable:
-    """
-    Search the local scope hierarchy for a variable declaration
-    Backtracks the local scope hierarchy until end is reached or declaration is found
-    BFS to search each local scope, and the scopes of any directly or indirectly referenced modules
-
-    Args:
-        curr (ProgramUnit): Current local scope
-        variable_reference (str): Variable reference
-        visited (set[ProgramUnit], optional): ProgramUnits that have already been searched. Defaults to None.
-
-    Returns:
-        Variable: Variable declaration, or None if not found
-        
-    Assumptions:
-        1. Modules can only be declared at the global scope
-    """
-    
-    # Entire local scope hierarchy was searched
-    if curr is None: return None
-
-    # Initialize set of visited programunits
-    if visited is None: visited = set()
-    
-    # Breadth first search the current local scope and the local scope of each directly or indirectly referenced module
-    queue = Queue()
-    queue.put(curr)
-    while not queue.empty():
-        
-        # Get the next scope
-        scope = queue.get()
-        if scope in visited: continue
-        visited.add(scope)
-
-        # Return variable declaration if it is declared in scope
-        if variable_reference in scope.declared_variables_map:
-            return scope.declared_variables_map[variable_reference]
-        
-        # Add the modules referenced by scope to queue
-        for module in scope.referenced_modules:
-            queue.put(module)
-        
-    # Search the next higher local scope
-    return __search_local(curr.parent, variable_reference, visited)
-
-
 def __search_global(program : Program, variable_reference : str) -> Variable:
     """
     Search the global scope for a variable declaration
@@ -0,0 +1,298 @@
+from __future__ import annotations
+import gc
+import marshal
+import os
+import struct
+import tempfile
+from array import array
+from bisect import bisect_right
+from utilities.types.generic import Program, ProgramUnit, Variable
+from utilities.types.dependency_graph import DependencyGraph
+
+# Bytes at the start of every snapshot file
+SNAPSHOT_MAGIC = b"FRTTSNAP"
+
+# Version of the snapshot layout written by save_snapshot()
+SNAPSHOT_VERSION = 2
+
+# Layout of the fixed size prefix of a snapshot file: magic, version, size of the header in bytes
+PREFIX = struct.Struct("<8sIQ")
+
+# Attributes of a ProgramUnit that are only loaded from a snapshot when first accessed
+DETAIL_ATTRIBUTES = frozenset((
+    "referenced_modules", "referenced_procedures", "referenced_variables", "declared_procedures", "declared_variables",
+    "referenced_module_names", "referenced_procedure_names", "referenced_names", "declared_variables_map", "declared_procedures_map",
+))
+
+
+class SnapshotProgramUnit(ProgramUnit):
+    """
+    Class that represents a ProgramUnit loaded from a snapshot.
+    The name, type, source file, and parent are loaded with the program, and every other attribute is loaded on first access.
+    """
+
+    def __init__(self, snapshot : SnapshotReader, index : int):
+        self._snapshot = snapshot          # Snapshot that holds the details of the program unit
+        self._index = index                # Id of the program unit in the snapshot
+
+    def __getattr__(self, name : str):
+        if name not in DETAIL_ATTRIBUTES:
+            raise AttributeError(name)
+        self._snapshot.load_details(self._index)
+        return object.__getattribute__(self, name)
+
+
+class SnapshotReader:
+    """
+    Class that reads the program units of a snapshot file.
+    Program units are created for every id when the snapshot is opened, and their details are decoded from their blob on demand.
+    """
+
+    def __init__(self, data : bytes, base : int, header : tuple):
+        """
+        :data: Content of the snapshot file
+        :base: Offset of the first blob in data
+        :header: Decoded header of the snapshot file
+        """
+        strings, names, types, filepaths, parents, blob_offsets, variable_offsets, dependency_offsets, dependency_targets = header
+        self.data = memoryview(data)                                                # Content of the snapshot file
+        self.base = base                                                            # Offset of the first blob
+        self.strings : list[str] = strings                                          # String of each string id
+        self.blob_offsets = array('q', blob_offsets)                                # Start of the variable blob and details blob of each program unit, and the end of the last blob
+        self.variable_offsets = array('q', variable_offsets)                        # First variable id of each program unit, and the number of variables
+        self.variables : dict[int, list[Variable]] = dict()                         # Declared variables of each program unit that was loaded
+
+        # Create each program unit with the attributes that are needed to build the global name maps
+        self.programunits : list[SnapshotProgramUnit] = [SnapshotProgramUnit(self, i) for i in range(len(names))]
+        for punit, name, punit_type, filepath, parent in zip(self.programunits, names, types, filepaths, parents):
+            punit.name = strings[name] if name != -1 else None
+            punit.type = strings[punit_type] if punit_type != -1 else None
+            punit.filepath = strings[filepath] if filepath != -1 else None
+            punit.parent = self.programunits[parent] if parent != -1 else None
+
+        # Dependencies of each program unit, as compressed sparse rows of ids
+        self.dependencies = None
+        if dependency_offsets is not None:
+            self.dependencies = (array('q', dependency_offsets), array('q', dependency_targets))
+
+    def load_details(self, index : int):
+        """
+        Decode the attributes of a program unit that are not loaded with the program
+        :index: Id of the program unit
+        """
+        punit = self.programunits[index]
+        if "referenced_modules" in punit.__dict__: return
+        strings = self.strings
+        punits = self.programunits
+        module_names, procedure_names, names, children, modules, procedures, referenced_variables = self.__decode(2 * index + 1)
+
+        punit.referenced_module_names = {strings[i] for i in module_names}
+        punit.referenced_procedure_names = {strings[i] for i in procedure_names}
+        punit.referenced_names = {strings[i] for i in names}
+        punit.declared_variables = self.get_variables(index)
+        punit.declared_variables_map = {var.name : var for var in punit.declared_variables}
+        punit.declared_procedures = [punits[i] for i in children]
+        punit.declared_procedures_map = {child.name : child for child in punit.declared_procedures}
+        punit.referenced_modules = [punits[i] for i in modules]
+        punit.referenced_procedures = [punits[i] for i in procedures]
+        punit.referenced_variables = [self.get_variable(i) if i >= 0 else punits[-i - 1] for i in referenced_variables]
+
+    def get_variables(self, index : int) -> list[Variable]:
+        """
+        Get the variables declared by a program unit, creating them only once
+        Variables do not reference other objects, so they have their own blob that is decoded without the details of the program unit.
+        :index: Id of the program unit
+        """
+        variables = self.variables.get(index)
+        if variables is None:
+            variables = []
+            strings = self.strings
+            for name, var_type, kind, dimensions, attributes, assignment in self.__decode(2 * index):
+                var = Variable()
+                var.name = strings[name]
+                var.type = var_type
+                var.kind = kind
+                var.dimensions = dimensions
+                var.attributes = attributes
+                var.assignment = assignment
+                variables.append(var)
+            self.variables[index] = variables
+        return variables
+
+    def get_variable(self, variable_id : int) -> Variable:
+        """
+        Get a variable by its id, loading the details of the program unit that declares it
+        """
+        index = bisect_right(self.variable_offsets, variable_id) - 1
+        return self.get_variables(index)[variable_id - self.variable_offsets[index]]
+
+    def __decode(self, blob : int) -> tuple:
+        """
+        Decode a blob by its position in the file
+        """
+        return marshal.loads(self.data[self.base + self.blob_offsets[blob]:self.base + self.blob_offsets[blob + 1]])
+
+
+def save_snapshot(program : Program, filepath : str, metadata = None):
+    """
+    Save a program to a snapshot file.
+    References between objects are stored as integer ids, and strings are stored once in a string table.
+    The declared variables and the other details of each program unit are stored in separate blobs so that they can be loaded lazily.
+    :program: Object representation of a program
+    :filepath: Path to the snapshot file, which is replaced atomically
+    :metadata: Value that marshal can encode to store with the program, such as the state of its source files, or None
+    """
+    punits = program.declared_programunits
+    punit_ids = {punit : i for i, punit in enumerate(punits)}
+
+    # Give each declared variable an id, in order of the program unit that declares it
+    variable_ids = dict()
+    variable_offsets = [0]
+    for punit in punits:
+        for var in punit.declared_variables:
+            variable_ids[var] = len(variable_ids)
+        variable_offsets.append(len(variable_ids))
+
+    # Give each string an id, with None as -1
+    string_ids = {None : -1}
+    for punit in punits:
+        for strings in ((punit.name, punit.type, punit.filepath), punit.referenced_module_names, punit.referenced_procedure_names, punit.referenced_names):
+            for string in strings:
+                if string not in string_ids:
+                    string_ids[string] = len(string_ids) - 1
+        for var in punit.declared_variables:
+            if var.name not in string_ids:
+                string_ids[var.name] = len(string_ids) - 1
+    sid = string_ids.__getitem__
+
+    # Encode the declared variables and the other details of each program unit as two blobs
+    # Referenced variables that are not declared variables are stored as the negated id of the program unit
+    blobs = []
+    for punit in punits:
+        blobs.append(marshal.dumps([(sid(var.name), var.type, var.kind, var.dimensions, var.attributes, var.assignment) for var in punit.declared_variables]))
+        blobs.append(marshal.dumps((
+            list(map(sid, punit.referenced_module_names)),
+            list(map(sid, punit.referenced_procedure_names)),
+            list(map(sid, punit.referenced_names)),
+            [punit_ids[child] for child in punit.declared_procedures],
+            [punit_ids[module] for module in punit.referenced_modules],
+            [punit_ids[procedure] for procedure in punit.referenced_procedures],
+            [variable_ids[var] if var in variable_ids else -(punit_ids[var] + 1) for var in punit.referenced_variables],
+        )))
+    blob_offsets = array('q', [0])
+    for blob in blobs:
+        blob_offsets.append(blob_offsets[-1] + len(blob))
+
+    # Encode the dependency graph in the order of the program units
+    dependency_offsets = dependency_targets = None
+    if program.dependency_graph is not None:
+        dependency_offsets = array('q', [0])
+        dependency_targets = array('q')
+        for punit in punits:
+            dependency_targets.extend(punit_ids[dependency] for dependency in program.dependency_graph.dependencies(punit))
+            dependency_offsets.append(len(dependency_targets))
+        dependency_offsets, dependency_targets = dependency_offsets.tobytes(), dependency_targets.tobytes()
+
+    # Encode the attributes that are loaded with the program
+    names = [sid(punit.name) for punit in punits]
+    types = [sid(punit.type) for punit in punits]
+    filepaths = [sid(punit.filepath) for punit in punits]
+    parents = [punit_ids.get(punit.parent, -1) for punit in punits]
+    header = marshal.dumps((
+        list(string_ids)[1:],
+        names, types, filepaths, parents,
+        blob_offsets.tobytes(),
+        array('q', variable_offsets).tobytes(),
+        dependency_offsets, dependency_targets,
+        metadata,
+    ))
+
+    # Write to a temporary file so that an interrupted save never leaves a partial snapshot file
+    dirpath = os.path.dirname(os.path.abspath(filepath))
+    os.makedirs(dirpath, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=dirpath, suffix=".tmp")
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(PREFIX.pack(SNAPSHOT_MAGIC, SNAPSHOT_VERSION, len(header)))
+            f.write(header)
+            f.write(b"".join(blobs))
+        os.replace(tmp_path, filepath)
+    except BaseException:
+        os.remove(tmp_path)
+        raise
+
+
+def load_snapshot(filepath : str, lazy : bool = True) -> Program:
+    """
+    Load a program from a snapshot file
+    :filepath: Path to the snapshot file
+    :lazy: Only load the details of each program unit when they are first accessed
+    :rvalue: Object representation of the program
+    """
+    return read_snapshot(filepath, lazy)[0]
+
+
+def read_snapshot(filepath : str, lazy : bool = True) -> tuple[Program, object]:
+    """
+    Load a program and the metadata stored with it from a snapshot file
+    :filepath: Path to the snapshot file
+    :lazy: Only load the details of each program unit when they are first accessed
+    :rvalue: Object representation of the program, and the metadata that was passed to save_snapshot()
+    """
+    with open(filepath, 'rb') as f:
+        data = f.read()
+
+    # Check the magic and the version of the snapshot
+    if len(data) < PREFIX.size:
+        raise Exception("Snapshot file {} is truncated.".format(filepath))
+    magic, version, header_size = PREFIX.unpack_from(data)
+    if magic != SNAPSHOT_MAGIC:
+        raise Exception("File {} is not a snapshot file.".format(filepath))
+    if version != SNAPSHOT_VERSION:
+        raise Exception("Snapshot file {} has version {} but version {} is supported.".format(filepath, version, SNAPSHOT_VERSION))
+
+    # Pause the cyclic garbage collector, which would otherwise repeatedly scan every object created so far
+    gc_enabled = gc.isenabled()
+    gc.disable()
+    try:
+        return __load_program(data, header_size, lazy)
+    finally:
+        if gc_enabled:
+            gc.enable()
+
+
+def __load_program(data : bytes, header_size : int, lazy : bool) -> tuple[Program, object]:
+    """
+    Create a program from the content of a snapshot file whose prefix was checked
+    :rvalue: Program, and the metadata stored with it
+    """
+
+    # Create the program units of the snapshot
+    *header, metadata = marshal.loads(data[PREFIX.size:PREFIX.size + header_size])
+    snapshot = SnapshotReader(data, PREFIX.size + header_size, header)
+    program = Program()
+    program.declared_programunits = list(snapshot.programunits)
+
+    # Map the names of the program units at the global scope
+    for punit in program.declared_programunits:
+        if punit.parent is None:
+            if punit.type == "module":
+                program.declared_modules_map[punit.name] = punit
+            else:
+                program.declared_procedures_map[punit.name] = punit
+
+    # Create the dependency graph from the ids of the dependencies of each program unit
+    if snapshot.dependencies is not None:
+        offsets, targets = snapshot.dependencies
+        punits = program.declared_programunits
+        dependencies = [[punits[j] for j in targets[offsets[i]:offsets[i + 1]]] for i in range(len(punits))]
+        program.dependency_graph = DependencyGraph(punits, dependencies)
+
+    # Load the details of every program unit, after which the program units no longer need the snapshot
+    if not lazy:
+        for i in range(len(snapshot.programunits)):
+            snapshot.load_details(i)
+        for punit in snapshot.programunits:
+            del punit._snapshot, punit._index
+
+    return program, metadata
@@ -0,0 +1,213 @@
+from __future__ import annotations
+from array import array
+from typing import TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from utilities.types.generic import ProgramUnit
+
+
+class DependencyGraph:
+    """
+    Class that represents the dependencies between the ProgramUnits of a Program.
+    Each ProgramUnit is given an integer id, and the edges are stored as compressed sparse rows of ids.
+    Topological order and strongly connected components are computed on demand and cached, and transitive closures are searched
+    on demand in the graph of the components, so no closure is kept between queries.
+    """
+
+    def __init__(self, programunits : list[ProgramUnit], dependencies : list[list[ProgramUnit]]):
+        """
+        :programunits: List of the program units in the graph
+        :dependencies: List of the program units that each program unit depends on, in the same order as programunits
+        """
+        self.programunits : list[ProgramUnit] = list(programunits)                    # ProgramUnit of each id
+        self.ids : dict[ProgramUnit, int] = {punit : i for i, punit in enumerate(self.programunits)}    # Id of each ProgramUnit
+        self.offsets = array('l', [0])                                                # Start of the dependencies of each id in targets
+        self.targets = array('l')                                                     # Ids of the dependencies of each id
+        for punit_dependencies in dependencies:
+            self.targets.extend(dict.fromkeys(self.ids[dependency] for dependency in punit_dependencies))
+            self.offsets.append(len(self.targets))
+
+        # Cached results of queries
+        self.__reverse = None               # Compressed sparse rows (offsets, targets) of the dependents of each id
+        self.__components = None            # Strongly connected components, each a list of ids, with dependencies first
+        self.__component_ids = None         # Component of each id
+
+    def __len__(self):
+        return len(self.programunits)
+
+    def __contains__(self, punit : ProgramUnit) -> bool:
+        return punit in self.ids
+
+    def __getitem__(self, punit : ProgramUnit) -> list[ProgramUnit]:
+        return self.dependencies(punit)
+
+    def __iter__(self):
+        return iter(self.programunits)
+
+    def dependencies(self, punit : ProgramUnit) -> list[ProgramUnit]:
+        """
+        Get the program units that a program unit directly depends on
+        """
+        i = self.ids[punit]
+        return [self.programunits[j] for j in self.targets[self.offsets[i]:self.offsets[i + 1]]]
+
+    def dependents(self, punit : ProgramUnit) -> list[ProgramUnit]:
+        """
+        Get the program units that directly depend on a program unit
+        """
+        offsets, targets = self.__get_reverse()
+        i = self.ids[punit]
+        return [self.programunits[j] for j in targets[offsets[i]:offsets[i + 1]]]
+
+    def strongly_connected_components(self) -> list[list[ProgramUnit]]:
+        """
+        Get the strongly connected components of the graph, such as groups of mutually recursive procedures
+        Components are ordered so that each component comes after every component it depends on
+        """
+        return [[self.programunits[i] for i in component] for component in self.__get_components()]
+
+    def topological_order(self) -> list[ProgramUnit]:
+        """
+        Get the program units ordered so that each program unit comes after the program units it depends on
+        Program units in the same strongly connected component are adjacent, in an arbitrary order
+        """
+        return [self.programunits[i] for component in self.__get_components() for i in component]
+
+    def is_recursive(self, punit : ProgramUnit) -> bool:
+        """
+        True if a program unit directly or indirectly depends on itself
+        """
+        i = self.ids[punit]
+        return len(self.__get_components()[self.__component_ids[i]]) > 1 or i in self.targets[self.offsets[i]:self.offsets[i + 1]]
+
+    def transitive_closure(self, punit : ProgramUnit) -> list[ProgramUnit]:
+        """
+        Get the program units that a program unit directly or indirectly depends on, in order of id
+        The program unit itself is only included if it is recursive
+        """
+        components = self.__get_components()
+        component = self.__component_ids[self.ids[punit]]
+        ids = [i for c in self.__search(component) if c != component for i in components[c]]
+        if self.is_recursive(punit):
+            ids.extend(components[component])
+        return [self.programunits[i] for i in sorted(ids)]
+
+    def depends_on(self, punit1 : ProgramUnit, punit2 : ProgramUnit) -> bool:
+        """
+        True if punit1 directly or indirectly depends on punit2
+        """
+        self.__get_components()
+        component1, component2 = self.__component_ids[self.ids[punit1]], self.__component_ids[self.ids[punit2]]
+        if component1 == component2:
+            return self.is_recursive(punit1)
+        return component2 in self.__search(component1, component2)
+
+    def __get_reverse(self):
+        """
+        Build the compressed sparse rows of the dependents of each id
+        """
+        if self.__reverse is None:
+            n = len(self.programunits)
+            counts = [0] * (n + 1)
+            for j in self.targets:
+                counts[j + 1] += 1
+            for i in range(n):
+                counts[i + 1] += counts[i]
+            offsets = array('l', counts)
+            targets = array('l', bytes(offsets.itemsize * len(self.targets)))
+            for i in range(n):
+                for j in self.targets[self.offsets[i]:self.offsets[i + 1]]:
+                    targets[counts[j]] = i
+                    counts[j] += 1
+            self.__reverse = (offsets, targets)
+        return self.__reverse
+
+    def __get_components(self):
+        """
+        Find the strongly connected components with an iterative version of Tarjan's algorithm
+        Tarjan's algorithm finishes each component after every component reachable from it, so dependencies come first
+        """
+        if self.__components is not None:
+            return self.__components
+
+        n = len(self.programunits)
+        offsets, targets = self.offsets, self.targets
+        index = [-1] * n
+        low = [0] * n
+        on_stack = [False] * n
+        stack = []
+        component_ids = [-1] * n
+        components = []
+        counter = 0
+
+        # Depth first search from each id that has not been visited
+        for root in range(n):
+            if index[root] != -1: continue
+            index[root] = low[root] = counter
+            counter += 1
+            stack.append(root)
+            on_stack[root] = True
+            work = [(root, offsets[root])]
+            while work:
+                i, edge = work[-1]
+
+                # Visit the next dependency of i
+                if edge < offsets[i + 1]:
+                    work[-1] = (i, edge + 1)
+                    j = targets[edge]
+                    if index[j] == -1:
+                        index[j] = low[j] = counter
+                        counter += 1
+                        stack.append(j)
+                        on_stack[j] = True
+                        work.append((j, offsets[j]))
+                    elif on_stack[j]:
+                        low[i] = min(low[i], index[j])
+                    continue
+
+                # All dependencies of i were visited
+                work.pop()
+                if work:
+                    parent = work[-1][0]
+                    low[parent] = min(low[parent], low[i])
+                if low[i] == index[i]:
+                    component = []
+                    while True:
+                        j = stack.pop()
+                        on_stack[j] = False
+                        component_ids[j] = len(components)
+                        component.append(j)
+                        if j == i: break
+                    components.append(component)
+
+        self.__components = components
+        self.__component_ids = component_ids
+        return components
+
+    def __get_component_ids(self):
+        if self.__component_ids is None:
+            self.__get_components()
+        return self.__component_ids
+
+    def __search(self, component : int, target : int = None) -> set[int]:
+        """
+        Depth first search the components reachable from a component, which is itself included
+        Components come after every component they depend on, so components numbered below target are not searched
+        :target: Component to stop the search at once it is reached, or None to search every reachable component
+        :return: Components that were reached
+        """
+        components, component_ids = self.__components, self.__component_ids
+        lowest = target if target is not None else 0
+        visited = {component}
+        stack = [component]
+        while stack:
+            c = stack.pop()
+            for i in components[c]:
+                for j in self.targets[self.offsets[i]:self.offsets[i + 1]]:
+                    d = component_ids[j]
+                    if d in visited or d < lowest: continue
+                    visited.add(d)
+                    if d == target:
+                        return visited
+                    stack.append(d)
+        return visited
@@ -1,14 +1,16 @@
 from __future__ import annotations
 from abc import ABC, abstractmethod
 from typing import Callable, Union
-from math import pow
+import numpy as np
 
-from frtt.utilities.types.generic import Variable
+from utilities.types.generic import Variable
 
 Literal = Union[int, float, str]
 
 """
 Abstract expression
+eval() evaluates the expression for the current assignment of its mutable subexpressions,
+and eval_batch() evaluates it for many assignments at once, bound as NumPy arrays with one element per assignment
 """
 class Expr(ABC):
     
@@ -16,6 +18,10 @@ class Expr(ABC):
     def eval(self, assignment):
         pass
 
+    @abstractmethod
+    def eval_batch(self, bindings : dict[MutableExpr, np.ndarray]) -> np.ndarray:
+        pass
+
 """
 Expression that supports assignment to subexpressions
 """    
@@ -30,6 +36,33 @@ class Expression(Expr):
         
     def eval(self):
         return self.expr.eval()
+
+    def compile(self, variables : list[Variable] = None) -> Callable[..., Literal]:
+        """
+        Compile the expression into a single Python function, with one argument for the value of each variable
+        Subexpressions that do not depend on the variables are evaluated once, when the expression is compiled
+        :variables: Order of the arguments of the function. Defaults to the order of mutexprs
+        :return: Function that evaluates the expression for the values of its variables
+        """
+        if variables is None:
+            variables = list(self.mutexprs)
+        return compile_expression(self.expr, [self.mutexprs[var] for var in variables])
+
+    def eval_batch(self, bindings : dict[Variable, np.ndarray]) -> np.ndarray:
+        """
+        Evaluate the expression for many assignments of its variables at once
+        :bindings: Array of the values of each variable, whose first axis has one element per assignment
+        :return: Array of the value of the expression for each assignment
+        """
+        bindings = {self.mutexprs[var] : np.asarray(values) for var, values in bindings.items()}
+        res = np.asarray(eval_batch_expression(self.expr, bindings))
+
+        # Repeat the value of an expression that does not depend on the bound variables for each assignment
+        if bindings:
+            n = len(next(iter(bindings.values())))
+            if res.ndim == 0 or res.shape[0] != n:
+                res = np.broadcast_to(res, (n,) + res.shape)
+        return res
     
 """
 Expression that accesses an array literal
@@ -45,6 +78,9 @@ class ArrayAccess(Expr):
         for index in reversed(self.indices): res = res[index.eval()]
         return res
 
+    def eval_batch(self, bindings : dict[MutableExpr, np.ndarray]) -> np.ndarray:
+        return eval_batch_expression(self, bindings)
+
 """
 Mutable expression
 Supports assignment by external routines
@@ -60,6 +96,9 @@ class MutableExpr(Expr):
     def eval(self):
         return self.expr.eval()
 
+    def eval_batch(self, bindings : dict[MutableExpr, np.ndarray]) -> np.ndarray:
+        return eval_batch_expression(self, bindings)
+
 """
 Unary expression
 Implements a lambda function with one argument
@@ -71,6 +110,9 @@ class UnaryExpr(Expr):
         
     def eval(self):
         return self.f(self.op.eval())
+
+    def eval_batch(self, bindings : dict[MutableExpr, np.ndarray]) -> np.ndarray:
+        return eval_batch_expression(self, bindings)
     
 # Integer / Real operations
 unaryplus_op = lambda a : +a
@@ -98,14 +140,35 @@ class BinaryExpr(Expr):
         
     def eval(self):
         return self.f(self.op1.eval(), self.op2.eval())
-    
+
+    def eval_batch(self, bindings : dict[MutableExpr, np.ndarray]) -> np.ndarray:
+        return eval_batch_expression(self, bindings)
+
+
+def __divide(a, b):
+    """
+    Fortran division, which truncates toward zero if both operands are integers
+    """
+    if isinstance(a, int) and isinstance(b, int):
+        q = abs(a) // abs(b)
+        return q if (a < 0) == (b < 0) else -q
+    return a / b
+
+def __power(a, b):
+    """
+    Fortran exponentiation, which is an integer if both operands are integers
+    An integer to a negative integer power is 1 divided by the positive power, truncated toward zero
+    """
+    if isinstance(a, int) and isinstance(b, int) and b < 0:
+        return __divide(1, a ** -b)
+    return a ** b
 
 # Integer / Real operations
 add_op = lambda a, b : a + b
 subtract_op = lambda a, b : a - b
 multiply_op = lambda a, b : a * b
-divide_op = lambda a, b : a / b
-power_op = lambda a, b : pow(a, b)
+divide_op = lambda a, b : __divide(a, b)
+power_op = lambda a, b : __power(a, b)
 
 # String operations
 concat_op = lambda a, b : a + b
@@ -117,28 +180,28 @@ eqv_op = lambda a, b : a == b
 neqv_op = lambda a, b : a != b
 eq_op = lambda a, b : a == b
 ne_op = lambda a, b : a != b
-le_op = lambda a, b : a >= b
+le_op = lambda a, b : a <= b
 ge_op = lambda a, b : a >= b
 lt_op = lambda a, b : a < b
 gt_op = lambda a, b : a > b
 
 # Expressions
 Add = lambda op1, op2 : BinaryExpr(op1, op2, add_op)
-Subtract = lambda op1, op2 : BinaryExpr(op1, op2, add_op)
-Multiply = lambda op1, op2 : BinaryExpr(op1, op2, add_op)
-Divide = lambda op1, op2 : BinaryExpr(op1, op2, add_op)
-Power = lambda op1, op2 : BinaryExpr(op1, op2, add_op)
-Concat = lambda op1, op2 : BinaryExpr(op1, op2, add_op)
-AND = lambda op1, op2 : BinaryExpr(op1, op2, add_op)
-OR = lambda op1, op2 : BinaryExpr(op1, op2, add_op)
-EQV = lambda op1, op2 : BinaryExpr(op1, op2, add_op)
-NEQV = lambda op1, op2 : BinaryExpr(op1, op2, add_op)
-EQ = lambda op1, op2 : BinaryExpr(op1, op2, add_op)
-NE = lambda op1, op2 : BinaryExpr(op1, op2, add_op)
-LE = lambda op1, op2 : BinaryExpr(op1, op2, add_op)
-GE = lambda op1, op2 : BinaryExpr(op1, op2, add_op)
-LT = lambda op1, op2 : BinaryExpr(op1, op2, add_op)
-GT = lambda op1, op2 : BinaryExpr(op1, op2, add_op)
+Subtract = lambda op1, op2 : BinaryExpr(op1, op2, subtract_op)
+Multiply = lambda op1, op2 : BinaryExpr(op1, op2, multiply_op)
+Divide = lambda op1, op2 : BinaryExpr(op1, op2, divide_op)
+Power = lambda op1, op2 : BinaryExpr(op1, op2, power_op)
+Concat = lambda op1, op2 : BinaryExpr(op1, op2, concat_op)
+AND = lambda op1, op2 : BinaryExpr(op1, op2, and_op)
+OR = lambda op1, op2 : BinaryExpr(op1, op2, or_op)
+EQV = lambda op1, op2 : BinaryExpr(op1, op2, eqv_op)
+NEQV = lambda op1, op2 : BinaryExpr(op1, op2, neqv_op)
+EQ = lambda op1, op2 : BinaryExpr(op1, op2, eq_op)
+NE = lambda op1, op2 : BinaryExpr(op1, op2, ne_op)
+LE = lambda op1, op2 : BinaryExpr(op1, op2, le_op)
+GE = lambda op1, op2 : BinaryExpr(op1, op2, ge_op)
+LT = lambda op1, op2 : BinaryExpr(op1, op2, lt_op)
+GT = lambda op1, op2 : BinaryExpr(op1, op2, gt_op)
 
 """
 Literal expression
@@ -150,6 +213,9 @@ class LiteralConstant(Expr):
         
     def eval(self):
         return self.val   
+
+    def eval_batch(self, bindings : dict[MutableExpr, np.ndarray]) -> np.ndarray:
+        return np.asarray(self.val)
     
 # Expressions
 RealLiteralConstant = lambda val : LiteralConstant(val, float)
@@ -157,6 +223,261 @@ IntLiteralConstant = lambda val : LiteralConstant(val, int)
 CharLiteralConstant = lambda val : LiteralConstant(val, str)
 
 
+"""
+Expression compiler
+Generates the source of a function that evaluates an expression tree, with one argument per mutable subexpression
+Each operation is assigned to a local variable, so that deep trees do not exceed the nesting limit of the Python parser
+"""
+
+# Operations that are compiled to Python operators
+INFIX_OPS = {
+    add_op : "{} + {}",
+    subtract_op : "{} - {}",
+    multiply_op : "{} * {}",
+    concat_op : "{} + {}",
+    and_op : "{} and {}",
+    or_op : "{} or {}",
+    eqv_op : "{} == {}",
+    neqv_op : "{} != {}",
+    eq_op : "{} == {}",
+    ne_op : "{} != {}",
+    le_op : "{} <= {}",
+    ge_op : "{} >= {}",
+    lt_op : "{} < {}",
+    gt_op : "{} > {}",
+    unaryplus_op : "+{}",
+    negate_op : "-{}",
+    parentheses_op : "{}",
+    not_op : "not {}",
+}
+
+def compile_expression(expr : Expr, slots : list[MutableExpr]) -> Callable[..., Literal]:
+    """
+    Compile an expression tree into a Python function
+    Mutable subexpressions that are not slots are evaluated with their current assignment, so the function must be compiled again if they are reassigned
+    :expr: Expression tree to compile
+    :slots: Mutable subexpressions whose values are the arguments of the function, in order
+    :return: Function that evaluates the expression tree for the values of its slots
+    """
+    args = {id(slot) : "v{}".format(i) for i, slot in enumerate(slots)}
+    namespace = dict()
+    lines = []
+    res, _ = __compile_expr(expr, args, namespace, lines)
+    source = "def compiled_expression({}):\n{}    return {}\n".format(", ".join(args.values()), "".join("    {}\n".format(line) for line in lines), res)
+    exec(compile(source, "<expression>", "exec"), namespace)
+    f = namespace["compiled_expression"]
+    f.source = source
+    return f
+
+def __compile_expr(expr : Expr, args : dict[int, str], namespace : dict, lines : list[str]) -> tuple[str, bool]:
+    """
+    Add the lines that evaluate an expression tree to the body of the function, operands first
+    Subexpressions that appear more than once in the tree are evaluated once
+    :return: Python expression of the value of the expression tree, which is an argument, a constant, or a local variable,
+             and True if it is a constant
+    """
+    results = dict()
+    stack = [expr]
+    while stack:
+        curr = stack[-1]
+        if id(curr) in results:
+            stack.pop()
+            continue
+
+        # Slots are arguments
+        if id(curr) in args:
+            results[id(curr)] = (args[id(curr)], False)
+            stack.pop()
+            continue
+
+        # Compile the operands before the operation
+        operands = __get_operands(curr)
+        pending = [op for op in operands if id(op) not in results]
+        if pending:
+            stack.extend(reversed(pending))
+            continue
+        stack.pop()
+        results[id(curr)] = __compile_operation(curr, [results[id(op)] for op in operands], namespace, lines)
+
+    return results[id(expr)]
+
+def __get_operands(expr : Expr) -> list[Expr]:
+    """
+    Get the subexpressions that an expression evaluates, in order
+    """
+    if isinstance(expr, (MutableExpr, Expression)):
+        return [expr.expr]
+    if isinstance(expr, ArrayAccess):
+        return [expr.op] + list(reversed(expr.indices))
+    if isinstance(expr, UnaryExpr):
+        return [expr.op]
+    if isinstance(expr, BinaryExpr):
+        return [expr.op1, expr.op2]
+    return []
+
+def __compile_operation(expr : Expr, ops : list[tuple[str, bool]], namespace : dict, lines : list[str]) -> tuple[str, bool]:
+    """
+    Add the line that evaluates an expression from its compiled operands
+    Operations on constants are folded into constants, unless they raise an error that should be raised when the function is called
+    """
+
+    # Mutable subexpressions that are not slots are compiled with their current assignment
+    if isinstance(expr, (MutableExpr, Expression)):
+        return ops[0]
+    if isinstance(expr, LiteralConstant):
+        return __add_name(namespace, "c", expr.val), True
+
+    if isinstance(expr, ArrayAccess):
+        value = ops[0][0] + "".join("[{}]".format(op) for op, _ in ops[1:])
+    elif isinstance(expr, (UnaryExpr, BinaryExpr)):
+        if expr.f in INFIX_OPS:
+            value = INFIX_OPS[expr.f].format(*(op for op, _ in ops))
+        else:
+            value = "{}({})".format(__add_name(namespace, "f", expr.f), ", ".join(op for op, _ in ops))
+    else:
+        return "{}.eval()".format(__add_name(namespace, "e", expr)), False
+
+    # Fold operations on constants
+    if all(is_constant for _, is_constant in ops):
+        try:
+            return __add_name(namespace, "c", eval(value, namespace)), True
+        except Exception:
+            pass
+
+    lines.append("t{} = {}".format(len(lines), value))
+    return "t{}".format(len(lines) - 1), False
+
+def __add_name(namespace : dict, prefix : str, value) -> str:
+    """
+    Add a value to the namespace of the generated function
+    :return: Name of the value
+    """
+    name = "{}{}".format(prefix, len(namespace))
+    namespace[name] = value
+    return name
+
+
+"""
+Batch operations
+Element-wise equivalent of each operation over NumPy arrays, with the same Fortran semantics
+"""
+
+def __is_integer(*arrays) -> bool:
+    return np.issubdtype(np.result_type(*arrays), np.integer)
+
+def __batch_divide(a : np.ndarray, b : np.ndarray) -> np.ndarray:
+    """
+    Element-wise Fortran division, which truncates toward zero if both operands are integers
+    """
+    if not __is_integer(a, b):
+        return np.true_divide(a, b)
+    q = np.floor_divide(a, b)
+    return q + ((q < 0) & (q * b != a))
+
+def __batch_power(a : np.ndarray, b : np.ndarray) -> np.ndarray:
+    """
+    Element-wise Fortran exponentiation
+    NumPy rejects negative integer powers of integers, which are 1, -1, or 0 once truncated toward zero
+    """
+    if not __is_integer(a, b):
+        return np.power(a, b)
+    a, b = np.broadcast_arrays(a, b)
+    res = np.power(a, np.maximum(b, 0))
+    return np.where(b >= 0, res, np.where(a == 1, 1, np.where(a == -1, np.where(b % 2 == 0, 1, -1), 0)))
+
+BATCH_OPS = {
+    unaryplus_op : np.positive,
+    negate_op : np.negative,
+    parentheses_op : np.asarray,
+    not_op : np.logical_not,
+    add_op : np.add,
+    subtract_op : np.subtract,
+    multiply_op : np.multiply,
+    divide_op : __batch_divide,
+    power_op : __batch_power,
+    concat_op : np.char.add,
+    and_op : np.logical_and,
+    or_op : np.logical_or,
+    eqv_op : np.equal,
+    neqv_op : np.not_equal,
+    eq_op : np.equal,
+    ne_op : np.not_equal,
+    le_op : np.less_equal,
+    ge_op : np.greater_equal,
+    lt_op : np.less,
+    gt_op : np.greater,
+}
+
+def get_batch_op(f : Callable) -> Callable:
+    """
+    Get the element-wise equivalent of an operation
+    Operations without a NumPy equivalent are applied to each element in turn
+    """
+    batch_op = BATCH_OPS.get(f)
+    if batch_op is None:
+        batch_op = BATCH_OPS[f] = np.frompyfunc(f, f.__code__.co_argcount, 1)
+    return batch_op
+
+def eval_batch_expression(expr : Expr, bindings : dict[MutableExpr, np.ndarray]) -> np.ndarray:
+    """
+    Evaluate an expression tree for many assignments of its bound mutable subexpressions at once, operands first,
+    without recursion, so that deep trees do not exceed the recursion limit
+    Subexpressions that appear more than once in the tree are evaluated once
+    :bindings: Array of the values of each bound mutable subexpression, whose first axis has one element per assignment
+    :return: Array of the value of the expression tree, whose first axis has one element per assignment
+             if it depends on a bound mutable subexpression
+    """
+    results = dict()
+    stack = [expr]
+    while stack:
+        curr = stack[-1]
+        if id(curr) in results:
+            stack.pop()
+            continue
+
+        # Bound mutable subexpressions are the arrays of the assignments
+        if isinstance(curr, MutableExpr) and curr in bindings:
+            results[id(curr)] = (np.asarray(bindings[curr]), True)
+            stack.pop()
+            continue
+
+        # Evaluate the operands before the operation
+        operands = __get_operands(curr)
+        pending = [op for op in operands if id(op) not in results]
+        if pending:
+            stack.extend(reversed(pending))
+            continue
+        stack.pop()
+        results[id(curr)] = __eval_batch_operation(curr, [results[id(op)] for op in operands], bindings)
+
+    return results[id(expr)][0]
+
+def __eval_batch_operation(expr : Expr, ops : list[tuple[np.ndarray, bool]], bindings : dict[MutableExpr, np.ndarray]) -> tuple[np.ndarray, bool]:
+    """
+    Evaluate an expression for many assignments from its evaluated operands
+    :ops: Array of the value of each operand, and True if its first axis has one element per assignment
+    :return: Array of the value of the expression, and True if its first axis has one element per assignment
+    """
+    if isinstance(expr, (MutableExpr, Expression)):
+        return ops[0]
+    if isinstance(expr, LiteralConstant):
+        return np.asarray(expr.val), False
+
+    batched = any(is_batched for _, is_batched in ops)
+    if isinstance(expr, ArrayAccess):
+        # The array of each assignment is along the first axis, followed by the axes indexed in the same order as eval()
+        # An array that does not depend on the assignments is indexed by the index of each assignment instead
+        (res, is_batched), indices = ops[0], tuple(index for index, _ in ops[1:])
+        if is_batched:
+            return res[(np.arange(res.shape[0]),) + indices], True
+        return res[indices], batched
+    if isinstance(expr, (UnaryExpr, BinaryExpr)):
+        return np.asarray(get_batch_op(expr.f)(*(op for op, _ in ops))), batched
+
+    # Expressions without operands evaluate themselves, as in the expression compiler
+    return np.asarray(expr.eval_batch(bindings)), bool(bindings)
+
+
 
 
 """
@@ -1,4 +1,5 @@
 from typing import Union
+from utilities.types.dependency_graph import DependencyGraph
 
 class Program:
     """
@@ -6,7 +7,7 @@ class Program:
     """
     def __init__(self):
         self.declared_programunits : list[ProgramUnit] = list()              # List of programunits in the program
-        self.dependency_graph: dict[ProgramUnit, list[ProgramUnit]]          # Dictionary mapping each ProgramUnit to the ProgramUnits it depends on (references)
+        self.dependency_graph : DependencyGraph = None                         # Graph mapping each ProgramUnit to the ProgramUnits it depends on (references)
         # Dictionaries that map names to objects
         self.declared_modules_map : dict[str, ProgramUnit] = dict()          # Dictionary that maps the name of a module to its object
         self.declared_procedures_map : dict[str, ProgramUnit] = dict()       # Dictionary that maps the name of a procedure to its object
@@ -70,12 +71,12 @@ class Variable:
     """
     
     def __init__(self):
-        name : str = None
-        type : str = None
-        kind : int = None
-        dimensions : list[int] = []
-        attributes : list[str] = []
-        assignment : str = None
+        self.name : str = None
+        self.type : str = None
+        self.kind : int = None
+        self.dimensions : list[int] = []
+        self.attributes : list[str] = []
+        self.assignment : str = None
         
     def is_valid(self):
         """
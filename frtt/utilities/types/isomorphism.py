@@ -5,5 +5,5 @@ from utilities.types.generic import ProgramUnit, Variable
 class Isomorphism:
     
     def __init__(self):
-        programunit_map : Mapping[ProgramUnit, ProgramUnit] = Mapping()
-        variable_map : Mapping[Variable, Variable] = Mapping()
\ No newline at end of file
+        self.programunit_map : Mapping[ProgramUnit, ProgramUnit] = Mapping()      # Mapping from the program units of the first program to those of the second
+        self.variable_map : Mapping[Variable, Variable] = Mapping()               # Mapping from the variables of the first program to those of the second
\ No newline at end of file
@@ -1,8 +1,37 @@
+from array import array
+from bisect import bisect_left
+from collections import deque
+from heapq import merge
+from weakref import ref
+
+
 class TreeNode:
 
+    # Flang trees have millions of nodes, so nodes have no __dict__
+    __slots__ = ("value", "children", "tree_index", "position")
+
     def __init__(self, value):
         self.value = value
         self.children = []
+        self.tree_index = None          # Weak reference to the TreeIndex of the tree that contains this node, if one was built
+        self.position = None            # Pre-order position of this node in its TreeIndex
+
+    def build_index(self):
+        """
+        Build a TreeIndex for the tree with this node as its head
+        Queries on this node or any of its descendents become lookups in the index instead of traversals
+        Nodes only hold a weak reference to the index, so it is used for as long as the caller keeps the returned object
+        The index must be rebuilt if the tree is modified afterwards
+        :return: TreeIndex of the tree
+        """
+        return TreeIndex(self)
+
+    def get_index(self):
+        """
+        Get the TreeIndex of the tree that contains this node
+        :return: TreeIndex object, or None if no index was built or it is no longer in use
+        """
+        return self.tree_index() if self.tree_index is not None else None
 
     def walk(self, targets, exception_handling=False):
         """
@@ -16,17 +45,25 @@ class TreeNode:
         if not type(targets) == list:
             targets = [targets]
 
-        # List to return
-        nodes = []
+        # Look up the nodes in the index if there is one
+        index = self.get_index()
+        if index is not None:
+            nodes = index.walk(self, targets)
 
-        # Stack to hold next node to search
-        stack = [child for child in reversed(self.children)]
+        # Depth first search otherwise
+        else:
 
-        # Depth first search
-        while len(stack):
-            node = stack.pop()
-            stack.extend(child for child in reversed(node.children))
-            if node.value in targets: nodes.append(node)
+            # List to return
+            nodes = []
+
+            # Stack to hold next node to search
+            stack = [child for child in reversed(self.children)]
+
+            # Depth first search
+            while len(stack):
+                node = stack.pop()
+                stack.extend(child for child in reversed(node.children))
+                if node.value in targets: nodes.append(node)
 
         # Handle exception if enabled
         if exception_handling and len(nodes) == 0:
@@ -35,6 +72,48 @@ class TreeNode:
         return nodes
 
 
+    def walk_grouped(self, targets, exception_handling=False):
+        """
+        Traverse parse tree once and return all nodes with a value equal to one of the target values, grouped by value
+        :targets: Value to search for / List of values to search for
+        :exception_handling: Whether or not to raise exception if no nodes are found for one of the target values
+        :return: Dictionary mapping each target value to the list of nodes with that value
+        """
+
+        # Convert targets to list if not already
+        if not type(targets) == list:
+            targets = [targets]
+
+        # Look up the nodes for each target in the index if there is one
+        index = self.get_index()
+        if index is not None:
+            groups = {target : index.walk(self, [target]) for target in targets}
+
+        # Depth first search otherwise
+        else:
+
+            # Dictionary to return
+            groups = {target : [] for target in targets}
+
+            # Stack to hold next node to search
+            stack = [child for child in reversed(self.children)]
+
+            # Depth first search
+            while len(stack):
+                node = stack.pop()
+                stack.extend(child for child in reversed(node.children))
+                group = groups.get(node.value)
+                if group is not None: group.append(node)
+
+        # Handle exception if enabled
+        if exception_handling:
+            for target, nodes in groups.items():
+                if len(nodes) == 0:
+                    raise Exception("Node not found during walk_grouped(): target = {}".format(target))
+
+        return groups
+
+
     def step(self, targets, exception_handling=False):
         """
         Get the first descendent of parse tree with a value equal to one of the target values
@@ -47,14 +126,23 @@ class TreeNode:
         if not type(targets) == list:
             targets = [targets]
 
-        # Queue to hold next node to search
-        queue = [child for child in self.children]
+        # Look up the node in the index if there is one
+        index = self.get_index()
+        if index is not None:
+            node = index.step(self, targets)
+            if node is not None: return node
 
-        # Breadth first search
-        while len(queue):
-            node = queue.pop(0)
-            queue.extend(child for child in node.children)
-            if node.value in targets: return node
+        # Breadth first search otherwise
+        else:
+
+            # Queue to hold next node to search
+            queue = deque(self.children)
+
+            # Breadth first search
+            while len(queue):
+                node = queue.popleft()
+                queue.extend(node.children)
+                if node.value in targets: return node
 
         # Handle exception if enabled
         if exception_handling:
@@ -121,19 +209,27 @@ class TreeNode:
         :return: List of leaf nodes
         """
 
-        # List to return
-        nodes = []
+        # Look up the leaf nodes in the index if there is one
+        index = self.get_index()
+        if index is not None:
+            nodes = index.leaves(self)
 
-        # Stack to hold next node to search
-        stack = [child for child in reversed(self.children)]
+        # Depth first search otherwise
+        else:
 
-        # Depth first search
-        while len(stack):
-            node = stack.pop()
-            if node.children:
-                stack.extend(child for child in reversed(node.children))
-            else:
-                nodes.append(node)
+            # List to return
+            nodes = []
+
+            # Stack to hold next node to search
+            stack = [child for child in reversed(self.children)]
+
+            # Depth first search
+            while len(stack):
+                node = stack.pop()
+                if node.children:
+                    stack.extend(child for child in reversed(node.children))
+                else:
+                    nodes.append(node)
 
         # Handle exception if enabled
         if exception_handling and len(nodes) == 0:
@@ -150,13 +246,13 @@ class TreeNode:
         """
         
         # Queue to hold next node to search
-        queue = [child for child in self.children]
+        queue = deque(self.children)
 
         # Breadth first search
         while len(queue):
-            node = queue.pop(0)
+            node = queue.popleft()
             if node.children:
-                queue.extend(child for child in node.children)
+                queue.extend(node.children)
             else:
                 return node
 
@@ -199,4 +295,93 @@ class TreeNode:
             stack.extend([(depth + 1, child) for child in reversed(node.children)])
             out_str += ("| " * depth if depth else "") + str(node.value) + '\n'
 
-        return out_str
\ No newline at end of file
+        return out_str
+
+
+class TreeIndex:
+    """
+    Index of a tree from each node value to the pre-order positions of the nodes with that value.
+    The descendents of a node occupy a contiguous range of positions after it, so searching a subtree is a range lookup.
+    """
+
+    def __init__(self, head : TreeNode):
+        """
+        Build the index of a tree, and attach it to each of its nodes
+        :head: Head of the tree to index
+        """
+        self.nodes : list[TreeNode] = []            # Nodes in pre-order
+        self.ends = array('l')                      # Position after the last descendent of each node
+        self.depths = array('l')                    # Depth of each node
+        self.positions : dict[str, array] = dict()  # Positions of the nodes with each value
+        self.leaf_positions = array('l')            # Positions of the leaf nodes
+
+        # Weak reference to the index that is shared by each node
+        reference = ref(self)
+
+        # Depth first search, visiting each node before (depth >= 0) and after (depth < 0) its descendents
+        stack = [(head, 0)]
+        while stack:
+            node, depth = stack.pop()
+
+            # Record the position after the last descendent of node
+            if depth < 0:
+                self.ends[node.position] = len(self.nodes)
+                continue
+
+            # Record the position of node
+            position = len(self.nodes)
+            node.tree_index = reference
+            node.position = position
+            self.nodes.append(node)
+            self.ends.append(position + 1)
+            self.depths.append(depth)
+            if node.value not in self.positions:
+                self.positions[node.value] = array('l')
+            self.positions[node.value].append(position)
+
+            # Add descendents of node to stack
+            if node.children:
+                stack.append((node, -1))
+                stack.extend((child, depth + 1) for child in reversed(node.children))
+            else:
+                self.leaf_positions.append(position)
+
+    def range(self, node : TreeNode, positions : array) -> range:
+        """
+        Get the range of indices into sorted positions that are descendents of node
+        """
+        return range(bisect_left(positions, node.position + 1), bisect_left(positions, self.ends[node.position]))
+
+    def walk(self, node : TreeNode, targets : list) -> list[TreeNode]:
+        """
+        Get the descendents of node with a value equal to one of the target values, in pre-order
+        """
+        groups = []
+        for target in dict.fromkeys(targets):
+            positions = self.positions.get(target)
+            if positions is None: continue
+            groups.append([positions[i] for i in self.range(node, positions)])
+        if len(groups) > 1:
+            return [self.nodes[position] for position in merge(*groups)]
+        return [self.nodes[position] for group in groups for position in group]
+
+    def step(self, node : TreeNode, targets : list) -> TreeNode:
+        """
+        Get the descendent of node with least depth with a value equal to one of the target values
+        Ties are broken by pre-order position, which is the order of a breadth first search
+        """
+        best = None
+        for target in dict.fromkeys(targets):
+            positions = self.positions.get(target)
+            if positions is None: continue
+            for i in self.range(node, positions):
+                position = positions[i]
+                if best is None or (self.depths[position], position) < (self.depths[best], best):
+                    best = position
+        return self.nodes[best] if best is not None else None
+
+    def leaves(self, node : TreeNode) -> list[TreeNode]:
+        """
+        Get the leaf descendents of node, in pre-order
+        """
+        return [self.nodes[self.leaf_positions[i]] for i in self.range(node, self.leaf_positions)]
@@ -1,9 +1,24 @@
 from __future__ import annotations
+import marshal
 from utilities.types.tree_node import TreeNode
 
+# Version of the layout written by TreeTransitionParser.to_file()
+TTP_VERSION = 1
+
+# Number of bits of a label id in a packed key, which limits a parser to 2**16 distinct node labels
+LABEL_BITS = 16
+LABEL_MASK = (1 << LABEL_BITS) - 1
+
+
+def identity(x):
+    return x
+
+
 class TreeTransitionParser:
     """
     Class for implementing a tree parser by locally specifying state transitions and state functions for each node.
+    Node labels are interned as integer ids, and each (node, state) pair is packed into a single integer key of LABEL_BITS per label,
+    so that every step of a parse is one lookup in a flat table.
     """
 
     def __init__(self, data = None):
@@ -11,98 +26,176 @@ class TreeTransitionParser:
         data : Input passed to each state function
         """
         self.data = data if data else dict()
-        self.transitions = dict()       # curr_node -> curr_state -> next_node -> next_state
-        self.functions = dict()         # node -> state -> f where f: data -> data  
+        self.labels : list[str] = []                        # label id -> node label
+        self.label_ids : dict[str, int] = dict()            # node label -> label id
+        self.transitions : dict[int, int] = dict()          # key of (curr_node, curr_state, next_node) -> next_state
+        self.functions : dict[int, object] = dict()         # key of (node, state) -> f where f: data -> data
+
+    def intern(self, node : str) -> int:
+        """
+        Get the id of a node label, allocating one if the label is new
+        """
+        label_id = self.label_ids.get(node)
+        if label_id is None:
+            if len(self.labels) > LABEL_MASK:
+                raise Exception("Too many node labels for a tree transition parser: {}".format(len(self.labels) + 1))
+            label_id = self.label_ids[node] = len(self.labels)
+            self.labels.append(node)
+        return label_id
 
     def is_transition(self, node1, node2, state1):
         """
         True if (node1, state1) -> (node2, state2) is a valid state transition
         False o.w.
         """
-        return node1 in self.transitions and state1 in self.transitions[node1] and node2 in self.transitions[node1][state1]
+        if node1 not in self.label_ids or node2 not in self.label_ids:
+            return False
+        return self.__transition_key(self.label_ids[node1], state1, self.label_ids[node2]) in self.transitions
 
     def get_transition(self, node1, node2, state1):
         """
-        stateX if (node1, state1) -> (node2, stateX) is a valid state transition for some stateX 
+        stateX if (node1, state1) -> (node2, stateX) is a valid state transition for some stateX
         Error o.w.
         """
         if not self.is_transition(node1, node2, state1):
             raise Exception("Nonexistent state transition attempted: ({}, {}) -> ({}, ?)".format(node1, state1, node2))
-        return self.transitions[node1][state1][node2]
+        return self.transitions[self.__transition_key(self.label_ids[node1], state1, self.label_ids[node2])]
 
     def add_transition(self, node1 : str, node2 : str, state1 : int, state2 : int):
         """
         Add (node1, state1) -> (node2, state2) as a valid state transition
         """
-        if node1 not in self.transitions:
-            self.transitions[node1] = dict()
-        if state1 not in self.transitions[node1]:
-            self.transitions[node1][state1] = dict()
-        self.transitions[node1][state1][node2] = state2
-        
+        self.transitions[self.__transition_key(self.intern(node1), state1, self.intern(node2))] = state2
+
     def get_function(self, node : str, state : int):
         """
         f if (node, state) has state function f specified
         Identity function o.w.
         """
-        if node in self.functions and state in self.functions[node]:
-            return self.functions[node][state]
-        return (lambda x : x)                                           # Return identity function if none found                  
-        
+        if node in self.label_ids:
+            return self.functions.get(self.__function_key(self.label_ids[node], state), identity)
+        return identity
+
     def add_function(self, node : str, state : int, f):
         """
         Add f as the state function associated with (node, state)
         """
-        if node not in self.functions:
-            self.functions[node] = dict()
-        self.functions[node][state] = f
-        
+        self.functions[self.__function_key(self.intern(node), state)] = f
+
     def parse(self, node : TreeNode, state : int):
         """
         Execute function associated with (node, state) if it exists.
         Depth first transition to the applicable state of each child node.
+        The traversal uses an explicit stack, so the depth of the tree is not limited by the recursion limit.
         """
-        self.get_function(node.name(), state)(self.data)
-        for next_node in node.children:
-            next_state = self.get_transition(node.name(), next_node.name(), state)
-            self.parse(next_node, next_state)
-            
+        data = self.data
+        transitions = self.transitions
+        functions = self.functions
+
+        # Label id of each node value, so that the label of a value is only looked up once per parse
+        value_ids = dict()
+        def get_label_id(node):
+            label_id = value_ids[node.value] = self.label_ids.get(node.name, -1)
+            return label_id
+
+        # Execute the function of the head
+        label_id = get_label_id(node)
+        if label_id == -1:
+            if node.children:
+                raise Exception("Nonexistent state transition attempted: ({}, {}) -> ({}, ?)".format(node.name, state, node.children[0].name))
+            return
+        f = functions.get(state << LABEL_BITS | label_id)
+        if f is not None: f(data)
+
+        # Each entry holds a child and the key of its parent's label and state, so transitions are looked up in visiting order
+        base = (state << LABEL_BITS | label_id) << LABEL_BITS
+        stack = [(base, child) for child in reversed(node.children)]
+        while stack:
+            base, curr_node = stack.pop()
+            curr_id = value_ids.get(curr_node.value)
+            if curr_id is None:
+                curr_id = get_label_id(curr_node)
+            curr_state = transitions.get(base | curr_id) if curr_id != -1 else None
+            if curr_state is None:
+                raise Exception("Nonexistent state transition attempted: ({}, {}) -> ({}, ?)".format(self.labels[base >> LABEL_BITS & LABEL_MASK], base >> 2 * LABEL_BITS, curr_node.name))
+
+            # Execute the function of the child, then visit its children
+            key = curr_state << LABEL_BITS | curr_id
+            f = functions.get(key)
+            if f is not None: f(data)
+            if curr_node.children:
+                base = key << LABEL_BITS
+                stack.extend([(base, child) for child in reversed(curr_node.children)])
+
     def to_file(self, filepath : str):
-        pass
-            
+        """
+        Save the node labels and state transitions to a file
+        State functions are code, so they are not saved and must be added again after from_file()
+        :filepath: Path to the file
+        """
+        with open(filepath, 'wb') as f:
+            f.write(marshal.dumps((TTP_VERSION, self.labels, self.transitions)))
+
     @classmethod
-    def from_file(cls, filepath : str) -> TreeTransitionParser:
-        pass
-            
+    def from_file(cls, filepath : str, data = None) -> TreeTransitionParser:
+        """
+        Load the node labels and state transitions saved by to_file()
+        :filepath: Path to the file
+        :data: Input passed to each state function
+        """
+        with open(filepath, 'rb') as f:
+            version, labels, transitions = marshal.loads(f.read())
+        if version != TTP_VERSION:
+            raise Exception("Tree transition parser file {} has version {} but version {} is supported.".format(filepath, version, TTP_VERSION))
+
+        ttp = cls(data)
+        ttp.labels = labels
+        ttp.label_ids = {label : i for i, label in enumerate(labels)}
+        ttp.transitions = transitions
+        return ttp
+
     @classmethod
     def from_tree(cls, tree : TreeNode) -> TreeTransitionParser:
-        
+
         # Tree transition parser to create
         ttp = TreeTransitionParser()
-        
-        # Keep track of number of states allocated to each node
-        n_states = dict()
-        
+
+        transitions = ttp.transitions
+        label_ids = ttp.label_ids
+
+        # Keep track of number of states allocated to each node, by label id
+        n_states = []
+
         # DFS tree for node occurrences
-        stack = [(tree, 0)]
-        n_states[tree.name()] = 1
+        stack = [(tree, 0, ttp.intern(tree.name))]
+        n_states.append(1)
         while stack:
-            curr_node, curr_state = stack.pop()
-            curr_name = curr_node.name()
-            
+            curr_node, curr_state, curr_id = stack.pop()
+            base = (curr_state << LABEL_BITS | curr_id) << LABEL_BITS
+
             # Iterate over next nodes
             for next_node in curr_node.children:
-                next_name = next_node.name()
-                
+                next_name = next_node.name
+                next_id = label_ids.get(next_name)
+                if next_id is None: next_id = ttp.intern(next_name)
+
                 # Add new state for next node to uniquely identify path from head
-                if next_name not in n_states: n_states[next_name] = 0
-                next_state = n_states[next_name]
-                n_states[next_name] += 1
-                
+                if next_id == len(n_states): n_states.append(0)
+                next_state = n_states[next_id]
+                n_states[next_id] += 1
+
                 # Add state transition
-                ttp.add_transition(curr_name, next_name, curr_state, next_state)
-                
+                transitions[base | next_id] = next_state
+
                 # Add next node to stack
-                stack.append((next_node, next_state))
-                
-        return ttp
\ No newline at end of file
+                stack.append((next_node, next_state, next_id))
+
+        return ttp
+
+    @staticmethod
+    def __transition_key(label1 : int, state1 : int, label2 : int) -> int:
+        return (state1 << LABEL_BITS | label1) << LABEL_BITS | label2
+
+    @staticmethod
+    def __function_key(label : int, state : int) -> int:
+        return state << LABEL_BITS | label